@@ -1,20 +1,33 @@
 import os
 import base64
 import json
+import logging
 import re
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+import shutil
+import tempfile
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Query, Request
 from pydantic import BaseModel, Field
-from openai import OpenAI
 from dotenv import load_dotenv
 from chat.assistant import Assistant
-from typing import Optional, List, Any
-from rag.rag_manager import RAGManager
+from chat.response_cache import ResponseCache
+from chat.stream_parser import JsonArrayStreamParser
+from datetime import datetime
+from typing import Optional, List, Any, Literal
+from rag.ingest_jobs import IngestJobManager
+from config.config_manager import ConfigManager
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from config.database import get_db
-from models.chat_record import ChatRecord
-from langchain_core.documents import Document
+from starlette.concurrency import run_in_threadpool
+from chat.record_writer import ChatRecordWriter
+from chat.provider_clients import ProviderClientFactory
+from config.database import dispose_async_engine, get_async_db
+from crud import chat_record as chat_record_crud
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.metrics import HTTP_REQUEST_DURATION, REGISTRY, format_trace, start_trace
 
 
 # 从 .env 文件加载环境变量
@@ -35,6 +48,7 @@ class DescriptionResponse(BaseModel):
 class AssistantChatRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="可选，会话ID，复用则记忆上下文")
     messages: List[str] = Field(..., description="消息历史，最后一条为当前用户输入")
+    knowledge_bases: Optional[List[str]] = Field(None, description="可选，检索的知识库列表，默认为 default")
 
 class AssistantChatResponse(BaseModel):
     data: Any
@@ -42,29 +56,132 @@ class AssistantChatResponse(BaseModel):
 class DocumentUploadResponse(BaseModel):
     success: bool
     message: str
+    job_id: Optional[str] = Field(None, description="后台入库任务ID，可通过 /ingest-jobs/{job_id} 查询进度")
+
+class IngestJobResponse(BaseModel):
+    id: str
+    filename: str
+    doc_id: str
+    knowledge_base: str
+    status: str = Field(..., description="pending / running / succeeded / failed / cancelled")
+    documents_loaded: int
+    chunks_embedded: int
+    chunks_inserted: int
+    chunks_unchanged: int = Field(0, description="重新上传时内容未变、直接复用的分块数")
+    chunks_deleted: int = Field(0, description="重新上传时已不存在而被删除的分块数")
+    errors: List[str]
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
 
 class ChatRecordResponse(BaseModel):
     id: int
     session_id: Optional[str]
     messages: str
     created_at: str
+    is_judged: Optional[bool] = None
+    is_used: Optional[bool] = None
+
+class ChatRecordPageResponse(BaseModel):
+    items: List[ChatRecordResponse]
+    next_cursor: Optional[str] = Field(None, description="下一页的游标，为空表示已经是最后一页")
+
+
+# 进程启动时间和后台预热状态，供 /healthz 使用
+STARTED_AT = time.time()
+_warmup_state = {"status": "disabled", "seconds": None}
+
+
+def _warmup() -> None:
+    """在每个 worker 进程启动后创建向量库连接、回答缓存和模型客户端，避免第一个请求承担初始化耗时"""
+    from chat.model_manager import ModelManager
+    from rag.rag_manager import RAGManager
+
+    _warmup_state["status"] = "running"
+    started = time.perf_counter()
+    # 只预先创建通用助手使用的模型客户端，其他模型第一次使用时再创建
+    assistant_model = (ConfigManager().get_assistant_config("general") or {}).get("model", "DeepSeek-V3")
+    steps = [
+        ("RAGManager", RAGManager),
+        ("ResponseCache", ResponseCache),
+        (f"model {assistant_model}", lambda: ModelManager().get_model(assistant_model)),
+    ]
+    for name, factory in steps:
+        try:
+            factory()
+        except Exception as e:
+            # 预热失败不阻止启动，第一次使用时会再次尝试初始化
+            print(f"Error warming up {name}: {str(e)}")
+    _warmup_state["status"] = "done"
+    _warmup_state["seconds"] = round(time.perf_counter() - started, 3)
+    logging.info(f"Worker {os.getpid()} warmed up in {_warmup_state['seconds']:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ChatRecordWriter().start()
+    # 预热在后台进行，不阻塞启动，/healthz 立即可用
+    warmup_task = None
+    if (ConfigManager().get_app_config('deployment') or {}).get('warmup', True):
+        _warmup_state["status"] = "pending"
+        warmup_task = asyncio.create_task(run_in_threadpool(_warmup))
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # 写完队列中的聊天记录再退出
+    ChatRecordWriter().stop()
+    await dispose_async_engine()
+    # 关闭大模型供应商的 HTTP 连接池
+    await ProviderClientFactory().aclose()
+    # 停止接收新的入库任务，未开始的任务直接取消
+    IngestJobManager().shutdown()
 
 
 app = FastAPI(
     title="Kimi Vision API Wrapper",
     description="一个将Kimi视觉能力包装为HTTP接口的服务，供移动端调用。",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# 上传文件按块写入磁盘，避免一次性读入内存
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
-api_key = os.environ.get("MOONSHOT_API_KEY")
-if not api_key:
-    raise RuntimeError("MOONSHOT_API_KEY 环境变量未设置, 请在 .env 文件中添加。")
+# 超过该耗时的请求会打印各阶段耗时明细
+SLOW_REQUEST_SECONDS = (ConfigManager().get_app_config('metrics') or {}).get('slow_request_seconds', 5)
+
+
+_kimi_client = None
+
+
+def get_kimi_client():
+    """第一次调用 /describe-image 时才创建 Kimi 客户端，未配置密钥不影响其他接口"""
+    global _kimi_client
+    if _kimi_client is None:
+        api_key = os.environ.get("MOONSHOT_API_KEY")
+        if not api_key:
+            raise HTTPException(status_code=503, detail="MOONSHOT_API_KEY 环境变量未设置, 请在 .env 文件中添加。")
+        _kimi_client = ProviderClientFactory().create_async_openai(api_key, base_url="https://api.moonshot.cn/v1")
+    return _kimi_client
 
-client = OpenAI(
-    api_key=api_key,
-    base_url="https://api.moonshot.cn/v1",
-)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """记录请求耗时直方图，慢请求打印检索、模型、数据库等各阶段耗时"""
+    started = time.perf_counter()
+    status = 500
+    with start_trace() as spans:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            duration = time.perf_counter() - started
+            # 使用路由模板而不是实际路径，避免 job_id 等参数造成标签爆炸
+            route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(duration, method=request.method, route=route, status=status)
+            if duration >= SLOW_REQUEST_SECONDS:
+                logging.warning(f"Slow request {request.method} {route} took {duration:.2f}s: {format_trace(spans)}")
 
 
 app.add_middleware(
@@ -82,13 +199,14 @@ async def describe_image(query: ImageQuery):
     """
     接收一张图片的Base64编码和指令，返回Kimi对图片的描述。
     """
+    client = get_kimi_client()
     try:
         # 构造符合 Kimi API 要求的 image_url
         # 格式: "data:image/{格式};base64,{base64编码的字符串}"
         image_url = f"data:image/{query.image_format};base64,{query.image_base64}"
         
         # 调用 Kimi API
-        completion = client.chat.completions.create(
+        completion = await client.chat.completions.create(
             model="moonshot-v1-8k-vision-preview",
             messages=[
                 {"role": "system", "content": "你是 Kimi，一个擅长理解和描述图片的AI助手。"},
@@ -122,8 +240,39 @@ async def describe_image(query: ImageQuery):
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 
+def _record_chat(query: AssistantChatRequest) -> None:
+    """记录请求到数据库，只是放入写入队列，由后台线程批量写入，不阻塞聊天"""
+    try:
+        # 确保messages是字符串格式
+        messages_json = json.dumps(query.messages, ensure_ascii=False)
+        ChatRecordWriter().record(query.session_id, messages_json)
+    except Exception as e:
+        # 记录失败不应该影响聊天功能，所以继续执行
+        print(f"记录聊天请求失败: {e}")
+
+
+def _parse_assistant_response(response: str) -> Any:
+    """从助手回复中提取 ```json 代码块中的数据，解析失败时原样返回"""
+    try:
+        # 使用正则表达式提取json数组
+        match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
+        if match:
+            json_str = match.group(1)
+            return json.loads(json_str.strip())
+        # 没有匹配到json数组，尝试直接解析
+        return json.loads(response)
+    except Exception:
+        # 不是标准JSON，原样返回
+        return response
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """按 Server-Sent Events 格式编码一条事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @app.post("/chat-assistant", response_model=AssistantChatResponse)
-async def chat_assistant(query: AssistantChatRequest, db: Session = Depends(get_db)):
+async def chat_assistant(query: AssistantChatRequest):
     """
     使用 Assistant 聊天能力。
     assistant_type: 助手类型，如 'general'。
@@ -131,61 +280,67 @@ async def chat_assistant(query: AssistantChatRequest, db: Session = Depends(get_
     messages: 聊天消息历史。
     """
     try:        
-        # 记录请求到数据库
-        try:
-            
-            # 确保messages是字符串格式
-            messages_json = json.dumps(query.messages, ensure_ascii=False)
-            
-            chat_record = ChatRecord(
-                session_id=query.session_id,
-                messages=messages_json
-            )
-            
-            db.add(chat_record)            
-            db.commit()
-            
-        except Exception as db_error:
-            import traceback
-            # 数据库错误不应该影响聊天功能，所以继续执行
-            db.rollback()
-        
-
-        doc = Document(
-            page_content=query.messages[-1],
-            metadata={
-                "source": query.session_id,
-                "name": "chat_record",
-                "knowledge_base": "default"
-            }
-        )
-        
-
-        assistant = Assistant("general", query.session_id)
-        response = assistant.chat(query.messages)
+        _record_chat(query)
 
-        # rag_manager = RAGManager()
-        # rag_manager.vector_db.add_documents(documents=[doc], ids=[query.session_id])
-        # print(rag_manager.vector_db.similarity_search(query.messages[-1], k=1))
-        try:
-            # 使用正则表达式提取json数组
-            match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-                parsed = json.loads(json_str.strip())
-                return AssistantChatResponse(data=parsed)
-            else:
-                # 没有匹配到json数组，尝试直接解析
-                parsed = json.loads(response)
-                return AssistantChatResponse(data=parsed)
-        except Exception:
-            # 不是标准JSON，原样返回
-            return AssistantChatResponse(data=response)
+        # 构造时会初始化 RAGManager 等单例，预热未完成时需要等待单例锁，放到线程池避免阻塞事件循环
+        assistant = await run_in_threadpool(Assistant, "general", query.session_id)
+        if query.knowledge_bases:
+            assistant.set_selected_kb(query.knowledge_bases)
+        response = await assistant.achat(query.messages)
+        return AssistantChatResponse(data=_parse_assistant_response(response))
     except Exception as e:
         print(f"调用Assistant时发生错误: {e}")
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 
+@app.post("/chat-assistant/stream")
+async def chat_assistant_stream(query: AssistantChatRequest):
+    """
+    以 Server-Sent Events 流式返回 Assistant 的回复。
+    事件类型：
+    - token: 模型输出的文本片段 {"content": "..."}
+    - person: 从JSON数组中解析出的一个人员对象，解析完成立即推送
+    - done: 完整结果 {"data": ...}，与 /chat-assistant 的返回一致
+    - error: 出错信息 {"detail": "..."}
+    """
+    _record_chat(query)
+    assistant = await run_in_threadpool(Assistant, "general", query.session_id)
+    if query.knowledge_bases:
+        assistant.set_selected_kb(query.knowledge_bases)
+
+    async def event_generator():
+        parser = JsonArrayStreamParser()
+        response = ""
+        try:
+            async for chunk in assistant.achat_stream(query.messages):
+                if not chunk:
+                    continue
+                response += chunk
+                yield _sse_event("token", {"content": chunk})
+                for person in parser.feed(chunk):
+                    yield _sse_event("person", person)
+            yield _sse_event("done", {"data": _parse_assistant_response(response)})
+        except Exception as e:
+            print(f"调用Assistant时发生错误: {e}")
+            yield _sse_event("error", {"detail": f"服务器内部错误: {str(e)}"})
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭反向代理缓冲，保证事件实时送达
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.get("/chat-assistant/cache-stats")
+async def chat_assistant_cache_stats():
+    """语义回答缓存的命中率、节省的生成耗时等统计"""
+    return ResponseCache().stats()
+
+
 @app.post("/upload-document", response_model=DocumentUploadResponse)
 async def upload_document(
     file: UploadFile = File(..., description="支持的文件类型: .txt, .pdf, .docx, .md, .xlsx, .csv"),
@@ -196,25 +351,119 @@ async def upload_document(
     上传文档（Word、Excel、PDF、TXT、Markdown、CSV），并添加到RAG知识库。
     - 支持的文件类型: .txt, .pdf, .docx, .md, .xlsx, .csv
     - 参数: doc_id（文档ID，可选），knowledge_base（知识库名，可选）
+    - 文件保存后立即返回 job_id，入库在后台进行，通过 /ingest-jobs/{job_id} 查询进度
     """
-    rag_manager = RAGManager()
-    # 保存上传的文件到临时路径
+    temp_dir = None
     try:
         file_ext = os.path.splitext(file.filename)[1].lower()
         if file_ext not in [".txt", ".pdf", ".docx", ".md", ".xlsx", ".csv"]:
             return DocumentUploadResponse(success=False, message=f"不支持的文件类型: {file_ext}")
-        temp_path = f"/tmp/{file.filename}"
+        # 每个上传使用独立的临时目录，保留原文件名作为文档来源
+        upload_dir = (ConfigManager().get_rag_config().get('ingestion') or {}).get('upload_dir') or None
+        temp_dir = tempfile.mkdtemp(prefix="upload-", dir=upload_dir)
+        temp_path = os.path.join(temp_dir, os.path.basename(file.filename))
         with open(temp_path, "wb") as f:
-            f.write(await file.read())
-        rag_manager.add_document(temp_path, doc_id=doc_id, knowledge_base=knowledge_base)
-        os.remove(temp_path)
-        return DocumentUploadResponse(success=True, message="文档上传并添加成功")
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(f.write, chunk)
+        job = IngestJobManager().submit(
+            temp_path,
+            filename=file.filename,
+            doc_id=doc_id,
+            knowledge_base=knowledge_base,
+            cleanup_dir=temp_dir,
+        )
+        return DocumentUploadResponse(success=True, message="文档上传成功，正在后台添加到知识库", job_id=job.id)
     except Exception as e:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
         return DocumentUploadResponse(success=False, message=f"上传失败: {str(e)}")
 
 
-# 挂载静态文件到根路径
-app.mount("/", StaticFiles(directory="web/build", html=True), name="static")
+@app.get("/ingest-jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(job_id: str):
+    """查询后台入库任务的进度（已向量化、已写入的分块数以及错误信息）"""
+    # 其他 worker 的任务需要读取共享状态，放到线程池避免阻塞事件循环
+    job = await run_in_threadpool(IngestJobManager().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"入库任务不存在: {job_id}")
+    return IngestJobResponse(**job.to_dict())
+
+
+def _chat_record_response(record) -> ChatRecordResponse:
+    return ChatRecordResponse(
+        id=record.id,
+        session_id=record.session_id,
+        messages=record.messages,
+        created_at=record.created_at.isoformat() if record.created_at else "",
+        is_judged=record.is_judged,
+        is_used=record.is_used,
+    )
+
+
+@app.get("/chat-records", response_model=ChatRecordPageResponse)
+async def list_chat_records(
+    session_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    is_judged: Optional[bool] = None,
+    is_used: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    order: Literal["desc", "asc"] = "desc",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    分页查询聊天记录，可按会话ID、创建时间范围 [start, end)、是否已判断/已使用过滤。
+    使用游标分页：把上一页返回的 next_cursor 作为 cursor 传入获取下一页，翻页耗时与页数无关。
+    """
+    try:
+        records, next_cursor = await chat_record_crud.list_chat_records(
+            db,
+            session_id=session_id,
+            start=start,
+            end=end,
+            is_judged=is_judged,
+            is_used=is_used,
+            limit=limit,
+            cursor=cursor,
+            ascending=order == "asc",
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ChatRecordPageResponse(items=[_chat_record_response(record) for record in records], next_cursor=next_cursor)
+
+
+@app.get("/chat-records/{record_id}", response_model=ChatRecordResponse)
+async def get_chat_record(record_id: int, db: AsyncSession = Depends(get_async_db)):
+    """查询一条聊天记录"""
+    record = await chat_record_crud.get_chat_record(db, record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"聊天记录不存在: {record_id}")
+    return _chat_record_response(record)
+
+
+@app.get("/healthz")
+async def healthz():
+    """存活检查，不访问数据库、向量库和大模型"""
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - STARTED_AT, 3),
+        "warmup": _warmup_state,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 格式的指标：请求耗时、检索/验证/加载等阶段耗时、大模型首 token 耗时和 token 吞吐"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+# 挂载静态文件到根路径，前端未构建时只提供接口
+if os.path.isdir("web/build"):
+    app.mount("/", StaticFiles(directory="web/build", html=True), name="static")
+else:
+    logging.warning("web/build not found, serving the API without the frontend")
 
 if __name__ == "__main__":
     import uvicorn
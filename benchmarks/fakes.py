@@ -0,0 +1,139 @@
+"""
+离线基准测试使用的替身：不访问任何远程服务，行为确定、耗时可配置
+
+- FakeStreamingChatModel: 按设定的首字延迟和输出速率流式返回固定回答的 BaseChatModel
+- DeterministicFakeEmbeddings: 由文本哈希生成固定维度单位向量的 Embeddings，相同文本总是得到相同向量
+"""
+import asyncio
+import hashlib
+import json
+import time
+
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# 与通用助手的输出格式一致：```json 代码块中的人员数组
+DEFAULT_RESPONSE = "```json\n" + json.dumps(
+    [{"name": f"候选人{i}", "skills": ["Python", "Go"], "reason": "技能与需求匹配"} for i in range(3)],
+    ensure_ascii=False,
+) + "\n```"
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Chat model that streams a fixed response at a configurable rate.
+    Args:
+        response: Text returned for every request.
+        chunk_size: Characters per streamed chunk.
+        first_token_latency: Seconds before the first chunk.
+        tokens_per_second: Chunks per second after the first one, 0 streams without delay.
+    """
+
+    response: str = DEFAULT_RESPONSE
+    chunk_size: int = 4
+    first_token_latency: float = 0.0
+    tokens_per_second: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _chunks(self) -> List[str]:
+        return [self.response[i:i + self.chunk_size] for i in range(0, len(self.response), self.chunk_size)]
+
+    def _interval(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        content = "".join(chunk.message.content for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        content = ""
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            content += chunk.message.content
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        interval = self._interval()
+        for i, text in enumerate(self._chunks()):
+            if i and interval:
+                time.sleep(interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        interval = self._interval()
+        for i, text in enumerate(self._chunks()):
+            if i and interval:
+                await asyncio.sleep(interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+
+class DeterministicFakeEmbeddings(Embeddings):
+    """
+    Embeddings derived from a hash of the text, identical texts always map to the same unit vector.
+    Args:
+        dimension: Vector size.
+        latency: Seconds slept per embedding call, to mimic a remote endpoint.
+    """
+
+    def __init__(self, dimension: int = 256, latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._vector(text)
@@ -0,0 +1,164 @@
+"""
+文档加载器基准：内置流式加载器（utils.native_loaders）与原来的加载器（csv/xlsx/md 为 unstructured，txt 为 TextLoader）对比
+
+每次测量都在全新的子进程中进行，记录得到第一个文档的耗时（包含导入解析库）、总耗时、产出的文档数和进程峰值内存。
+未安装 unstructured 时对应的 baseline 结果标记为 unavailable。
+
+Usage:
+    python -m benchmarks.loaders --rows 20000 --sections 2000 --runs 3 --output loaders.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+from utils.document_loader import get_loader_for_file
+path, native = sys.argv[1], sys.argv[2] == "native"
+started = time.perf_counter()
+try:
+    loader = get_loader_for_file(path, native)
+    # 解析库在实例化或第一次 lazy_load 时才导入，计入第一个文档的耗时
+    iterator = loader.lazy_load()
+    first = next(iterator, None)
+except ImportError as e:
+    print(json.dumps({"error": f"unavailable: {e}"}))
+    sys.exit(0)
+first_seconds = time.perf_counter() - started
+count = 0 if first is None else 1 + sum(1 for _ in iterator)
+print(json.dumps({
+    "loader": type(loader).__name__,
+    "first_document_seconds": first_seconds,
+    "seconds": time.perf_counter() - started,
+    "documents": count,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+WORDS = ["Python", "Go", "React", "Java", "算法", "后端", "前端", "数据库", "分布式", "机器学习"]
+
+
+def _write_csv(path: str, rows: int, rng: random.Random) -> None:
+    import csv
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["姓名", "城市", "技能", "年限", "简介"])
+        for i in range(rows):
+            writer.writerow([f"候选人{i}", rng.choice(["北京", "上海", "深圳"]), " ".join(rng.sample(WORDS, 3)), rng.randint(1, 15), " ".join(rng.choices(WORDS, k=20))])
+
+
+def _write_xlsx(path: str, rows: int, rng: random.Random) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("候选人")
+    sheet.append(["姓名", "城市", "技能", "年限", "简介"])
+    for i in range(rows):
+        sheet.append([f"候选人{i}", rng.choice(["北京", "上海", "深圳"]), " ".join(rng.sample(WORDS, 3)), rng.randint(1, 15), " ".join(rng.choices(WORDS, k=20))])
+    workbook.save(path)
+
+
+def _write_markdown(path: str, sections: int, rng: random.Random) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(sections):
+            f.write(f"{'#' * (1 + i % 3)} 第{i}节\n\n")
+            for _ in range(3):
+                f.write(" ".join(rng.choices(WORDS, k=30)) + "\n\n")
+            if i % 10 == 0:
+                f.write("```python\n# 代码块中的井号不是标题\nprint('hello')\n```\n\n")
+
+
+def _write_text(path: str, paragraphs: int, rng: random.Random) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(paragraphs):
+            f.write(" ".join(rng.choices(WORDS, k=40)) + "\n\n")
+
+
+def measure(path: str, mode: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, path, mode],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _summary(samples: list) -> dict:
+    if any("error" in sample for sample in samples):
+        return {"error": next(sample["error"] for sample in samples if "error" in sample)}
+    return {
+        "loader": samples[0]["loader"],
+        "documents": samples[0]["documents"],
+        "seconds": round(statistics.median(sample["seconds"] for sample in samples), 3),
+        "first_document_seconds": round(statistics.median(sample["first_document_seconds"] for sample in samples), 3),
+        "max_rss_mb": round(max(sample["max_rss_mb"] for sample in samples), 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比内置流式加载器和原来的加载器的耗时与内存")
+    parser.add_argument("--rows", type=int, default=20000, help="csv / xlsx 的数据行数")
+    parser.add_argument("--sections", type=int, default=2000, help="markdown 的章节数")
+    parser.add_argument("--paragraphs", type=int, default=5000, help="txt 的段落数")
+    parser.add_argument("--runs", type=int, default=3, help="每项测量的次数")
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx", "md", "txt"], default=["csv", "xlsx", "md", "txt"])
+    parser.add_argument("--skip-baseline", action="store_true", help="只测量内置加载器")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="结果 JSON 文件路径，默认只打印")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="loader-bench-")
+    writers = {
+        "csv": lambda path: _write_csv(path, args.rows, rng),
+        "xlsx": lambda path: _write_xlsx(path, args.rows, rng),
+        "md": lambda path: _write_markdown(path, args.sections, rng),
+        "txt": lambda path: _write_text(path, args.paragraphs, rng),
+    }
+    modes = ["native"] if args.skip_baseline else ["native", "baseline"]
+    results = {}
+    try:
+        for name in args.formats:
+            path = os.path.join(workdir, f"sample.{name}")
+            writers[name](path)
+            results[name] = {"file_mb": round(os.path.getsize(path) / 1024 / 1024, 2)}
+            for mode in modes:
+                results[name][mode] = _summary([measure(path, mode) for _ in range(args.runs)])
+            native, baseline = results[name].get("native", {}), results[name].get("baseline", {})
+            if "seconds" in native and "seconds" in baseline and native["seconds"] > 0:
+                results[name]["speedup"] = round(baseline["seconds"] / native["seconds"], 1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""
+离线基准测试：用本地替身代替大模型、embedding 接口和 Milvus，不需要任何密钥和网络
+
+场景：
+- ingestion: 合成文本文件入库的吞吐（分块/秒）
+- search: base_search / abase_search 的延迟分位数
+- chat: N 个并发客户端请求 /chat-assistant（以及 /chat-assistant/stream）的端到端延迟和吞吐
+- memory: 每个会话增加的内存（tracemalloc）
+
+数据库使用临时目录中的 SQLite，向量库使用临时目录中的 LocalVectorStore，
+embedding 缓存和关键词索引也写到临时目录，不会改动仓库中的缓存文件。
+
+Usage:
+    python -m benchmarks.offline --output benchmark.json
+    python -m benchmarks.offline --scenarios chat --concurrency 32 --requests 500 --first-token-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from benchmarks.fakes import DeterministicFakeEmbeddings, FakeStreamingChatModel
+
+SCENARIOS = ["ingestion", "search", "chat", "memory"]
+
+# 合成文档使用的词表，混合中英文以覆盖分词和关键词检索
+WORDS = [
+    "Python", "Go", "React", "Kubernetes", "数据库", "前端", "后端", "算法", "机器学习", "分布式",
+    "微服务", "缓存", "性能", "架构", "测试", "运维", "安全", "产品", "设计", "团队",
+]
+
+# 模型限流配置只对真实接口有意义，默认在基准中去掉以测量服务本身的开销
+MODEL_LIMIT_KEYS = ("max_concurrency", "requests_per_second", "first_token_timeout")
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pick(0.50) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "p99_ms": round(pick(0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))) + "。"
+
+
+class OfflineBench:
+    """
+    Wires the application to the offline stand-ins and runs the benchmark scenarios.
+    Must be constructed before anything imports the database engine or creates the singletons.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="offline-bench-")
+        self.rng = random.Random(args.seed)
+        # 数据库引擎在导入时按环境变量创建，必须在导入应用模块之前设置
+        os.environ["MYSQL_URL"] = f"sqlite:///{os.path.join(self.workdir, 'bench.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+
+        from config.config_manager import ConfigManager
+        from config.database import Base, engine
+        import init_db  # noqa: F401  注册所有表
+
+        Base.metadata.create_all(bind=engine)
+        self._configure(ConfigManager())
+
+        from chat.model_manager import ModelManager
+        from rag.local_vector_store import LocalVectorStore
+        from rag.rag_manager import RAGManager
+
+        self.embedding = DeterministicFakeEmbeddings(dimension=args.dimension, latency=args.embedding_latency)
+        self.rag = RAGManager(
+            embedding=self.embedding,
+            vector_db=LocalVectorStore(embedding_function=self.embedding, path=os.path.join(self.workdir, "vector_store")),
+        )
+        self.model = FakeStreamingChatModel(
+            chunk_size=args.chunk_chars,
+            first_token_latency=args.first_token_latency,
+            tokens_per_second=args.tokens_per_second,
+        )
+        config_manager = ConfigManager()
+        self.model_manager = ModelManager(models={name: self.model for name in config_manager.model_config})
+
+    def _configure(self, config_manager) -> None:
+        """Point every on-disk cache to the work directory and turn off remote-only features"""
+        rag_config = config_manager.rag_config
+        rag_config['self_rag'] = False
+        cache_config = rag_config['embeddings'].setdefault('cache', {})
+        cache_config['disk_path'] = os.path.join(self.workdir, "embeddings.sqlite")
+        cache_config['enabled'] = not self.args.no_embedding_cache
+        rag_config.setdefault('hybrid_search', {})['index_path'] = os.path.join(self.workdir, "keyword_index.sqlite")
+        rag_config.setdefault('manifest', {})['path'] = os.path.join(self.workdir, "document_manifest.sqlite")
+
+        app_config = config_manager.app_config
+        app_config.setdefault('deployment', {})['warmup'] = False
+        app_config.setdefault('response_cache', {})['enabled'] = self.args.response_cache
+        app_config.setdefault('memory', {})['backend'] = "memory"
+        app_config.setdefault('shared_state', {})['backend'] = "memory"
+
+        if not self.args.keep_model_limits:
+            for model_config in config_manager.model_config.values():
+                if isinstance(model_config, dict):
+                    for key in MODEL_LIMIT_KEYS:
+                        model_config.pop(key, None)
+
+    def close(self) -> None:
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _write_documents(self) -> List[str]:
+        doc_dir = os.path.join(self.workdir, "documents")
+        os.makedirs(doc_dir, exist_ok=True)
+        paths = []
+        for i in range(self.args.documents):
+            path = os.path.join(doc_dir, f"doc_{i}.txt")
+            paragraphs = ["".join(_sentence(self.rng) for _ in range(5)) for _ in range(self.args.paragraphs)]
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(paragraphs))
+            paths.append(path)
+        return paths
+
+    def run_ingestion(self) -> Dict[str, Any]:
+        paths = self._write_documents()
+        chunks = 0
+        errors = 0
+        started = time.perf_counter()
+        for i, path in enumerate(paths):
+            stats = self.rag.ingest_document(path, f"doc_{i}", knowledge_base="default")
+            chunks += stats.chunks_inserted
+            errors += len(stats.errors)
+        elapsed = time.perf_counter() - started
+        return {
+            "documents": len(paths),
+            "chunks": chunks,
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "documents_per_second": round(len(paths) / elapsed, 2),
+            "chunks_per_second": round(chunks / elapsed, 2),
+        }
+
+    def _queries(self, count: int) -> List[str]:
+        return [" ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(1, 4))) for _ in range(count)]
+
+    def run_search(self) -> Dict[str, Any]:
+        queries = self._queries(self.args.queries)
+        sync_latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            self.rag.base_search(query, k=6)
+            sync_latencies.append(time.perf_counter() - started)
+
+        async def run_async() -> List[float]:
+            latencies = []
+            for query in queries:
+                started = time.perf_counter()
+                await self.rag.abase_search(query, k=6)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        return {
+            "chunks_indexed": self.rag.get_chunk_count(),
+            "sync": _percentiles(sync_latencies),
+            "async": _percentiles(asyncio.run(run_async())),
+        }
+
+    async def _request(self, client, path: str) -> tuple:
+        """One request of a new session, returns (ok, seconds)"""
+        payload = {"session_id": str(uuid.uuid4()), "messages": self._queries(1)}
+        started = time.perf_counter()
+        response = await client.post(path, json=payload)
+        # 流式接口出错时状态码仍是 200，错误以 error 事件返回
+        ok = response.status_code == 200 and "event: error" not in response.text
+        return ok, time.perf_counter() - started
+
+    async def _run_clients(self, client, path: str) -> Dict[str, Any]:
+        """`requests` requests sent by `concurrency` clients in a closed loop"""
+        latencies: List[float] = []
+        failures = 0
+        remaining = self.args.requests
+
+        async def worker() -> None:
+            nonlocal failures, remaining
+            while remaining > 0:
+                remaining -= 1
+                try:
+                    ok, elapsed = await self._request(client, path)
+                except Exception:
+                    ok, elapsed = False, None
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - started
+        return {
+            "requests": self.args.requests,
+            "concurrency": self.args.concurrency,
+            "failures": failures,
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(self.args.requests / elapsed, 2),
+            "latency": _percentiles(latencies),
+        }
+
+    def run_chat(self) -> Dict[str, Any]:
+        import httpx
+        import api
+
+        async def run() -> Dict[str, Any]:
+            # 在进程内通过 ASGI 调用应用，包含中间件、请求解析和生命周期，不经过网络；
+            # ASGITransport 会读完整个响应再返回，流式接口只测量总耗时
+            async with api.app.router.lifespan_context(api.app):
+                transport = httpx.ASGITransport(app=api.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                    result = {"chat_assistant": await self._run_clients(client, "/chat-assistant")}
+                    if not self.args.skip_stream:
+                        result["chat_assistant_stream"] = await self._run_clients(client, "/chat-assistant/stream")
+                    return result
+
+        return asyncio.run(run())
+
+    def run_memory(self) -> Dict[str, Any]:
+        """Heap growth per session, each session holds `turns` exchanges in the session store"""
+        from chat.assistant import Assistant
+
+        async def run(sessions: int) -> None:
+            for _ in range(sessions):
+                session_id = str(uuid.uuid4())
+                for query in self._queries(self.args.turns):
+                    await Assistant("general", session_id).achat([query])
+
+        # 先运行一轮，排除模型、索引和缓存的首次初始化
+        asyncio.run(run(1))
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        asyncio.run(run(self.args.sessions))
+        after, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "sessions": self.args.sessions,
+            "turns_per_session": self.args.turns,
+            "bytes_per_session": round((after - before) / self.args.sessions),
+            "peak_bytes": peak,
+        }
+
+    def run(self, scenarios: List[str]) -> Dict[str, Any]:
+        results = {}
+        # 检索和聊天都依赖已入库的数据，未选择 ingestion 时也要先入库
+        ingestion = self.run_ingestion()
+        if "ingestion" in scenarios:
+            results["ingestion"] = ingestion
+        for name in scenarios:
+            if name != "ingestion":
+                results[name] = getattr(self, f"run_{name}")()
+        return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="使用本地替身离线测量入库、检索、聊天接口和会话内存")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="要运行的场景")
+    parser.add_argument("--output", default=None, help="结果 JSON 文件路径，默认只打印")
+    parser.add_argument("--seed", type=int, default=42, help="合成数据的随机种子")
+    parser.add_argument("--documents", type=int, default=20, help="入库的合成文档数")
+    parser.add_argument("--paragraphs", type=int, default=20, help="每个文档的段落数")
+    parser.add_argument("--dimension", type=int, default=256, help="假 embedding 的向量维度")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="每次 embedding 调用的模拟耗时（秒）")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="关闭 embedding 缓存")
+    parser.add_argument("--queries", type=int, default=200, help="检索场景的查询数")
+    parser.add_argument("--requests", type=int, default=200, help="聊天场景的请求总数")
+    parser.add_argument("--concurrency", type=int, default=16, help="聊天场景的并发客户端数")
+    parser.add_argument("--skip-stream", action="store_true", help="不测量 /chat-assistant/stream")
+    parser.add_argument("--response-cache", action="store_true", help="开启语义回答缓存（默认关闭，测量完整链路）")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="假模型的首字延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="假模型每秒输出的片段数，0 表示不限速")
+    parser.add_argument("--chunk-chars", type=int, default=4, help="假模型每个片段的字符数")
+    parser.add_argument("--keep-model-limits", action="store_true", help="保留 model.yaml 中的并发、速率和首字超时限制")
+    parser.add_argument("--sessions", type=int, default=200, help="内存场景的会话数")
+    parser.add_argument("--turns", type=int, default=3, help="内存场景每个会话的对话轮数")
+    args = parser.parse_args()
+
+    bench = OfflineBench(args)
+    try:
+        results = bench.run(args.scenarios)
+    finally:
+        bench.close()
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+启动耗时基准：在全新的子进程中测量
+
+- import api 的耗时，以及导入后是否已经加载了不该在启动时加载的重量级依赖
+- 启动 uvicorn 到 /healthz 第一次返回 200 的耗时（冷启动）
+
+Usage:
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --max-import-seconds 2   # 超过阈值时退出码为 1，可用于 CI
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 这些模块应当在第一次用到时才导入
+HEAVY_MODULES = [
+    "pymilvus",
+    "pandas",
+    "dashscope",
+    "unstructured",
+    "paddleocr",
+    "openai",
+    "langchain_openai",
+    "langchain_deepseek",
+    "langchain_ollama",
+    "langchain_community.chat_models",
+    "langchain_community.document_loaders",
+    "langchain_community.embeddings",
+    "langchain_community.vectorstores",
+]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import api
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # 导入过程中可能有其他输出，结果在最后一行
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_ready(timeout: float) -> float:
+    """Seconds from spawning uvicorn until /healthz answers"""
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError(f"/healthz not ready after {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _summary(values: list) -> dict:
+    return {
+        "median": round(statistics.median(values), 3),
+        "min": round(min(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量 api.py 的导入耗时和冷启动到 /healthz 可用的耗时")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的次数")
+    parser.add_argument("--skip-server", action="store_true", help="只测量导入耗时，不启动 uvicorn")
+    parser.add_argument("--ready-timeout", type=float, default=60, help="等待 /healthz 的最长秒数")
+    parser.add_argument("--max-import-seconds", type=float, default=None, help="导入耗时中位数超过该值时返回非零退出码")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "import_seconds": _summary([item["seconds"] for item in imports]),
+        "heavy_modules_loaded": sorted({module for item in imports for module in item["loaded"]}),
+    }
+    if not args.skip_server:
+        report["ready_seconds"] = _summary([measure_ready(args.ready_timeout) for _ in range(args.runs)])
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.max_import_seconds is not None and report["import_seconds"]["median"] > args.max_import_seconds:
+        print(f"import api took {report['import_seconds']['median']}s, limit is {args.max_import_seconds}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,11 @@
+import time
 import uuid
 
 from typing import Optional
 
 from config.config_manager import ConfigManager
 from chat.model_manager import ModelManager
+from chat.response_cache import ResponseCache
 from rag import rag_manager
 from rag.rag_manager import RAGManager
 
@@ -12,6 +14,7 @@ class Assistant:
         self.session_id = session_id or str(uuid.uuid4())
         self.model_manager = ModelManager()
         self.rag_manager = RAGManager()
+        self.response_cache = ResponseCache()
         self._load_assistant_config(assistant_type)
 
     def _load_assistant_config(self, assistant_type: str) -> None:
@@ -23,19 +26,85 @@ class Assistant:
         self.kb_list = ["default"]
         self.prompt_template = assistant_config.get("prompt_template", "You are a helpful assistant.")
         self.model = assistant_config.get("model", "DeepSeek-V3")
+        # 主模型失败、超时或限流时依次尝试的模型，hedge 开启时主模型变慢会提前向下一个模型发出备份请求
+        self.fallback_models = assistant_config.get("fallback_models") or []
+        self.hedge = assistant_config.get("hedge", False)
+
+    def _cache_scope(self) -> tuple:
+        """Everything besides the query and the retrieved chunks that a cached answer depends on"""
+        return (self.type, self.model, self.prompt_template, tuple(self.kb_list))
+
+    def _is_cacheable(self, messages: list[str]) -> bool:
+        # 只缓存新会话的单条提问，有历史的对话回答依赖上下文
+        return (
+            self.response_cache.enabled
+            and len(messages) == 1
+            and not self.model_manager.session_store.has_session(self.session_id)
+        )
+
+    async def _ais_cacheable(self, messages: list[str]) -> bool:
+        """Async version of `_is_cacheable`"""
+        return (
+            self.response_cache.enabled
+            and len(messages) == 1
+            and not await self.model_manager.session_store.ahas_session(self.session_id)
+        )
 
     def chat(self, messages: list[str]) -> str:
+        query = messages[-1]
+        chunk_ids = []
         if len(self.kb_list):
             # 使用 RAG 模式，将搜索结果注入
-            knowledge = self.rag_manager.get_relevant_context(messages[-1], knowledge_bases=self.kb_list)
+            knowledge, chunk_ids = self.rag_manager.retrieve_context(query, knowledge_bases=self.kb_list)
             messages[-1] = f"{messages[-1]}\n\n参考以下信息回答用户问题：\n{knowledge}"
-        
-        return self.model_manager.chat(
+
+        cacheable = self._is_cacheable(messages)
+        if cacheable:
+            cached, embedding = self.response_cache.lookup(query, chunk_ids, self._cache_scope())
+            if cached is not None:
+                self.model_manager.record_exchange(messages, cached, self.prompt_template, self.session_id)
+                return cached
+
+        started = time.perf_counter()
+        response = self.model_manager.chat(
             model_name=self.model,
             messages=messages,
             system_prompt=self.prompt_template,
-            session_id=self.session_id
+            session_id=self.session_id,
+            fallback_models=self.fallback_models,
         )
+        if cacheable:
+            self.response_cache.store(query, embedding, chunk_ids, self._cache_scope(), response, time.perf_counter() - started)
+        return response
+
+    async def achat(self, messages: list[str]) -> str:
+        """Async version of `chat`, retrieval and LLM calls are awaited instead of blocking the event loop"""
+        query = messages[-1]
+        chunk_ids = []
+        if len(self.kb_list):
+            # 使用 RAG 模式，将搜索结果注入
+            knowledge, chunk_ids = await self.rag_manager.aretrieve_context(query, knowledge_bases=self.kb_list)
+            messages[-1] = f"{messages[-1]}\n\n参考以下信息回答用户问题：\n{knowledge}"
+
+        cacheable = await self._ais_cacheable(messages)
+        if cacheable:
+            cached, embedding = await self.response_cache.alookup(query, chunk_ids, self._cache_scope())
+            if cached is not None:
+                await self.model_manager.arecord_exchange(messages, cached, self.prompt_template, self.session_id)
+                return cached
+
+        started = time.perf_counter()
+        response = await self.model_manager.achat(
+            model_name=self.model,
+            messages=messages,
+            system_prompt=self.prompt_template,
+            session_id=self.session_id,
+            fallback_models=self.fallback_models,
+            hedge=self.hedge,
+        )
+        if cacheable:
+            self.response_cache.store(query, embedding, chunk_ids, self._cache_scope(), response, time.perf_counter() - started)
+        return response
 
     def chat_stream(self, messages: list[str]):
         # if len(self.kb_list):
@@ -47,10 +116,45 @@ class Assistant:
             model_name=self.model,
             messages=messages,
             system_prompt=self.prompt_template,
-            session_id=self.session_id
+            session_id=self.session_id,
+            fallback_models=self.fallback_models,
         )
 
-    def set_selected_kb(self, selected_kb_id_list: list[int]):
+    async def achat_stream(self, messages: list[str]):
+        """Async streaming chat, yields the response chunks as the model generates them"""
+        query = messages[-1]
+        chunk_ids = []
+        if len(self.kb_list):
+            # 使用 RAG 模式，将搜索结果注入
+            knowledge, chunk_ids = await self.rag_manager.aretrieve_context(query, knowledge_bases=self.kb_list)
+            messages[-1] = f"{messages[-1]}\n\n参考以下信息回答用户问题：\n{knowledge}"
+
+        cacheable = await self._ais_cacheable(messages)
+        if cacheable:
+            cached, embedding = await self.response_cache.alookup(query, chunk_ids, self._cache_scope())
+            if cached is not None:
+                await self.model_manager.arecord_exchange(messages, cached, self.prompt_template, self.session_id)
+                # 缓存命中时整段回答作为一个片段返回
+                yield cached
+                return
+
+        started = time.perf_counter()
+        response = ""
+        async for chunk in self.model_manager.achat_stream(
+            model_name=self.model,
+            messages=messages,
+            system_prompt=self.prompt_template,
+            session_id=self.session_id,
+            fallback_models=self.fallback_models,
+            hedge=self.hedge,
+        ):
+            response += chunk
+            yield chunk
+        if cacheable:
+            self.response_cache.store(query, embedding, chunk_ids, self._cache_scope(), response, time.perf_counter() - started)
+
+    def set_selected_kb(self, selected_kb_id_list: list[str]):
+        """Restrict retrieval to the given knowledge bases, the filter is applied inside Milvus"""
         self.kb_list = selected_kb_id_list
 
 
@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from chat.model_manager import ModelManager
+from config.config_manager import ConfigManager
+from config.database import dispose_async_engine, get_async_session_factory
+from models.chat_record import ChatRecord
+from utils.metrics import REGISTRY, span
+from utils.rate_limiter import TokenBucket
+from utils.time_utils import utcnow
+
+RECORDS_JUDGED = REGISTRY.counter("chat_records_judged_total", "Chat records judged by the judge worker", ["verdict"])
+
+DEFAULT_JUDGE_PROMPT = """你是人才搜索平台的数据审核员。下面是一条用户与人才搜索助手的对话请求。
+请判断该请求是否是一个清晰、有意义的人才搜索需求，可以作为后续优化检索和回答的样本。
+是回答Y，否则回答N，只输出一个字母。"""
+
+
+@dataclass
+class JudgeStats:
+    """Counters of one worker run"""
+    claimed: int = 0
+    used: int = 0
+    rejected: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "claimed": self.claimed,
+            "used": self.used,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 3),
+        }
+
+
+class JudgeWorker:
+    """
+    Batch worker labeling unjudged `ChatRecord` rows, configured by the `judge_worker` section of app.yaml.
+
+    Each chunk is claimed in a short transaction that sets `judge_lease_until` and commits. On MySQL the
+    rows are selected with `FOR UPDATE SKIP LOCKED`, so several workers never pick the same row. The model
+    calls run outside any transaction and never block inserts into `chat_records`. Records are judged
+    concurrently (bounded by `max_concurrency` and `requests_per_second`), then a second short transaction
+    writes the flags with one bulk UPDATE per verdict and releases the lease. `is_judged` is the checkpoint,
+    and a crashed worker only leaves leases behind that expire after `lease_seconds`.
+    SQLite has no row locks, so only one worker should run there. Records whose judgement failed have
+    their lease released and are retried by the next run.
+    Usage:
+        stats = asyncio.run(JudgeWorker().run())
+    """
+
+    def __init__(self, model_name: Optional[str] = None, batch_size: Optional[int] = None):
+        config = ConfigManager().get_app_config('judge_worker') or {}
+        self.model_name = model_name or config.get('model', 'DeepSeek-V3')
+        self.batch_size = batch_size or config.get('batch_size', 50)
+        self.max_concurrency = config.get('max_concurrency', 8)
+        self.rate_limiter = TokenBucket(rate=config.get('requests_per_second', 5))
+        self.prompt = config.get('prompt') or DEFAULT_JUDGE_PROMPT
+        self.lease_seconds = config.get('lease_seconds', 600)
+        self.model = ModelManager().get_model(self.model_name)
+
+    def _format_record(self, record: ChatRecord) -> str:
+        try:
+            messages = json.loads(record.messages)
+        except (TypeError, ValueError):
+            messages = [record.messages]
+        if not isinstance(messages, list):
+            messages = [messages]
+        return "\n".join(f"用户：{message}" for message in messages)
+
+    async def _judge(self, record: ChatRecord, semaphore: asyncio.Semaphore) -> Optional[bool]:
+        """Ask the model about one record, None means the call failed and the record stays unjudged"""
+        async with semaphore:
+            await self.rate_limiter.aacquire()
+            try:
+                with span("judge.record"):
+                    response = await self.model.ainvoke([
+                        SystemMessage(content=self.prompt),
+                        HumanMessage(content=self._format_record(record)),
+                    ])
+                return response.content.strip().upper().startswith("Y")
+            except Exception as e:
+                logging.warning(f"Judging chat record {record.id} failed: {str(e)}")
+                return None
+
+    async def _claim(self, db: AsyncSession, after_id: int, size: int) -> List[ChatRecord]:
+        """Select up to `size` unjudged records without a live lease and lease them to this worker"""
+        now = utcnow()
+        query = (
+            select(ChatRecord)
+            .where(
+                ChatRecord.is_judged.is_(False),
+                ChatRecord.id > after_id,
+                or_(ChatRecord.judge_lease_until.is_(None), ChatRecord.judge_lease_until < now),
+            )
+            .order_by(ChatRecord.id)
+            .limit(size)
+        )
+        if db.bind.dialect.name != "sqlite":
+            # 被其他 worker 锁住的行直接跳过
+            query = query.with_for_update(skip_locked=True)
+        result = await db.execute(query)
+        records = list(result.scalars().all())
+        if records:
+            await db.execute(
+                update(ChatRecord)
+                .where(ChatRecord.id.in_([record.id for record in records]))
+                .values(judge_lease_until=now + timedelta(seconds=self.lease_seconds))
+            )
+        return records
+
+    async def _save_verdicts(self, db: AsyncSession, records: List[ChatRecord], verdicts: List[Optional[bool]], stats: JudgeStats) -> None:
+        used_ids = [record.id for record, verdict in zip(records, verdicts) if verdict is True]
+        rejected_ids = [record.id for record, verdict in zip(records, verdicts) if verdict is False]
+        failed_ids = [record.id for record, verdict in zip(records, verdicts) if verdict is None]
+        with span("judge.bulk_update"):
+            if used_ids:
+                await db.execute(update(ChatRecord).where(ChatRecord.id.in_(used_ids)).values(is_judged=True, is_used=True, judge_lease_until=None))
+            if rejected_ids:
+                await db.execute(update(ChatRecord).where(ChatRecord.id.in_(rejected_ids)).values(is_judged=True, is_used=False, judge_lease_until=None))
+            if failed_ids:
+                # 释放租约，下一次运行立即重试
+                await db.execute(update(ChatRecord).where(ChatRecord.id.in_(failed_ids)).values(judge_lease_until=None))
+        stats.used += len(used_ids)
+        stats.rejected += len(rejected_ids)
+        stats.failed += len(failed_ids)
+        RECORDS_JUDGED.inc(len(used_ids), verdict="used")
+        RECORDS_JUDGED.inc(len(rejected_ids), verdict="rejected")
+
+    async def run(self, limit: Optional[int] = None) -> JudgeStats:
+        """
+        Judge unjudged records chunk by chunk until none are left.
+        Args:
+            limit: Stop after claiming this many records, None processes the whole backlog.
+        """
+        stats = JudgeStats()
+        # 本次运行内按 id 前进，失败的记录留给下一次运行，避免反复重试
+        last_id = 0
+        session_factory = get_async_session_factory()
+        while limit is None or stats.claimed < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - stats.claimed)
+            # 认领事务只写租约，提交后再调用模型，不在模型调用期间持有行锁
+            async with session_factory() as db:
+                async with db.begin():
+                    records = await self._claim(db, last_id, size)
+            if not records:
+                break
+            stats.claimed += len(records)
+            last_id = records[-1].id
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            verdicts = await asyncio.gather(*(self._judge(record, semaphore) for record in records))
+            async with session_factory() as db:
+                async with db.begin():
+                    await self._save_verdicts(db, records, verdicts, stats)
+            logging.info(f"Judge worker progress: {stats.to_dict()}")
+        return stats
+
+
+async def _main(args: argparse.Namespace) -> None:
+    try:
+        stats = await JudgeWorker(model_name=args.model, batch_size=args.batch_size).run(limit=args.limit)
+        print(json.dumps(stats.to_dict(), ensure_ascii=False))
+    finally:
+        await dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量判断未处理的聊天记录，更新 is_judged / is_used")
+    parser.add_argument("--model", default=None, help="model.yaml 中的模型名，默认使用 app.yaml 中 judge_worker.model")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批认领的记录数")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多处理的记录数")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
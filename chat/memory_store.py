@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import time
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from utils.lru_cache import LRUCache
+from utils.time_utils import as_naive_utc, utcnow
+
+
+def _trim_window(messages: List[BaseMessage], max_turns: Optional[int]) -> List[BaseMessage]:
+    """Keep the system messages plus the last `max_turns` human/ai turns"""
+    if not max_turns:
+        return messages
+    system_messages = [m for m in messages if m.type == "system"]
+    other_messages = [m for m in messages if m.type != "system"]
+    return system_messages + other_messages[-max_turns * 2:]
+
+
+class WindowedChatMessageHistory(InMemoryChatMessageHistory):
+    """In-memory chat history that only keeps a sliding window of turns"""
+
+    max_turns: Optional[int] = None
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        super().add_messages(messages)
+        self.messages = _trim_window(self.messages, self.max_turns)
+
+
+class SQLChatMessageHistory(BaseChatMessageHistory):
+    """Chat history persisted in the `chat_session_messages` table"""
+
+    def __init__(self, session_id: str, session_factory: Callable, max_turns: Optional[int] = None):
+        self.session_id = session_id
+        self.session_factory = session_factory
+        self.max_turns = max_turns
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        from models.chat_session import ChatSessionMessage
+
+        with self.session_factory() as db:
+            rows = (
+                db.query(ChatSessionMessage.message)
+                .filter(ChatSessionMessage.session_id == self.session_id)
+                .order_by(ChatSessionMessage.id)
+                .all()
+            )
+        return messages_from_dict([json.loads(row.message) for row in rows])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        from sqlalchemy.exc import IntegrityError
+        from models.chat_session import ChatSession, ChatSessionMessage
+
+        # 多个 worker 可能同时创建同一个会话，主键冲突时重试一次
+        for attempt in range(2):
+            with self.session_factory() as db:
+                try:
+                    session = db.get(ChatSession, self.session_id)
+                    if session is None:
+                        db.add(ChatSession(session_id=self.session_id, created_at=utcnow(), last_active_at=utcnow()))
+                    else:
+                        session.last_active_at = utcnow()
+                    db.add_all([
+                        ChatSessionMessage(
+                            session_id=self.session_id,
+                            role=message.type,
+                            message=json.dumps(message_to_dict(message), ensure_ascii=False),
+                        )
+                        for message in messages
+                    ])
+                    db.flush()
+                    if self.max_turns:
+                        self._trim(db)
+                    db.commit()
+                    return
+                except IntegrityError:
+                    db.rollback()
+                    if attempt:
+                        raise
+
+    def _trim(self, db) -> None:
+        """Delete the non-system messages that fall outside the window"""
+        from models.chat_session import ChatSessionMessage
+
+        stale_ids = [
+            row.id for row in (
+                db.query(ChatSessionMessage.id)
+                .filter(ChatSessionMessage.session_id == self.session_id, ChatSessionMessage.role != "system")
+                .order_by(ChatSessionMessage.id.desc())
+                .offset(self.max_turns * 2)
+                .all()
+            )
+        ]
+        if stale_ids:
+            db.query(ChatSessionMessage).filter(ChatSessionMessage.id.in_(stale_ids)).delete(synchronize_session=False)
+
+    def clear(self) -> None:
+        from models.chat_session import ChatSessionMessage
+
+        with self.session_factory() as db:
+            db.query(ChatSessionMessage).filter(ChatSessionMessage.session_id == self.session_id).delete(synchronize_session=False)
+            db.commit()
+
+
+class BaseSessionStore(ABC):
+    """Pluggable storage for per-session chat histories"""
+
+    @abstractmethod
+    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
+        """Get or create the chat history of a session"""
+
+    @abstractmethod
+    def has_session(self, session_id: str) -> bool:
+        """Whether the session already has stored messages"""
+
+    async def ahas_session(self, session_id: str) -> bool:
+        """Async version of `has_session`, runs in a worker thread so database backends do not block the event loop"""
+        return await asyncio.to_thread(self.has_session, session_id)
+
+    @abstractmethod
+    def delete_session(self, session_id: str) -> None:
+        """Drop a session and its messages"""
+
+
+class InMemorySessionStore(BaseSessionStore):
+    """
+    Process-local session store with LRU and idle-TTL eviction.
+    Args:
+        max_sessions: Maximum number of sessions kept in memory.
+        ttl_seconds: Sessions idle for longer than this are dropped.
+        max_turns: Number of human/ai turns kept per session.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = 10000, ttl_seconds: Optional[float] = None, max_turns: Optional[int] = None):
+        self.max_turns = max_turns
+        self._sessions: LRUCache[WindowedChatMessageHistory] = LRUCache(
+            max_size=max_sessions,
+            ttl=ttl_seconds,
+            refresh_ttl_on_get=True,
+        )
+
+    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
+        return self._sessions.get_or_create(
+            session_id,
+            lambda: WindowedChatMessageHistory(max_turns=self.max_turns),
+        )
+
+    def has_session(self, session_id: str) -> bool:
+        history = self._sessions.get(session_id)
+        return history is not None and len(history.messages) > 0
+
+    async def ahas_session(self, session_id: str) -> bool:
+        # 纯内存查询，不需要切换线程
+        return self.has_session(session_id)
+
+    def delete_session(self, session_id: str) -> None:
+        self._sessions.pop(session_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLSessionStore(BaseSessionStore):
+    """
+    Session store backed by the application database, shared by all workers.
+    Args:
+        ttl_seconds: Sessions idle for longer than this are treated as new and purged.
+        max_turns: Number of human/ai turns kept per session.
+        cleanup_interval: Minimum seconds between two purges of expired sessions.
+        session_factory: SQLAlchemy session factory, defaults to `config.database.SessionLocal`.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_turns: Optional[int] = None,
+        cleanup_interval: float = 300,
+        session_factory: Optional[Callable] = None,
+    ):
+        if session_factory is None:
+            from config.database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = time.monotonic()
+
+    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
+        return SQLChatMessageHistory(session_id, self.session_factory, self.max_turns)
+
+    def _is_expired(self, last_active_at: Optional[datetime]) -> bool:
+        if not self.ttl_seconds or last_active_at is None:
+            return False
+        return as_naive_utc(last_active_at) < utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    def has_session(self, session_id: str) -> bool:
+        from models.chat_session import ChatSession
+
+        self._maybe_evict_expired()
+        with self.session_factory() as db:
+            session = db.get(ChatSession, session_id)
+            last_active_at = session.last_active_at if session is not None else None
+        if session is None:
+            return False
+        if self._is_expired(last_active_at):
+            self.delete_session(session_id)
+            return False
+        return True
+
+    def delete_session(self, session_id: str) -> None:
+        from models.chat_session import ChatSession, ChatSessionMessage
+
+        with self.session_factory() as db:
+            db.query(ChatSessionMessage).filter(ChatSessionMessage.session_id == session_id).delete(synchronize_session=False)
+            db.query(ChatSession).filter(ChatSession.session_id == session_id).delete(synchronize_session=False)
+            db.commit()
+
+    def evict_expired(self) -> int:
+        """Purge every session idle for longer than the ttl, returns the number of sessions removed"""
+        from models.chat_session import ChatSession, ChatSessionMessage
+
+        if not self.ttl_seconds:
+            return 0
+        cutoff = utcnow() - timedelta(seconds=self.ttl_seconds)
+        with self.session_factory() as db:
+            expired = db.query(ChatSession.session_id).filter(ChatSession.last_active_at < cutoff)
+            db.query(ChatSessionMessage).filter(
+                ChatSessionMessage.session_id.in_(expired.scalar_subquery())
+            ).delete(synchronize_session=False)
+            removed = db.query(ChatSession).filter(ChatSession.last_active_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+        return removed
+
+    def _maybe_evict_expired(self) -> None:
+        now = time.monotonic()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        try:
+            removed = self.evict_expired()
+            if removed:
+                logging.info(f"Evicted {removed} expired chat sessions")
+        except Exception as e:
+            print(f"Error evicting expired sessions: {str(e)}")
+
+
+def create_session_store(config: Optional[Dict[str, Any]] = None) -> BaseSessionStore:
+    """Build the session store selected by the `memory` section of app.yaml"""
+    config = config or {}
+    backend = config.get("backend", "memory")
+    if backend == "memory":
+        return InMemorySessionStore(
+            max_sessions=config.get("max_sessions", 10000),
+            ttl_seconds=config.get("ttl_seconds"),
+            max_turns=config.get("max_turns"),
+        )
+    elif backend == "sql":
+        return SQLSessionStore(
+            ttl_seconds=config.get("ttl_seconds"),
+            max_turns=config.get("max_turns"),
+            cleanup_interval=config.get("cleanup_interval", 300),
+        )
+    raise ValueError(f"Unsupported memory backend: {backend}")
@@ -1,86 +1,53 @@
-from typing import Dict, Any, List, Generator
-from langchain_community.chat_models import ChatTongyi, ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
-from langchain_deepseek import ChatDeepSeek
+import threading
+
+from typing import Dict, Any, List, Generator, AsyncGenerator, AsyncIterator, Iterator, Optional, Sequence
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from config.config_manager import ConfigManager
-from langchain_ollama import ChatOllama
-from langchain_core.chat_history import (
-    BaseChatMessageHistory,
-    InMemoryChatMessageHistory,
-)
-from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from chat.memory_store import BaseSessionStore, create_session_store
 from utils.decorators import singleton
-from langchain.chat_models.base import BaseChatModel
+from chat.model_router import ModelRouter
+from chat.provider_clients import ProviderClientFactory
 
 
 @singleton
 class ModelManager:
-    def __init__(self):
-        self.models: Dict[str, Any] = {}
-        self.memory: Dict[str, BaseChatMessageHistory] = {}
+    def __init__(self, models: Optional[Dict[str, BaseChatModel]] = None):
+        """
+        Args:
+            models: Chat models to use instead of the configured clients, by name, e.g. offline stand-ins.
+        """
+        # 已创建的模型客户端，第一次 get_model 时才创建，某个模型配置错误不影响服务启动
+        self.models: Dict[str, BaseChatModel] = dict(models or {})
+        self._models_lock = threading.Lock()
         self.config_manager = ConfigManager()
-        self.load_model_config()
+        # 会话记忆存储，后端由 app.yaml 中的 memory 配置决定
+        self.session_store: BaseSessionStore = create_session_store(self.config_manager.get_app_config('memory'))
+        # 按顺序尝试模型链，按 model.yaml 限制每个模型的并发和速率，可选对冲请求
+        self.router = ModelRouter(self.get_model, self.config_manager.model_config, self.config_manager.get_app_config('model_routing'))
 
-    def load_model_config(self):
-        """Initialize different LLM models based on configuration"""
-        config = self.config_manager.model_config
-        for model_name, model_config in config.items():
-            model_type = model_config['type']
-            
-            if model_type == "aliyun":
-                self.models[model_name] = ChatTongyi(
-                    model=model_config['model_name'],
-                    streaming=True,
-                    api_key=model_config.get('api_key'),
-                    temperature=model_config.get('temperature')
-                )
-            elif model_type == "deepseek":
-                self.models[model_name] = ChatDeepSeek(
-                    model=model_config['model_name'],
-                    streaming=True,
-                    api_key=model_config.get('api_key'),
-                    temperature=model_config.get('temperature')
-                )
-            elif model_type == "ollama":
-                self.models[model_name] = ChatOllama(
-                    model=model_config['model_name'],
-                    streaming=True,
-                    api_key=model_config.get('api_key'),
-                    base_url=model_config.get('api_base'),
-                    temperature=model_config.get('temperature')
-                )
-            elif model_type in ["xunfei"]:
-                self.models[model_name] = ChatOpenAI(
-                    model=model_config['model_name'],
-                    streaming=True,
-                    api_key=model_config.get('api_key'),
-                    base_url=model_config.get('api_base'),
-                    temperature=model_config.get('temperature')
-                )
-            elif model_type == "groq":
-                self.models[model_name] = ChatOpenAI(
-                    model=model_config['model_name'],
-                    streaming=True,
-                    api_key=model_config.get('api_key'),
-                    base_url=model_config.get('api_base'),
-                    temperature=model_config.get('temperature')
-                )
-    
     def get_model_config(self, model_name: str = None) -> Dict[str, Any]:
         """Get configuration for a specific model or all models"""
         return self.config_manager.get_config(model_name)
 
     def get_model(self, model_name: str) -> BaseChatModel: 
-        """Get a specific model by name"""
-        if model_name not in self.models:
+        """Get a specific model by name, the client is created on first use"""
+        model = self.models.get(model_name)
+        if model is not None:
+            return model
+        model_config = self.config_manager.get_model_config(model_name)
+        if model_config is None:
             raise ValueError(f"Model {model_name} not found")
-        return self.models[model_name]
+        with self._models_lock:
+            if model_name not in self.models:
+                # 所有模型客户端共享同一 host 的 HTTP 连接池
+                self.models[model_name] = ProviderClientFactory().create_chat_model(model_config)
+            return self.models[model_name]
 
     def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
         """Get or create chat history for a session"""
-        if session_id not in self.memory:
-            self.memory[session_id] = InMemoryChatMessageHistory()
-        return self.memory[session_id]
+        return self.session_store.get_session_history(session_id)
     
     def _prepare_messages(self, messages: List[str], system_prompt: str = None, session_id: str = 'default') -> List:
         """Convert string messages to LangChain message objects
@@ -90,12 +57,22 @@ class ModelManager:
             session_id: Session identifier to check if system prompt is needed
             system_prompt: Optional system prompt to use
         """
+        # Whether the session already has stored messages determines 
+        # whether the system prompt word needs to be added
+        add_system_prompt = bool(system_prompt) and not self.session_store.has_session(session_id)
+        return self._build_messages(messages, system_prompt if add_system_prompt else None)
+
+    async def _aprepare_messages(self, messages: List[str], system_prompt: str = None, session_id: str = 'default') -> List:
+        """Async version of `_prepare_messages`, the session lookup does not block the event loop"""
+        add_system_prompt = bool(system_prompt) and not await self.session_store.ahas_session(session_id)
+        return self._build_messages(messages, system_prompt if add_system_prompt else None)
+
+    @staticmethod
+    def _build_messages(messages: List[str], system_prompt: Optional[str]) -> List:
         result = []
 
         # Add system message if needed
-        if self.memory.get(session_id) is None and system_prompt:
-            # Whether the memory corresponding to session_id has been initialized determines 
-            # whether the system prompt word needs to be added
+        if system_prompt:
             result.append(SystemMessage(content=system_prompt))
         
         # Add user messages
@@ -104,32 +81,57 @@ class ModelManager:
             
         return result
     
-    def _get_chat_stream(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default'):
-        """Common method to set up model, prepare messages and get response stream
+    def record_exchange(self, messages: List[str], response: str, system_prompt: str = None, session_id: str = 'default') -> None:
+        """Write a turn answered without calling the model (e.g. from the response cache) into the session history"""
+        prepared_messages = self._prepare_messages(messages, system_prompt, session_id)
+        self.get_session_history(session_id).add_messages(prepared_messages + [AIMessage(content=response)])
+
+    async def arecord_exchange(self, messages: List[str], response: str, system_prompt: str = None, session_id: str = 'default') -> None:
+        """Async version of `record_exchange`"""
+        prepared_messages = await self._aprepare_messages(messages, system_prompt, session_id)
+        await self.get_session_history(session_id).aadd_messages(prepared_messages + [AIMessage(content=response)])
+
+    def _route(self, model_name: str, fallback_models: Optional[Sequence[str]]) -> List[str]:
+        return [model_name, *(fallback_models or [])]
+
+    def _get_chat_stream(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default', fallback_models: Optional[Sequence[str]] = None) -> Iterator:
+        """Common method to prepare messages, stream the response through the router and update the history
         
         Args:
             model_name: Name of the model to use
             messages: List of message strings
             session_id: Identifier for the conversation session
             system_prompt: Optional system prompt to add at the beginning
+            fallback_models: Models tried in order when the previous one fails
             
         Returns:
             Response stream from the model
         """
-        model = self.get_model(model_name)
         prepared_messages = self._prepare_messages(messages, system_prompt, session_id)
+        history = self.get_session_history(session_id)
+        response_text = ""
+        for chunk in self.router.stream(self._route(model_name, fallback_models), history.messages + prepared_messages):
+            response_text += chunk.content
+            yield chunk
+        # 只有最终完成的回答写入会话历史，失败或被取消的尝试不会留下记录
+        history.add_messages(prepared_messages + [AIMessage(content=response_text)])
+
+    async def _aget_chat_stream(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default', fallback_models: Optional[Sequence[str]] = None, hedge: bool = False) -> AsyncIterator:
+        """Async counterpart of `_get_chat_stream`, optionally hedging the request across the fallback models
         
-        conversation = RunnableWithMessageHistory(
-            model, 
-            lambda: self.get_session_history(session_id)
-        )
-        
-        return conversation.stream(
-            prepared_messages, 
-            config={"configurable": {"session_id": session_id}}
-        )
+        Returns:
+            Async response stream from the model
+        """
+        prepared_messages = await self._aprepare_messages(messages, system_prompt, session_id)
+        history = self.get_session_history(session_id)
+        history_messages = await history.aget_messages()
+        response_text = ""
+        async for chunk in self.router.astream(self._route(model_name, fallback_models), history_messages + prepared_messages, hedge=hedge):
+            response_text += chunk.content
+            yield chunk
+        await history.aadd_messages(prepared_messages + [AIMessage(content=response_text)])
     
-    def chat(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default') -> str:
+    def chat(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default', fallback_models: Optional[Sequence[str]] = None) -> str:
         """Generate response using specified model
         
         Args:
@@ -137,11 +139,12 @@ class ModelManager:
             messages: List of message strings
             session_id: Identifier for the conversation session
             system_prompt: Optional system prompt to add at the beginning
+            fallback_models: Models tried in order when the previous one fails
             
         Returns:
             String response from the model
         """
-        response_stream = self._get_chat_stream(model_name, messages, system_prompt, session_id)
+        response_stream = self._get_chat_stream(model_name, messages, system_prompt, session_id, fallback_models)
         
         response_text = ""
         for chunk in response_stream:
@@ -149,7 +152,7 @@ class ModelManager:
             
         return response_text
     
-    def chat_stream(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default', ) -> Generator[str, None, None]:
+    def chat_stream(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default', fallback_models: Optional[Sequence[str]] = None) -> Generator[str, None, None]:
         """Generate streaming response using specified model
         
         Args:
@@ -157,20 +160,42 @@ class ModelManager:
             messages: List of message strings
             session_id: Identifier for the conversation session
             system_prompt: Optional system prompt to add at the beginning
+            fallback_models: Models tried in order when the previous one fails
             
         Yields:
             Chunks of the response as they are generated
         """
-        response_stream = self._get_chat_stream(model_name, messages, system_prompt, session_id)
-        
-        # Build the full response as we stream (for history)
-        full_response = ""
+        for chunk in self._get_chat_stream(model_name, messages, system_prompt, session_id, fallback_models):
+            yield chunk.content
+
+    async def achat(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default', fallback_models: Optional[Sequence[str]] = None, hedge: bool = False) -> str:
+        """Generate response using specified model without blocking the event loop
         
-        for chunk in response_stream:
-            chunk_text = chunk.content
-            full_response += chunk_text
-            yield chunk_text
+        Args:
+            model_name: Name of the model to use
+            messages: List of message strings
+            session_id: Identifier for the conversation session
+            system_prompt: Optional system prompt to add at the beginning
+            fallback_models: Models tried in order when the previous one fails
+            hedge: Send a backup request to the next model when the current one is slower than usual
+            
+        Returns:
+            String response from the model
+        """
+        response_text = ""
+        async for chunk in self._aget_chat_stream(model_name, messages, system_prompt, session_id, fallback_models, hedge):
+            response_text += chunk.content
+            
+        return response_text
 
+    async def achat_stream(self, model_name: str, messages: List[str], system_prompt: str = None, session_id: str = 'default', fallback_models: Optional[Sequence[str]] = None, hedge: bool = False) -> AsyncGenerator[str, None]:
+        """Generate streaming response using specified model without blocking the event loop
+        
+        Yields:
+            Chunks of the response as they are generated
+        """
+        async for chunk in self._aget_chat_stream(model_name, messages, system_prompt, session_id, fallback_models, hedge):
+            yield chunk.content
 
 if __name__ == "__main__":
     model_manager = ModelManager()
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from utils.metrics import REGISTRY, ainstrument_stream, instrument_stream
+from utils.rate_limiter import TokenBucket
+
+ROUTE_ATTEMPTS = REGISTRY.counter(
+    "llm_route_attempts_total",
+    "Model attempts made by the router",
+    ["model", "outcome"],  # won / failed / timeout / hedge_lost
+)
+
+
+class ModelLimiter:
+    """
+    Per-model concurrency and request rate limit.
+    Sync and async callers are gated by separate semaphores, the served API only uses the async path.
+    Args:
+        max_concurrency: Maximum in-flight requests, None means unlimited.
+        requests_per_second: Token bucket rate, None means unlimited.
+        acquire_timeout: Seconds to wait for a slot or token before giving up on the model.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, requests_per_second: Optional[float] = None, acquire_timeout: float = 10):
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.bucket = TokenBucket(rate=requests_per_second) if requests_per_second else None
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+
+    def _wait_for_token(self) -> float:
+        if self.bucket is None:
+            return 0.0
+        wait = self.bucket.reserve(1, max_wait=self.acquire_timeout)
+        if wait is None:
+            raise TimeoutError(f"rate limit wait exceeds {self.acquire_timeout}s")
+        return wait
+
+    @contextmanager
+    def acquire(self):
+        if self._semaphore is not None and not self._semaphore.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f"no free slot within {self.acquire_timeout}s")
+        try:
+            wait = self._wait_for_token()
+            if wait > 0:
+                time.sleep(wait)
+            yield
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    @asynccontextmanager
+    async def aacquire(self):
+        semaphore = None
+        if self.max_concurrency:
+            if self._async_semaphore is None:
+                self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            semaphore = self._async_semaphore
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.acquire_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"no free slot within {self.acquire_timeout}s")
+        try:
+            wait = self._wait_for_token()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+
+class LatencyTracker:
+    """Rolling window of time-to-first-token samples of one model"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class ModelRouter:
+    """
+    Streams a response from an ordered chain of models, configured by the `model_routing` section of
+    app.yaml and the per-model `max_concurrency` / `requests_per_second` / `first_token_timeout`
+    entries of model.yaml.
+
+    A model that fails, times out waiting for a slot or does not produce its first chunk within
+    `first_token_timeout` is skipped and the next model of the chain is tried. Once a chunk has been
+    streamed the model is committed, later errors propagate. A sync stream cannot be interrupted while
+    it waits, so `stream` does not enforce `first_token_timeout`: a late first chunk is still used
+    rather than thrown away after the wait. With hedging (async only), when the current model has not
+    produced its first chunk after its observed `hedge_quantile` latency, a backup request goes to the
+    next model and whichever streams first wins, the other is cancelled.
+    Usage:
+        router = ModelRouter(get_model, model_configs, routing_config)
+        async for chunk in router.astream(["kimi", "DeepSeek-V3"], messages, hedge=True):
+            ...
+    """
+
+    def __init__(self, get_model: Callable[[str], BaseChatModel], model_configs: Dict[str, Any], config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.get_model = get_model
+        self.model_configs = model_configs or {}
+        self.acquire_timeout = config.get('acquire_timeout', 10)
+        self.hedge_quantile = config.get('hedge_quantile', 0.95)
+        self.hedge_min_delay = config.get('hedge_min_delay', 1.0)
+        self.hedge_default_delay = config.get('hedge_default_delay', 3.0)
+        self.hedge_min_samples = config.get('hedge_min_samples', 20)
+        self.latency_window = config.get('latency_window', 200)
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+
+    def limiter(self, model_name: str) -> ModelLimiter:
+        with self._lock:
+            if model_name not in self._limiters:
+                model_config = self.model_configs.get(model_name) or {}
+                self._limiters[model_name] = ModelLimiter(
+                    max_concurrency=model_config.get('max_concurrency'),
+                    requests_per_second=model_config.get('requests_per_second'),
+                    acquire_timeout=self.acquire_timeout,
+                )
+            return self._limiters[model_name]
+
+    def latency(self, model_name: str) -> LatencyTracker:
+        with self._lock:
+            if model_name not in self._latencies:
+                self._latencies[model_name] = LatencyTracker(self.latency_window)
+            return self._latencies[model_name]
+
+    def _first_token_timeout(self, model_name: str) -> Optional[float]:
+        return (self.model_configs.get(model_name) or {}).get('first_token_timeout')
+
+    def hedge_delay(self, model_name: str) -> float:
+        """Seconds to wait for the first chunk of a model before sending a backup request"""
+        tracker = self.latency(model_name)
+        if len(tracker) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, tracker.quantile(self.hedge_quantile))
+
+    def _chain(self, model_names: Sequence[str]) -> List[str]:
+        chain = list(dict.fromkeys(name for name in model_names if name))
+        if not chain:
+            raise ValueError("No model to route to")
+        return chain
+
+    def _failed(self, model_name: str, error: BaseException, errors: List[str]) -> None:
+        outcome = "timeout" if isinstance(error, (TimeoutError, asyncio.TimeoutError)) else "failed"
+        ROUTE_ATTEMPTS.inc(model=model_name, outcome=outcome)
+        errors.append(f"{model_name}: {type(error).__name__}: {error}")
+        logging.warning(f"Model {model_name} {outcome}, trying next model: {error}")
+
+    def _won(self, model_name: str, started: float) -> None:
+        ROUTE_ATTEMPTS.inc(model=model_name, outcome="won")
+        self.latency(model_name).record(time.perf_counter() - started)
+
+    def _lost(self, model_name: str, started: float) -> None:
+        ROUTE_ATTEMPTS.inc(model=model_name, outcome="hedge_lost")
+        # 被取消的尝试至少要这么久才会出首个片段，也计入样本，否则只统计胜者会低估对冲用的分位数
+        self.latency(model_name).record(time.perf_counter() - started)
+
+    def stream(self, model_names: Sequence[str], messages: List[BaseMessage]) -> Iterator[Any]:
+        """Stream from the first model of the chain that produces a chunk, without hedging"""
+        errors: List[str] = []
+        for model_name in self._chain(model_names):
+            started = time.perf_counter()
+            committed = False
+            try:
+                with self.limiter(model_name).acquire():
+                    stream = instrument_stream(self.get_model(model_name).stream(messages), model_name)
+                    first = next(stream, None)
+                    if first is None:
+                        raise RuntimeError("empty response")
+                    timeout = self._first_token_timeout(model_name)
+                    if timeout and time.perf_counter() - started > timeout:
+                        # 同步流无法中途打断，等到首个片段时已经付出了等待时间，继续使用该模型而不是丢弃重来
+                        logging.warning(f"Model {model_name} first chunk after {time.perf_counter() - started:.1f}s, over first_token_timeout {timeout}s")
+                    self._won(model_name, started)
+                    # 已经输出了内容，之后的错误不能再切换模型
+                    committed = True
+                    yield first
+                    yield from stream
+                    return
+            except Exception as e:
+                if committed:
+                    raise
+                self._failed(model_name, e, errors)
+        raise RuntimeError(f"All models failed: {'; '.join(errors)}")
+
+    async def _aattempt(self, model_name: str, messages: List[BaseMessage]) -> AsyncIterator[Any]:
+        async with self.limiter(model_name).aacquire():
+            async for chunk in ainstrument_stream(self.get_model(model_name).astream(messages), model_name):
+                yield chunk
+
+    async def _afirst_chunk(self, model_name: str, stream: AsyncIterator[Any], started: float) -> Any:
+        timeout = self._first_token_timeout(model_name)
+        if timeout:
+            remaining = timeout - (time.perf_counter() - started)
+            try:
+                return await asyncio.wait_for(stream.__anext__(), timeout=max(remaining, 0.001))
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"no first chunk within {timeout}s")
+        return await stream.__anext__()
+
+    async def _discard(self, task: asyncio.Task, stream: AsyncIterator[Any]) -> None:
+        """Cancel a losing or failed attempt and release its slot"""
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+        try:
+            await stream.aclose()
+        except Exception:
+            pass
+
+    async def _aselect(self, chain: List[str], messages: List[BaseMessage], hedge: bool) -> Tuple[str, Any, AsyncIterator[Any]]:
+        """Run attempts until one produces its first chunk, returns (model, first chunk, rest of the stream)"""
+        errors: List[str] = []
+        remaining = list(chain)
+        pending: Dict[asyncio.Task, Tuple[str, AsyncIterator[Any], float]] = {}
+
+        def launch() -> str:
+            model_name = remaining.pop(0)
+            stream = self._aattempt(model_name, messages)
+            started = time.perf_counter()
+            task = asyncio.ensure_future(self._afirst_chunk(model_name, stream, started))
+            pending[task] = (model_name, stream, started)
+            return model_name
+
+        current = launch()
+        hedged = not hedge
+        try:
+            while pending:
+                # 只对第一次发出的请求做一次对冲，之后失败才继续尝试下一个模型
+                timeout = self.hedge_delay(current) if not hedged and remaining else None
+                done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backup = launch()
+                    logging.info(f"Model {current} slow, hedging with {backup}")
+                    continue
+                for task in done:
+                    model_name, stream, started = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self._won(model_name, started)
+                        for loser, (loser_name, loser_stream, loser_started) in list(pending.items()):
+                            self._lost(loser_name, loser_started)
+                            await self._discard(loser, loser_stream)
+                        pending.clear()
+                        return model_name, task.result(), stream
+                    if isinstance(error, StopAsyncIteration):
+                        error = RuntimeError("empty response")
+                    self._failed(model_name, error, errors)
+                    await self._discard(task, stream)
+                if not pending and remaining:
+                    current = launch()
+        finally:
+            # 调用方被取消时也要释放所有尝试
+            for task, (_, stream, _) in list(pending.items()):
+                await self._discard(task, stream)
+        raise RuntimeError(f"All models failed: {'; '.join(errors)}")
+
+    async def astream(self, model_names: Sequence[str], messages: List[BaseMessage], hedge: bool = False) -> AsyncIterator[Any]:
+        """Stream from the fastest available model of the chain, see the class docstring"""
+        model_name, first, stream = await self._aselect(self._chain(model_names), messages, hedge)
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
@@ -0,0 +1,182 @@
+import logging
+import threading
+
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from config.config_manager import ConfigManager
+from utils.decorators import singleton
+
+# 配置中没有 api_base 时各供应商 SDK 使用的默认地址，用于确定共享的连接池
+DEFAULT_BASE_URLS = {
+    "deepseek": "https://api.deepseek.com/v1",
+    "ollama": "http://127.0.0.1:11434",
+    "moonshot": "https://api.moonshot.cn/v1",
+    "openai": "https://api.openai.com/v1",
+}
+
+
+def _origin(base_url: str) -> str:
+    """scheme://host:port of a base url, connections are pooled per origin"""
+    parts = urlsplit(base_url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@singleton
+class ProviderClientFactory:
+    """
+    Creates every LLM provider client on top of shared, keep-alive httpx connection pools, configured by
+    the `http_clients` section of app.yaml.
+
+    One pool (transport) is kept per origin and per sync/async flavor, so all models, the self-RAG
+    verifier and the vision client talking to the same host reuse connections and TLS sessions instead
+    of each SDK opening its own. HTTP/2 is negotiated through ALPN when enabled and the `h2` package is
+    installed, hosts without HTTP/2 transparently fall back to HTTP/1.1. Async pools belong to the
+    event loop of the serving process.
+    Usage:
+        model = ProviderClientFactory().create_chat_model(model_config)
+        client = ProviderClientFactory().get_async_http_client("https://api.moonshot.cn/v1")
+    """
+
+    def __init__(self):
+        config = ConfigManager().get_app_config('http_clients') or {}
+        self.limits = httpx.Limits(
+            max_connections=config.get('max_connections', 100),
+            max_keepalive_connections=config.get('max_keepalive_connections', 20),
+            keepalive_expiry=config.get('keepalive_expiry', 60),
+        )
+        self.timeout = httpx.Timeout(
+            connect=config.get('connect_timeout', 10),
+            read=config.get('read_timeout', 120),
+            write=config.get('write_timeout', 30),
+            pool=config.get('pool_timeout', 10),
+        )
+        self.http2 = config.get('http2', True)
+        if self.http2 and not _http2_available():
+            logging.warning("HTTP/2 enabled but the h2 package is not installed, falling back to HTTP/1.1")
+            self.http2 = False
+        self._lock = threading.Lock()
+        self._transports: Dict[Tuple[str, bool], httpx.HTTPTransport] = {}
+        self._async_transports: Dict[Tuple[str, bool], httpx.AsyncHTTPTransport] = {}
+        self._clients: Dict[Tuple[str, bool], httpx.Client] = {}
+        self._async_clients: Dict[Tuple[str, bool], httpx.AsyncClient] = {}
+
+    def _key(self, base_url: str, http2: Optional[bool]) -> Tuple[str, bool]:
+        return _origin(base_url), self.http2 if http2 is None else (http2 and self.http2)
+
+    def _transport(self, key: Tuple[str, bool]) -> httpx.HTTPTransport:
+        if key not in self._transports:
+            self._transports[key] = httpx.HTTPTransport(limits=self.limits, http2=key[1])
+        return self._transports[key]
+
+    def _async_transport(self, key: Tuple[str, bool]) -> httpx.AsyncHTTPTransport:
+        if key not in self._async_transports:
+            self._async_transports[key] = httpx.AsyncHTTPTransport(limits=self.limits, http2=key[1])
+        return self._async_transports[key]
+
+    def get_http_client(self, base_url: str, http2: Optional[bool] = None) -> httpx.Client:
+        """Shared sync client for the origin of `base_url`"""
+        key = self._key(base_url, http2)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = httpx.Client(transport=self._transport(key), timeout=self.timeout, follow_redirects=True)
+            return self._clients[key]
+
+    def get_async_http_client(self, base_url: str, http2: Optional[bool] = None) -> httpx.AsyncClient:
+        """Shared async client for the origin of `base_url`"""
+        key = self._key(base_url, http2)
+        with self._lock:
+            if key not in self._async_clients:
+                self._async_clients[key] = httpx.AsyncClient(transport=self._async_transport(key), timeout=self.timeout, follow_redirects=True)
+            return self._async_clients[key]
+
+    def _openai_kwargs(self, base_url: str, http2: Optional[bool]) -> Dict[str, Any]:
+        return {
+            "http_client": self.get_http_client(base_url, http2),
+            "http_async_client": self.get_async_http_client(base_url, http2),
+        }
+
+    def _ollama_kwargs(self, base_url: str) -> Dict[str, Any]:
+        """The ollama SDK builds its own httpx clients, share the pool by handing it our transports"""
+        key = self._key(base_url, False)
+        with self._lock:
+            return {
+                "sync_client_kwargs": {"transport": self._transport(key), "timeout": self.timeout},
+                "async_client_kwargs": {"transport": self._async_transport(key), "timeout": self.timeout},
+            }
+
+    def create_chat_model(self, model_config: Dict[str, Any], **overrides) -> BaseChatModel:
+        """
+        Create the chat client of one model.yaml entry, provider packages are imported only when used.
+        Args:
+            model_config: The model entry, an optional `http2: false` disables HTTP/2 for its host.
+            overrides: Extra keyword arguments for the client, e.g. max_tokens.
+        """
+        model_type = model_config['type']
+        base_url = model_config.get('api_base')
+        http2 = model_config.get('http2')
+        common = {
+            "streaming": True,
+            "model": model_config['model_name'],
+            "api_key": model_config.get('api_key'),
+            "temperature": model_config.get('temperature'),
+        }
+        common.update(overrides)
+        if model_type == "aliyun" and not base_url:
+            # DashScope SDK 使用自己的 requests 会话，无法接入共享连接池；
+            # 配置了 compatible-mode 的 api_base 时走下面的 OpenAI 兼容接口
+            from langchain_community.chat_models import ChatTongyi
+            return ChatTongyi(**common)
+        elif model_type == "deepseek":
+            from langchain_deepseek import ChatDeepSeek
+            if base_url:
+                common["api_base"] = base_url
+            return ChatDeepSeek(**common, **self._openai_kwargs(base_url or DEFAULT_BASE_URLS["deepseek"], http2))
+        elif model_type == "ollama":
+            from langchain_ollama import ChatOllama
+            base_url = base_url or DEFAULT_BASE_URLS["ollama"]
+            return ChatOllama(base_url=base_url, **common, **self._ollama_kwargs(base_url))
+        elif model_type in ["aliyun", "xunfei", "groq"]:
+            from langchain_openai import ChatOpenAI
+            base_url = base_url or DEFAULT_BASE_URLS["openai"]
+            return ChatOpenAI(base_url=base_url, **common, **self._openai_kwargs(base_url, http2))
+        raise ValueError(f"Unsupported model type: {model_type}")
+
+    def create_async_openai(self, api_key: str, base_url: str):
+        """Raw AsyncOpenAI client on the shared pool, e.g. for the Kimi vision endpoint"""
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.get_async_http_client(base_url))
+
+    def close(self) -> None:
+        """Close the sync pools"""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            for transport in self._transports.values():
+                transport.close()
+            self._clients.clear()
+            self._transports.clear()
+
+    async def aclose(self) -> None:
+        """Close every pool, called on application shutdown"""
+        with self._lock:
+            async_clients = list(self._async_clients.values())
+            async_transports = list(self._async_transports.values())
+            self._async_clients.clear()
+            self._async_transports.clear()
+        for client in async_clients:
+            await client.aclose()
+        for transport in async_transports:
+            await transport.aclose()
+        self.close()
@@ -0,0 +1,153 @@
+import logging
+import queue
+import threading
+import time
+
+from typing import Any, Callable, Dict, List, Optional
+
+from config.config_manager import ConfigManager
+from utils.decorators import singleton
+from utils.metrics import REGISTRY, span
+from utils.time_utils import utcnow
+
+RECORDS_WRITTEN = REGISTRY.counter("chat_records_written_total", "Chat records inserted by the write-behind writer")
+RECORDS_DROPPED = REGISTRY.counter("chat_records_dropped_total", "Chat records dropped by the write-behind writer", ["reason"])
+
+
+@singleton
+class ChatRecordWriter:
+    """
+    Write-behind persistence of `ChatRecord` rows, configured by the `chat_record_writer` section of app.yaml.
+
+    Request handlers only enqueue a row, a background thread inserts them in bulk once `batch_size`
+    rows are waiting or `flush_interval` seconds have passed, so chat latency no longer depends on
+    the database. When the queue is full the `overflow` policy decides which row is lost:
+    "drop_newest" rejects the new row, "drop_oldest" discards the oldest queued one.
+    Usage:
+        ChatRecordWriter().start()
+        ChatRecordWriter().record(session_id, messages_json)
+        ChatRecordWriter().stop()  # 退出前写完队列中的记录
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None):
+        config = ConfigManager().get_app_config('chat_record_writer') or {}
+        self.batch_size = config.get('batch_size', 200)
+        self.flush_interval = config.get('flush_interval', 1.0)
+        self.overflow = config.get('overflow', 'drop_oldest')
+        self.max_retries = config.get('max_retries', 3)
+        self.drain_timeout = config.get('drain_timeout', 10.0)
+        if self.overflow not in ('drop_newest', 'drop_oldest'):
+            raise ValueError(f"Unsupported chat record overflow policy: {self.overflow}")
+        self._session_factory = session_factory
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=config.get('queue_size', 10000))
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session_factory(self) -> Callable:
+        if self._session_factory is None:
+            from config.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="chat-record-writer", daemon=True)
+            self._thread.start()
+
+    def record(self, session_id: Optional[str], messages: str) -> bool:
+        """Enqueue a chat record, never blocks. Returns False if the row was dropped"""
+        # 入队时记录时间，批量写入时的数据库时间会晚于实际请求时间
+        row = {"session_id": session_id, "messages": messages, "created_at": utcnow()}
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            pass
+        if self.overflow == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                RECORDS_DROPPED.inc(reason="overflow")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(row)
+                return True
+            except queue.Full:
+                pass
+        RECORDS_DROPPED.inc(reason="overflow")
+        logging.warning("Chat record queue is full, dropping record")
+        return False
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _collect_batch(self) -> List[Dict[str, Any]]:
+        """Wait for the first row, then gather more until the batch is full or the interval elapses"""
+        batch: List[Dict[str, Any]] = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain_batch(self) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        from models.chat_record import ChatRecord
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("db.chat_record_flush"), self.session_factory() as db:
+                    # 一次 executemany 写入整批记录
+                    db.bulk_insert_mappings(ChatRecord, rows)
+                    db.commit()
+                RECORDS_WRITTEN.inc(len(rows))
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    RECORDS_DROPPED.inc(len(rows), reason="db_error")
+                    print(f"Error writing {len(rows)} chat records: {str(e)}")
+                    return
+                time.sleep(min(2 ** attempt * 0.5, 5))
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+        # 停止时写完剩余的记录
+        while batch := self._drain_batch():
+            self._flush(batch)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the writer after flushing every queued record, waiting at most `timeout` seconds"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._stop_event.set()
+        thread.join(timeout if timeout is not None else self.drain_timeout)
+        if thread.is_alive():
+            logging.warning(f"Chat record writer did not drain in time, {self.pending()} records left")
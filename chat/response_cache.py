@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from config.config_manager import ConfigManager
+from utils.decorators import singleton
+from utils.lru_cache import LRUCache
+from utils.metrics import REGISTRY
+from utils.shared_state import get_shared_state
+
+CACHE_LOOKUPS = REGISTRY.counter("response_cache_lookups_total", "Semantic response cache lookups", ["result"])
+CACHE_LATENCY_SAVED = REGISTRY.counter(
+    "response_cache_latency_saved_seconds_total",
+    "Generation time the cached answers originally took",
+)
+
+
+@dataclass
+class CachedResponse:
+    """One cached answer"""
+    query: str
+    embedding: np.ndarray
+    context_key: str
+    scope: Hashable
+    answer: str
+    latency: float  # 生成这条回答原本花费的秒数
+
+
+def _normalize(vector: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def context_key(chunk_ids: Sequence[str]) -> str:
+    """Order-insensitive fingerprint of the retrieved chunks"""
+    return hashlib.sha256("\0".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+
+
+@singleton
+class ResponseCache:
+    """
+    Semantic cache of assistant answers, configured by the `response_cache` section of app.yaml.
+
+    An answer is reused when a new query's embedding is at least `similarity_threshold` cosine-similar
+    to a cached query *and* retrieval returned exactly the same chunks, so near-duplicate phrasings
+    hit while a query that would see different knowledge does not. The whole cache is dropped whenever
+    the RAG manager ingests or deletes documents, including in another worker process: the shared
+    knowledge base version is compared at most every `version_check_interval` seconds.
+    Usage:
+        cache = ResponseCache()
+        answer, embedding = cache.lookup(query, chunk_ids, scope)
+        if answer is None:
+            cache.store(query, embedding, chunk_ids, scope, answer=..., latency=...)
+    """
+
+    def __init__(self):
+        config = ConfigManager().get_app_config('response_cache') or {}
+        self.enabled = config.get('enabled', False)
+        self.similarity_threshold = config.get('similarity_threshold', 0.95)
+        self.entries: LRUCache[CachedResponse] = LRUCache(
+            max_size=config.get('max_entries', 1000),
+            ttl=config.get('ttl_seconds'),
+            on_evict=self._on_evict,
+        )
+        self._lock = threading.RLock()
+        self._ids = itertools.count()
+        # scope -> 条目 id 列表，以及按需重建的向量矩阵
+        self._scopes: Dict[Hashable, List[int]] = {}
+        self._matrices: Dict[Hashable, Tuple[List[int], np.ndarray]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved = 0.0
+        self.lookup_time = 0.0
+        self._embedding = None
+        self.version_check_interval = config.get('version_check_interval', 1.0)
+        self._knowledge_version = None
+        self._version_checked_at = 0.0
+        if self.enabled:
+            from rag.rag_manager import RAGManager
+
+            rag_manager = RAGManager()
+            # 与检索共用同一个 embedding（带内容哈希缓存），查询向量只计算一次
+            self._embedding = rag_manager.embedding
+            rag_manager.add_change_listener(self._on_knowledge_change)
+            self._knowledge_version = self._read_knowledge_version()
+
+    def _read_knowledge_version(self) -> Optional[str]:
+        """Knowledge base version in the shared state, the last known one if it cannot be read"""
+        from rag.rag_manager import KNOWLEDGE_VERSION_KEY
+
+        try:
+            return get_shared_state().get(KNOWLEDGE_VERSION_KEY)
+        except Exception as e:
+            logging.warning(f"Reading knowledge base version failed: {str(e)}")
+            return self._knowledge_version
+
+    def _on_knowledge_change(self) -> None:
+        """Change listener of this process, the new version is already published"""
+        self.invalidate()
+        self._knowledge_version = self._read_knowledge_version()
+
+    def _version_check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return False
+        self._version_checked_at = now
+        return True
+
+    def _apply_knowledge_version(self, version: Optional[str]) -> None:
+        if version != self._knowledge_version:
+            self.invalidate()
+            self._knowledge_version = version
+
+    def _check_knowledge_version(self) -> None:
+        """Drop the cache when another worker process changed the knowledge bases"""
+        if self._version_check_due():
+            self._apply_knowledge_version(self._read_knowledge_version())
+
+    async def _acheck_knowledge_version(self) -> None:
+        """Async version of `_check_knowledge_version`, the shared state (sql backend) is read in a thread"""
+        if self._version_check_due():
+            self._apply_knowledge_version(await asyncio.to_thread(self._read_knowledge_version))
+
+    def _on_evict(self, entry_id: Hashable, entry: CachedResponse) -> None:
+        with self._lock:
+            ids = self._scopes.get(entry.scope)
+            if ids is not None and entry_id in ids:
+                ids.remove(entry_id)
+            self._matrices.pop(entry.scope, None)
+
+    def _scope_matrix(self, scope: Hashable) -> Tuple[List[int], np.ndarray]:
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids, vectors = [], []
+            for entry_id in list(self._scopes.get(scope, [])):
+                entry = self.entries.get(entry_id)  # 过期条目在这里被淘汰
+                if entry is not None:
+                    ids.append(entry_id)
+                    vectors.append(entry.embedding)
+            cached = (ids, np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32))
+            self._matrices[scope] = cached
+        return cached
+
+    def _match(self, embedding: np.ndarray, key: str, scope: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            ids, matrix = self._scope_matrix(scope)
+            if not ids:
+                return None
+            similarities = matrix @ embedding
+            for idx in np.argsort(-similarities):
+                if similarities[idx] < self.similarity_threshold:
+                    break
+                entry = self.entries.get(ids[idx])
+                if entry is not None and entry.context_key == key:
+                    return entry
+            return None
+
+    def _record_lookup(self, entry: Optional[CachedResponse], started: float) -> Optional[str]:
+        with self._lock:
+            self.lookup_time += time.perf_counter() - started
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self.hits += 1
+            self.latency_saved += entry.latency
+        CACHE_LOOKUPS.inc(result="hit")
+        CACHE_LATENCY_SAVED.inc(entry.latency)
+        return entry.answer
+
+    def lookup(self, query: str, chunk_ids: Sequence[str], scope: Hashable) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Find a cached answer for the query.
+        Args:
+            query: The user query, without the injected knowledge.
+            chunk_ids: Ids of the chunks retrieved for the query.
+            scope: Anything else the answer depends on, e.g. assistant type, model and knowledge bases.
+        Returns:
+            (answer or None, query embedding to pass to `store` on a miss)
+        """
+        if not self.enabled:
+            return None, None
+        self._check_knowledge_version()
+        started = time.perf_counter()
+        try:
+            embedding = _normalize(self._embedding.embed_query(query))
+        except Exception as e:
+            logging.warning(f"Response cache lookup failed: {str(e)}")
+            return None, None
+        entry = self._match(embedding, context_key(chunk_ids), scope)
+        return self._record_lookup(entry, started), embedding
+
+    async def alookup(self, query: str, chunk_ids: Sequence[str], scope: Hashable) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Async version of `lookup`"""
+        if not self.enabled:
+            return None, None
+        await self._acheck_knowledge_version()
+        started = time.perf_counter()
+        try:
+            embedding = _normalize(await self._embedding.aembed_query(query))
+        except Exception as e:
+            logging.warning(f"Response cache lookup failed: {str(e)}")
+            return None, None
+        entry = self._match(embedding, context_key(chunk_ids), scope)
+        return self._record_lookup(entry, started), embedding
+
+    def store(self, query: str, embedding: Optional[np.ndarray], chunk_ids: Sequence[str], scope: Hashable, answer: str, latency: float) -> None:
+        """Cache an answer, `embedding` is the one returned by `lookup`"""
+        if not self.enabled or embedding is None or not answer:
+            return
+        entry = CachedResponse(
+            query=query,
+            embedding=embedding,
+            context_key=context_key(chunk_ids),
+            scope=scope,
+            answer=answer,
+            latency=latency,
+        )
+        with self._lock:
+            entry_id = next(self._ids)
+            self._scopes.setdefault(scope, []).append(entry_id)
+            self._matrices.pop(scope, None)
+            self.entries.set(entry_id, entry)
+
+    def invalidate(self) -> None:
+        """Drop every cached answer, called when the knowledge bases change"""
+        with self._lock:
+            self.entries.clear()
+            self._scopes.clear()
+            self._matrices.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+                "avg_lookup_ms": round(self.lookup_time / lookups * 1000, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
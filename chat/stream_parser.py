@@ -0,0 +1,91 @@
+import json
+
+from typing import Any, List, Optional
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally extract the top-level objects of a JSON array from a token stream.
+
+    The assistant answers with a ```json fenced array of person objects. Instead of
+    waiting for the whole completion, feed the tokens in as they arrive and every
+    object is returned as soon as its closing brace has been streamed.
+    Usage:
+        parser = JsonArrayStreamParser()
+        for token in stream:
+            for person in parser.feed(token):
+                ...
+    """
+
+    FENCE = "```json"
+
+    def __init__(self):
+        self.buffer = ""
+        self.items: List[Any] = []
+        self.finished = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start: Optional[int] = None
+
+    def _find_array_start(self) -> bool:
+        """Locate the opening bracket of the array, preferring the ```json fence"""
+        fence_idx = self.buffer.find(self.FENCE)
+        if fence_idx != -1:
+            bracket_idx = self.buffer.find("[", fence_idx + len(self.FENCE))
+        elif self.buffer.lstrip().startswith("["):
+            bracket_idx = self.buffer.find("[")
+        else:
+            # 可能是 ```json 还没有完整输出，继续等待
+            return False
+
+        if bracket_idx == -1:
+            return False
+        self._started = True
+        self._depth = 1
+        self._pos = bracket_idx + 1
+        return True
+
+    def feed(self, text: str) -> List[Any]:
+        """Append streamed text and return the objects completed by it"""
+        self.buffer += text
+        completed = []
+        if self.finished:
+            return completed
+        if not self._started and not self._find_array_start():
+            return completed
+
+        while self._pos < len(self.buffer):
+            ch = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 1 and ch == "{":
+                    self._obj_start = self._pos
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and ch == "}" and self._obj_start is not None:
+                    try:
+                        item = json.loads(self.buffer[self._obj_start:self._pos + 1])
+                        self.items.append(item)
+                        completed.append(item)
+                    except ValueError:
+                        # 模型输出的对象不是合法JSON，跳过该对象
+                        pass
+                    self._obj_start = None
+                elif self._depth == 0:
+                    self.finished = True
+                    self._pos += 1
+                    break
+            self._pos += 1
+        return completed
@@ -48,7 +48,7 @@ class ConfigManager:
         with open(app_path, 'r', encoding='utf-8') as f:
             content = f.read()
             content = os.path.expandvars(content)
-            self.app_config = yaml.safe_load(content)
+            self.app_config = yaml.safe_load(content) or {}
     
     def get_model_config(self, model_name: str) -> Optional[Dict[str, Any]]:
         """Get configuration for a specific model."""
@@ -62,6 +62,12 @@ class ConfigManager:
         """Get RAG configuration."""
         return self.rag_config
 
+    def get_app_config(self, section: Optional[str] = None) -> Dict[str, Any]:
+        """Get application configuration, or one section of it."""
+        if section is None:
+            return self.app_config
+        return self.app_config.get(section) or {}
+
     def get_online_api_key(self,model):
         """ 解析配置文件 """
         config = {}
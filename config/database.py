@@ -1,5 +1,9 @@
 import os
+import logging
+from typing import AsyncIterator, Optional
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -13,15 +17,73 @@ DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAME = os.getenv("DB_NAME", "er_chat")
 
+# 连接池配置
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+# 本地开发和测试可以显式开启 SQLite 回退，生产环境缺少 MYSQL_URL 时直接启动失败
+DB_ALLOW_SQLITE_FALLBACK = os.getenv("DB_ALLOW_SQLITE_FALLBACK", "false").lower() == "true"
+SQLITE_FALLBACK_URL = "sqlite:///./er_chat.db"
+
+
+def _database_url() -> str:
+    """Sync database URL from MYSQL_URL, the local SQLite file only when explicitly allowed"""
+    url = os.getenv("MYSQL_URL")
+    if url:
+        return url
+    if not DB_ALLOW_SQLITE_FALLBACK:
+        raise RuntimeError(
+            "MYSQL_URL is not set. Configure the database URL, or set DB_ALLOW_SQLITE_FALLBACK=true "
+            f"to use the local SQLite database {SQLITE_FALLBACK_URL} for development"
+        )
+    logging.warning(f"MYSQL_URL is not set, falling back to the local SQLite database {SQLITE_FALLBACK_URL}")
+    return SQLITE_FALLBACK_URL
+
+
 # 构建数据库URL
-DATABASE_URL = os.getenv("MYSQL_URL")
+DATABASE_URL = _database_url()
+
+
+def _to_async_url(url: str) -> str:
+    """Map a sync database URL onto the matching async driver"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "mysql":
+        return parsed.set(drivername="mysql+aiomysql").render_as_string(hide_password=False)
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    raise ValueError(f"No async driver configured for database backend: {backend}")
+
+
+def get_async_database_url() -> str:
+    """URL of the async engine, ASYNC_DATABASE_URL overrides the one derived from DATABASE_URL"""
+    return os.getenv("ASYNC_DATABASE_URL") or _to_async_url(DATABASE_URL)
+
+
+def _engine_options(url: str) -> dict:
+    """Pool and timeout options shared by the sync and async engines"""
+    if make_url(url).get_backend_name() == "sqlite":
+        # SQLite 不使用连接池参数，允许跨线程使用连接
+        return {"connect_args": {"check_same_thread": False, "timeout": DB_CONNECT_TIMEOUT}}
+    return {
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": {"connect_timeout": DB_CONNECT_TIMEOUT},
+    }
+
 
 # 创建数据库引擎
 engine = create_engine(
     DATABASE_URL,
-    echo=False,  # 设置为True可以看到SQL语句
-    pool_pre_ping=True,
-    pool_recycle=3600,
+    echo=DB_ECHO,  # 设置为True可以看到SQL语句
+    **_engine_options(DATABASE_URL),
 )
 
 # 创建会话工厂
@@ -30,10 +92,56 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # 创建基础模型类
 Base = declarative_base()
 
+# 异步引擎在第一次使用时创建，未安装异步驱动时不影响同步代码
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        # 在第一次使用时才推导异步URL，只用同步接口的后端不会因为缺少异步驱动映射而导入失败
+        async_url = get_async_database_url()
+        _async_engine = create_async_engine(
+            async_url,
+            echo=DB_ECHO,
+            **_engine_options(async_url),
+        )
+        logging.info(f"Created async database engine for {make_url(async_url).get_backend_name()}")
+    return _async_engine
+
+
+def get_async_session_factory() -> async_sessionmaker:
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(
+            bind=get_async_engine(),
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    return _async_session_factory
+
+
+async def dispose_async_engine() -> None:
+    """Close the pooled async connections, called on application shutdown"""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+
 # 依赖函数，用于获取数据库会话
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+# 依赖函数，用于在异步接口中获取数据库会话
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with get_async_session_factory()() as db:
+        yield db
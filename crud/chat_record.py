@@ -0,0 +1,141 @@
+import base64
+import json
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.chat_record import ChatRecord
+from utils.time_utils import as_naive_utc
+
+
+async def create_chat_record(db: AsyncSession, session_id: Optional[str], messages: str) -> ChatRecord:
+    """Insert one chat record and return it with its id"""
+    record = ChatRecord(session_id=session_id, messages=messages)
+    db.add(record)
+    await db.commit()
+    await db.refresh(record)
+    return record
+
+
+async def create_chat_records(db: AsyncSession, rows: Sequence[Dict[str, Any]]) -> int:
+    """Insert many chat records with a single executemany, returns the number inserted"""
+    if not rows:
+        return 0
+    await db.execute(insert(ChatRecord), list(rows))
+    await db.commit()
+    return len(rows)
+
+
+async def get_chat_record(db: AsyncSession, record_id: int) -> Optional[ChatRecord]:
+    return await db.get(ChatRecord, record_id)
+
+
+def encode_cursor(record: ChatRecord) -> str:
+    """Opaque cursor pointing just past the given record"""
+    payload = {"c": as_naive_utc(record.created_at).isoformat(), "i": record.id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return as_naive_utc(datetime.fromisoformat(payload["c"])), int(payload["i"])
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def _after_cursor(created_at: datetime, record_id: int, ascending: bool):
+    """Keyset predicate on (created_at, id), uses the composite indexes instead of OFFSET"""
+    if ascending:
+        # 前半部分让优化器可以直接在索引上做范围扫描
+        return and_(
+            ChatRecord.created_at >= created_at,
+            or_(ChatRecord.created_at > created_at, ChatRecord.id > record_id),
+        )
+    return and_(
+        ChatRecord.created_at <= created_at,
+        or_(ChatRecord.created_at < created_at, ChatRecord.id < record_id),
+    )
+
+
+async def list_chat_records(
+    db: AsyncSession,
+    session_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    is_judged: Optional[bool] = None,
+    is_used: Optional[bool] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    ascending: bool = False,
+) -> Tuple[List[ChatRecord], Optional[str]]:
+    """
+    One page of chat records ordered by (created_at, id), newest first unless `ascending`.
+    Args:
+        start/end: Half-open created_at range [start, end), naive values are taken as UTC.
+        cursor: `next_cursor` of the previous page.
+    Returns:
+        (records, cursor of the next page or None on the last page)
+    """
+    conditions = []
+    if session_id is not None:
+        conditions.append(ChatRecord.session_id == session_id)
+    if start is not None:
+        conditions.append(ChatRecord.created_at >= as_naive_utc(start))
+    if end is not None:
+        conditions.append(ChatRecord.created_at < as_naive_utc(end))
+    if is_judged is not None:
+        conditions.append(ChatRecord.is_judged == is_judged)
+    if is_used is not None:
+        conditions.append(ChatRecord.is_used == is_used)
+    if cursor:
+        conditions.append(_after_cursor(*decode_cursor(cursor), ascending))
+
+    order = (ChatRecord.created_at.asc(), ChatRecord.id.asc()) if ascending else (ChatRecord.created_at.desc(), ChatRecord.id.desc())
+    # 多取一条判断是否还有下一页
+    result = await db.execute(select(ChatRecord).where(*conditions).order_by(*order).limit(limit + 1))
+    records = list(result.scalars().all())
+    if len(records) > limit:
+        records = records[:limit]
+        return records, encode_cursor(records[-1])
+    return records, None
+
+
+async def list_unjudged_chat_records(db: AsyncSession, limit: int = 100) -> List[ChatRecord]:
+    """Oldest chat records that have not been judged yet"""
+    result = await db.execute(
+        select(ChatRecord)
+        .where(ChatRecord.is_judged.is_(False))
+        .order_by(ChatRecord.id)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def mark_chat_records(
+    db: AsyncSession,
+    record_ids: Sequence[int],
+    is_judged: Optional[bool] = None,
+    is_used: Optional[bool] = None,
+) -> int:
+    """Update the judged/used flags of the given records, returns the number of rows changed"""
+    values = {}
+    if is_judged is not None:
+        values["is_judged"] = is_judged
+    if is_used is not None:
+        values["is_used"] = is_used
+    if not record_ids or not values:
+        return 0
+    result = await db.execute(update(ChatRecord).where(ChatRecord.id.in_(record_ids)).values(**values))
+    await db.commit()
+    return result.rowcount
+
+
+async def delete_chat_records_before(db: AsyncSession, before: datetime) -> int:
+    """Delete chat records created before the given time, returns the number deleted"""
+    result = await db.execute(delete(ChatRecord).where(ChatRecord.created_at < as_naive_utc(before)))
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,34 @@
+# 多进程部署：gunicorn 管理多个 uvicorn worker，充分利用多核
+# 启动：gunicorn api:app -c gunicorn.conf.py
+# 多 worker 时 config/app.yaml 中 memory.backend、shared_state.backend 需设为 sql，
+# 否则会话记忆、入库任务状态只在各自进程内可见；
+# 关键词索引（SQLite）和文档清单带文件锁，可以多进程共享，
+# 本地向量库（vector_db.type: local）只能由一个进程读写，此时只能用单个 worker
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# 默认每个 CPU 核心一个 worker，可用 WEB_CONCURRENCY 覆盖
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# 不在 master 中预加载应用：Milvus、模型客户端的连接和线程不能跨 fork 共享，
+# 每个 worker 在 lifespan 中自行预热
+preload_app = False
+# 预热会连接向量库、加载模型客户端，留足启动时间
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """Refuse to start several workers on the in-process vector store, each worker would write its own copy"""
+    from config.config_manager import ConfigManager
+
+    vector_db_type = (ConfigManager().get_rag_config().get('vector_db') or {}).get('type', 'milvus')
+    if server.cfg.workers > 1 and vector_db_type == 'local':
+        raise RuntimeError(
+            f"vector_db.type 'local' supports a single worker process, got workers={server.cfg.workers}. "
+            "Set WEB_CONCURRENCY=1 or use the milvus vector database"
+        )
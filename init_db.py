@@ -1,6 +1,8 @@
 import json
 from config.database import engine, Base
 from models.chat_record import ChatRecord
+from models.chat_session import ChatSession, ChatSessionMessage
+from models.shared_state import SharedStateEntry
 
 
 def init_database():
@@ -12,6 +12,8 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from config.database import DATABASE_URL, Base
 from models.chat_record import ChatRecord  # 导入所有模型
+from models.chat_session import ChatSession, ChatSessionMessage
+from models.shared_state import SharedStateEntry
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,49 @@
+"""Add chat session memory tables
+
+Revision ID: 3a9c1e7b5d42
+Revises: 0f225353e1db
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a9c1e7b5d42'
+down_revision: Union[str, Sequence[str], None] = '0f225353e1db'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'chat_sessions',
+        sa.Column('session_id', sa.String(length=255), nullable=False, comment='会话ID'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True, comment='创建时间'),
+        sa.Column('last_active_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True, comment='最近活跃时间'),
+        sa.PrimaryKeyConstraint('session_id'),
+    )
+    op.create_index(op.f('ix_chat_sessions_last_active_at'), 'chat_sessions', ['last_active_at'], unique=False)
+    op.create_table(
+        'chat_session_messages',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('session_id', sa.String(length=255), nullable=False, comment='会话ID'),
+        sa.Column('role', sa.String(length=32), nullable=False, comment='消息类型，如 system/human/ai'),
+        sa.Column('message', sa.Text(), nullable=False, comment='LangChain 消息序列化后的JSON'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True, comment='创建时间'),
+        sa.ForeignKeyConstraint(['session_id'], ['chat_sessions.session_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_chat_session_messages_session_id'), 'chat_session_messages', ['session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_chat_session_messages_session_id'), table_name='chat_session_messages')
+    op.drop_table('chat_session_messages')
+    op.drop_index(op.f('ix_chat_sessions_last_active_at'), table_name='chat_sessions')
+    op.drop_table('chat_sessions')
@@ -0,0 +1,67 @@
+"""Add chat record pagination indexes
+
+Revision ID: 7c4e2b9f1a63
+Revises: 3a9c1e7b5d42
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e2b9f1a63'
+down_revision: Union[str, Sequence[str], None] = '3a9c1e7b5d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 之前添加字段时没有默认值，老数据为 NULL，按状态过滤时会漏掉
+    op.execute("UPDATE chat_records SET is_judged = false WHERE is_judged IS NULL")
+    op.execute("UPDATE chat_records SET is_used = false WHERE is_used IS NULL")
+    with op.batch_alter_table('chat_records') as batch_op:
+        batch_op.alter_column(
+            'is_judged',
+            existing_type=sa.Boolean(),
+            nullable=False,
+            server_default=sa.false(),
+            existing_comment='是否已经被判断过',
+        )
+        batch_op.alter_column(
+            'is_used',
+            existing_type=sa.Boolean(),
+            nullable=False,
+            server_default=sa.false(),
+            existing_comment='是否被使用',
+        )
+    op.create_index('ix_chat_records_session_id_created_at', 'chat_records', ['session_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_chat_records_is_judged_created_at', 'chat_records', ['is_judged', 'created_at', 'id'], unique=False)
+    op.create_index('ix_chat_records_is_used_created_at', 'chat_records', ['is_used', 'created_at', 'id'], unique=False)
+    op.create_index('ix_chat_records_created_at', 'chat_records', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chat_records_created_at', table_name='chat_records')
+    op.drop_index('ix_chat_records_is_used_created_at', table_name='chat_records')
+    op.drop_index('ix_chat_records_is_judged_created_at', table_name='chat_records')
+    op.drop_index('ix_chat_records_session_id_created_at', table_name='chat_records')
+    with op.batch_alter_table('chat_records') as batch_op:
+        batch_op.alter_column(
+            'is_used',
+            existing_type=sa.Boolean(),
+            nullable=True,
+            server_default=None,
+            existing_comment='是否被使用',
+        )
+        batch_op.alter_column(
+            'is_judged',
+            existing_type=sa.Boolean(),
+            nullable=True,
+            server_default=None,
+            existing_comment='是否已经被判断过',
+        )
@@ -0,0 +1,37 @@
+"""Add shared state table
+
+Revision ID: b5d8e2a4c9f0
+Revises: 7c4e2b9f1a63
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d8e2a4c9f0'
+down_revision: Union[str, Sequence[str], None] = '7c4e2b9f1a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'shared_state',
+        sa.Column('key', sa.String(length=255), nullable=False, comment='键'),
+        sa.Column('value', sa.Text(), nullable=False, comment='值，JSON格式'),
+        sa.Column('expires_at', sa.DateTime(), nullable=True, comment='过期时间（UTC），为空表示不过期'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True, comment='更新时间'),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(op.f('ix_shared_state_expires_at'), 'shared_state', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_shared_state_expires_at'), table_name='shared_state')
+    op.drop_table('shared_state')
@@ -0,0 +1,46 @@
+"""Make chat record created_at not null
+
+Revision ID: d3a7f1c5b9e2
+Revises: b5d8e2a4c9f0
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a7f1c5b9e2'
+down_revision: Union[str, Sequence[str], None] = 'b5d8e2a4c9f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("UPDATE chat_records SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    if op.get_bind().dialect.name == "sqlite":
+        # server_default 写入的是 "YYYY-MM-DD HH:MM:SS"，补齐为 SQLAlchemy 的存储格式，与游标按字符串比较时才一致
+        op.execute("UPDATE chat_records SET created_at = created_at || '.000000' WHERE length(created_at) = 19")
+    with op.batch_alter_table('chat_records') as batch_op:
+        batch_op.alter_column(
+            'created_at',
+            existing_type=sa.DateTime(timezone=True),
+            nullable=False,
+            existing_server_default=sa.text('(CURRENT_TIMESTAMP)'),
+            existing_comment='创建时间',
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('chat_records') as batch_op:
+        batch_op.alter_column(
+            'created_at',
+            existing_type=sa.DateTime(timezone=True),
+            nullable=True,
+            existing_server_default=sa.text('(CURRENT_TIMESTAMP)'),
+            existing_comment='创建时间',
+        )
@@ -0,0 +1,30 @@
+"""Add chat record judge lease
+
+Revision ID: f2b6c8d4a1e7
+Revises: d3a7f1c5b9e2
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6c8d4a1e7'
+down_revision: Union[str, Sequence[str], None] = 'd3a7f1c5b9e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('chat_records') as batch_op:
+        batch_op.add_column(sa.Column('judge_lease_until', sa.DateTime(), nullable=True, comment='判断任务租约到期时间（UTC），为空表示未被认领'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('chat_records') as batch_op:
+        batch_op.drop_column('judge_lease_until')
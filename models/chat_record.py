@@ -1,18 +1,29 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Index
+from sqlalchemy.sql import func, false
 from config.database import Base
+from utils.time_utils import utcnow
 
 
 class ChatRecord(Base):
     """聊天记录模型"""
     __tablename__ = "chat_records"
+    # 复合索引支持按会话、审核状态分页，(created_at, id) 作为游标分页的排序键
+    __table_args__ = (
+        Index("ix_chat_records_session_id_created_at", "session_id", "created_at", "id"),
+        Index("ix_chat_records_is_judged_created_at", "is_judged", "created_at", "id"),
+        Index("ix_chat_records_is_used_created_at", "is_used", "created_at", "id"),
+        Index("ix_chat_records_created_at", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     session_id = Column(String(255), nullable=True, index=True, comment="会话ID")
     messages = Column(Text, nullable=False, comment="消息历史，JSON格式")
-    is_judged = Column(Boolean, default=False, comment="是否已经被判断过")
-    is_used = Column(Boolean, default=False, comment="是否被使用")
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    is_judged = Column(Boolean, default=False, server_default=false(), nullable=False, comment="是否已经被判断过")
+    is_used = Column(Boolean, default=False, server_default=false(), nullable=False, comment="是否被使用")
+    # 判断 worker 认领记录后写入租约到期时间，worker 崩溃时租约过期后记录会被重新认领
+    judge_lease_until = Column(DateTime, nullable=True, comment="判断任务租约到期时间（UTC），为空表示未被认领")
+    # 所有插入路径都由 Python 写入不带时区的UTC时间，SQLite 中存储格式统一，游标比较才准确
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), nullable=False, comment="创建时间")
 
     def __repr__(self):
         return f"<ChatRecord(id={self.id}, session_id='{self.session_id}', is_judged={self.is_judged}, is_used={self.is_used}, created_at='{self.created_at}')>" 
\ No newline at end of file
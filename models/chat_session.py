@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from config.database import Base
+
+
+class ChatSession(Base):
+    """会话记忆模型，记录会话的最近活跃时间，用于TTL淘汰"""
+    __tablename__ = "chat_sessions"
+
+    session_id = Column(String(255), primary_key=True, comment="会话ID")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    last_active_at = Column(DateTime(timezone=True), server_default=func.now(), index=True, comment="最近活跃时间")
+
+    def __repr__(self):
+        return f"<ChatSession(session_id='{self.session_id}', last_active_at='{self.last_active_at}')>"
+
+
+class ChatSessionMessage(Base):
+    """会话记忆中的单条消息"""
+    __tablename__ = "chat_session_messages"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(255), ForeignKey("chat_sessions.session_id", ondelete="CASCADE"), nullable=False, index=True, comment="会话ID")
+    role = Column(String(32), nullable=False, comment="消息类型，如 system/human/ai")
+    message = Column(Text, nullable=False, comment="LangChain 消息序列化后的JSON")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+
+    def __repr__(self):
+        return f"<ChatSessionMessage(id={self.id}, session_id='{self.session_id}', role='{self.role}')>"
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy.sql import func
+from config.database import Base
+
+
+class SharedStateEntry(Base):
+    """多 worker 共享的键值状态，如入库任务进度、知识库版本号"""
+    __tablename__ = "shared_state"
+
+    key = Column(String(255), primary_key=True, comment="键")
+    value = Column(Text, nullable=False, comment="值，JSON格式")
+    expires_at = Column(DateTime, nullable=True, index=True, comment="过期时间（UTC），为空表示不过期")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    def __repr__(self):
+        return f"<SharedStateEntry(key='{self.key}', expires_at='{self.expires_at}')>"
@@ -0,0 +1,295 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+from utils.lru_cache import LRUCache
+from utils.metrics import run_in_executor
+
+
+def _encode_vector(vector: Sequence[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def _decode_vector(blob: bytes) -> List[float]:
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class SQLiteEmbeddingStore:
+    """
+    On-disk embedding tier, vectors are stored as float32 blobs in a SQLite file.
+
+    Eviction is approximate LRU and runs in bulk: once the table grows past `max_entries` plus
+    `evict_slack`, the least recently used rows are deleted until it is `evict_slack` below the limit.
+    Read hits only buffer their access time, the buffer is written with the next insert, every
+    `touch_batch` hits or after `touch_interval` seconds, so reads do not commit.
+    Args:
+        path: Path of the SQLite database file, created if missing.
+        max_entries: Maximum number of vectors kept on disk, least recently used are evicted.
+        evict_slack: Fraction of `max_entries` used as the high/low-water margin of eviction.
+        touch_batch: Number of buffered access times that triggers a write.
+        touch_interval: Seconds after which buffered access times are written.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: Optional[int] = None,
+        evict_slack: float = 0.05,
+        touch_batch: int = 1024,
+        touch_interval: float = 30.0,
+    ):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_slack = evict_slack
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        # 行数上界：插入时按条数累加（覆盖已有键也计入），超过高水位时再精确计数
+        self._row_estimate = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        # 尚未写入的访问时间，key -> last_access
+        self._touched: Dict[str, float] = {}
+        self._touched_at = time.monotonic()
+
+    def _high_water(self) -> int:
+        return self.max_entries + max(1, int(self.max_entries * self.evict_slack))
+
+    def _low_water(self) -> int:
+        return max(0, self.max_entries - int(self.max_entries * self.evict_slack))
+
+    def _flush_touched(self) -> None:
+        """Write the buffered access times, the caller holds the lock and commits"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(last_access, key) for key, last_access in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touched_at = time.monotonic()
+
+    def _evict(self) -> None:
+        """Delete the least recently used rows down to the low-water mark, the caller holds the lock"""
+        self._row_estimate = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._row_estimate <= self._high_water():
+            return
+        excess = self._row_estimate - self._low_water()
+        # 按 last_access 索引升序只扫描需要淘汰的行
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._row_estimate -= excess
+        logging.info(f"Evicted {excess} vectors from the embedding disk cache")
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # SQLite 单条语句的参数个数有限制，分批查询
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update({key: _decode_vector(blob) for key, blob in rows})
+            if found:
+                now = time.time()
+                self._touched.update((key, now) for key in found)
+                if len(self._touched) >= self.touch_batch or time.monotonic() - self._touched_at >= self.touch_interval:
+                    self._flush_touched()
+                    self._conn.commit()
+        return found
+
+    def set_many(self, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._flush_touched()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, _encode_vector(vector), now) for key, vector in items.items()],
+            )
+            self._row_estimate += len(items)
+            if self.max_entries and self._row_estimate > self._high_water():
+                self._evict()
+            self._conn.commit()
+
+    def flush(self) -> None:
+        """Write the buffered access times"""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._row_estimate = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-hash keyed cache in front of another `Embeddings` implementation.
+
+    Lookups go through an in-process LRU tier first, then the optional on-disk tier,
+    and only the texts missing from both are sent to the underlying model.
+    Args:
+        underlying: The embedding model to cache, e.g. DashScopeEmbeddings.
+        namespace: Part of the cache key, use the model name so different models never share vectors.
+        max_entries: Size of the in-process LRU tier.
+        disk_store: Optional on-disk tier.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        namespace: str = "",
+        max_entries: int = 10000,
+        disk_store: Optional[SQLiteEmbeddingStore] = None,
+    ):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.memory_cache: LRUCache[List[float]] = LRUCache(max_size=max_entries)
+        self.disk_store = disk_store
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str, kind: str) -> str:
+        # query 和 document 的向量可能不同（如 DashScope 的 text_type），需要分开缓存
+        return hashlib.sha256(f"{self.namespace}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup_memory(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for key in keys:
+            vector = self.memory_cache.get(key)
+            if vector is not None:
+                found[key] = vector
+        return found
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, List[float]]:
+        try:
+            return self.disk_store.get_many(keys)
+        except Exception as e:
+            logging.warning(f"Embedding disk cache read failed: {str(e)}")
+            return {}
+
+    def _write_disk(self, items: Dict[str, List[float]]) -> None:
+        try:
+            self.disk_store.set_many(items)
+        except Exception as e:
+            logging.warning(f"Embedding disk cache write failed: {str(e)}")
+
+    def _remember(self, items: Dict[str, List[float]]) -> None:
+        for key, vector in items.items():
+            self.memory_cache.set(key, vector)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = self._lookup_memory(keys)
+        missing = [key for key in keys if key not in found]
+        if missing and self.disk_store is not None:
+            from_disk = self._read_disk(missing)
+            self._remember(from_disk)
+            found.update(from_disk)
+        return found
+
+    async def _alookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = self._lookup_memory(keys)
+        missing = [key for key in keys if key not in found]
+        if missing and self.disk_store is not None:
+            # 磁盘层是带锁的同步 SQLite 查询，放到线程池执行，事件循环上只做内存 LRU 查找
+            from_disk = await run_in_executor(None, self._read_disk, missing)
+            self._remember(from_disk)
+            found.update(from_disk)
+        return found
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        self._remember(items)
+        if self.disk_store is not None:
+            self._write_disk(items)
+
+    async def _astore(self, items: Dict[str, List[float]]) -> None:
+        self._remember(items)
+        if self.disk_store is not None:
+            # 写入、提交和淘汰都在线程池中进行
+            await run_in_executor(None, self._write_disk, items)
+
+    def _pending(self, keys: List[str], texts: List[str], cached: Dict[str, List[float]]) -> Dict[str, str]:
+        """Unique texts that still need embedding, keyed by cache key"""
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                pending.setdefault(key, text)
+        self.hits += len(texts) - len(pending)
+        self.misses += len(pending)
+        return pending
+
+    def _split(self, texts: List[str], kind: str):
+        """Return (keys, cached vectors, unique texts that still need embedding)"""
+        keys = [self._key(text, kind) for text in texts]
+        cached = self._lookup(list(dict.fromkeys(keys)))
+        return keys, cached, self._pending(keys, texts, cached)
+
+    async def _asplit(self, texts: List[str], kind: str):
+        """Async `_split`, the disk tier is queried in the default executor"""
+        keys = [self._key(text, kind) for text in texts]
+        cached = await self._alookup(list(dict.fromkeys(keys)))
+        return keys, cached, self._pending(keys, texts, cached)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, pending = self._split(texts, "document")
+        if pending:
+            vectors = self.underlying.embed_documents(list(pending.values()))
+            computed = dict(zip(pending.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, cached, pending = self._split([text], "query")
+        if pending:
+            vector = self.underlying.embed_query(text)
+            self._store({keys[0]: vector})
+            return vector
+        return cached[keys[0]]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, pending = await self._asplit(texts, "document")
+        if pending:
+            vectors = await self.underlying.aembed_documents(list(pending.values()))
+            computed = dict(zip(pending.keys(), vectors))
+            await self._astore(computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, cached, pending = await self._asplit([text], "query")
+        if pending:
+            vector = await self.underlying.aembed_query(text)
+            await self._astore({keys[0]: vector})
+            return vector
+        return cached[keys[0]]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self.memory_cache)}
@@ -0,0 +1,181 @@
+import logging
+import shutil
+import threading
+import time
+import uuid
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.config_manager import ConfigManager
+from rag.ingestion import IngestionStats
+from utils.decorators import singleton
+from utils.lru_cache import LRUCache
+from utils.shared_state import get_shared_state
+
+
+@dataclass
+class IngestJob:
+    """Status of one background document ingestion"""
+    id: str
+    filename: str
+    doc_id: str
+    knowledge_base: str
+    status: str = "pending"  # pending / running / succeeded / failed / cancelled
+    documents_loaded: int = 0
+    chunks_embedded: int = 0
+    chunks_inserted: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    errors: List[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def update_progress(self, stats: IngestionStats) -> None:
+        self.documents_loaded = stats.documents_loaded
+        self.chunks_embedded = stats.chunks_embedded
+        self.chunks_inserted = stats.chunks_inserted
+        self.chunks_unchanged = stats.chunks_unchanged
+        self.chunks_deleted = stats.chunks_deleted
+        self.errors = list(stats.errors)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "doc_id": self.doc_id,
+            "knowledge_base": self.knowledge_base,
+            "status": self.status,
+            "documents_loaded": self.documents_loaded,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_inserted": self.chunks_inserted,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_deleted": self.chunks_deleted,
+            "errors": list(self.errors),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IngestJob":
+        return cls(**data)
+
+
+@singleton
+class IngestJobManager:
+    """
+    Runs document ingestion in the background on a worker pool sized from rag.yaml.
+    Job status is also published to the shared state (throttled while running), so with several
+    worker processes any worker can answer a status query for a job another worker runs.
+    Usage:
+        job = IngestJobManager().submit(path, filename, doc_id="default", knowledge_base="default")
+        IngestJobManager().get(job.id).status
+    """
+
+    def __init__(self):
+        ingestion_config = ConfigManager().get_rag_config().get('ingestion') or {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=ingestion_config.get('job_workers', 2),
+            thread_name_prefix="ingest-job",
+        )
+        # 只保留最近的任务状态，避免无限增长
+        self.jobs: LRUCache[IngestJob] = LRUCache(max_size=ingestion_config.get('max_jobs_kept', 1000))
+        self.shared_state = get_shared_state()
+        self.status_ttl = ingestion_config.get('job_status_ttl', 86400)
+        self.publish_interval = ingestion_config.get('job_status_publish_interval', 1.0)
+        self._last_published: Dict[str, float] = {}
+        # 尚未开始的任务，job_id -> (future, job, cleanup_dir)，关闭时用于标记取消并清理上传目录
+        self._queued: Dict[str, Tuple[Future, IngestJob, Optional[str]]] = {}
+        self._queued_lock = threading.Lock()
+
+    def _shared_key(self, job_id: str) -> str:
+        return f"ingest_job:{job_id}"
+
+    def _publish(self, job: IngestJob, force: bool = False) -> None:
+        """Write the job status to the shared state, progress updates at most every `publish_interval` seconds"""
+        now = time.monotonic()
+        if not force and now - self._last_published.get(job.id, 0.0) < self.publish_interval:
+            return
+        self._last_published[job.id] = now
+        try:
+            self.shared_state.set(self._shared_key(job.id), job.to_dict(), ttl=self.status_ttl)
+        except Exception as e:
+            print(f"Error publishing ingest job status: {str(e)}")
+
+    def submit(self, file_path: str, filename: str, doc_id: str, knowledge_base: str, cleanup_dir: Optional[str] = None) -> IngestJob:
+        """
+        Enqueue a file for ingestion and return immediately.
+        Args:
+            file_path: Path of the file to ingest.
+            filename: Original file name, shown in the job status.
+            doc_id: Document id, prefix of the chunk ids.
+            knowledge_base: Knowledge base the chunks belong to.
+            cleanup_dir: Directory removed once the job has finished, e.g. the upload temp dir.
+        """
+        job = IngestJob(id=uuid.uuid4().hex, filename=filename, doc_id=doc_id, knowledge_base=knowledge_base)
+        self.jobs.set(job.id, job)
+        self._publish(job, force=True)
+        with self._queued_lock:
+            # 持有锁提交，_run 开始时一定能找到并移除这条记录
+            self._queued[job.id] = (self.executor.submit(self._run, job, file_path, cleanup_dir), job, cleanup_dir)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        """Status of a job, jobs of other worker processes are read from the shared state"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        data = self.shared_state.get(self._shared_key(job_id))
+        return IngestJob.from_dict(data) if data else None
+
+    def _run(self, job: IngestJob, file_path: str, cleanup_dir: Optional[str]) -> None:
+        from rag.rag_manager import RAGManager
+
+        def on_progress(stats: IngestionStats) -> None:
+            job.update_progress(stats)
+            self._publish(job)
+
+        with self._queued_lock:
+            self._queued.pop(job.id, None)
+        job.status = "running"
+        job.started_at = time.time()
+        self._publish(job, force=True)
+        try:
+            stats = RAGManager().ingest_document(
+                file_path,
+                doc_id=job.doc_id,
+                knowledge_base=job.knowledge_base,
+                progress_callback=on_progress,
+            )
+            job.update_progress(stats)
+            job.status = "failed" if stats.errors else "succeeded"
+        except Exception as e:
+            logging.error(f"Ingest job {job.id} failed: {str(e)}")
+            job.errors.append(str(e))
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            self._publish(job, force=True)
+            self._last_published.pop(job.id, None)
+            if cleanup_dir:
+                shutil.rmtree(cleanup_dir, ignore_errors=True)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop the worker pool, without `wait` the queued jobs are cancelled and published as such"""
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        with self._queued_lock:
+            queued, self._queued = self._queued, {}
+        for future, job, cleanup_dir in queued.values():
+            # 已经开始运行的任务由 _run 自己收尾
+            if not future.cancelled():
+                continue
+            job.status = "cancelled"
+            job.errors.append("Cancelled because the server shut down before the job started")
+            job.finished_at = time.time()
+            self._publish(job, force=True)
+            self._last_published.pop(job.id, None)
+            if cleanup_dir:
+                shutil.rmtree(cleanup_dir, ignore_errors=True)
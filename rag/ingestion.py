@@ -0,0 +1,273 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+# 参与分块ID计算的元数据，行号、页码等位置信息不计入，删除一行或一页不会让后面所有分块的ID都变化
+STABLE_METADATA_KEYS = ("source", "knowledge_base", "sheet_name", "fields")
+
+# chunk_id 中哈希的长度（十六进制字符数）
+CHUNK_HASH_LENGTH = 24
+
+
+def chunk_id(id_prefix: str, document: Document) -> str:
+    """
+    `{id_prefix}-{hash}` of the chunk content and its `STABLE_METADATA_KEYS`, the same chunk always gets the
+    same id wherever it sits in the document. Positional metadata (row_number, page, ...) of an unchanged
+    chunk therefore keeps the value it was first stored with.
+    """
+    stable = {key: document.metadata[key] for key in STABLE_METADATA_KEYS if key in document.metadata}
+    digest = hashlib.sha256()
+    digest.update(document.page_content.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return f"{id_prefix}-{digest.hexdigest()[:CHUNK_HASH_LENGTH]}"
+
+
+@dataclass
+class IngestionStats:
+    """Progress counters of one ingestion run"""
+    documents_loaded: int = 0
+    chunks_embedded: int = 0
+    chunks_inserted: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    errors: List[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    # 本次入库产生的全部分块ID（包括未变化而跳过的），用于更新文档清单
+    chunk_ids: List[str] = field(default_factory=list, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def add_error(self, error: str) -> None:
+        with self._lock:
+            self.errors.append(error)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Inserted chunks per second"""
+        return self.chunks_inserted / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "documents_loaded": self.documents_loaded,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_inserted": self.chunks_inserted,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_deleted": self.chunks_deleted,
+            "errors": list(self.errors),
+            "elapsed_seconds": round(self.elapsed, 3),
+            "chunks_per_second": round(self.throughput, 2),
+        }
+
+
+class IngestionPipeline:
+    """
+    Streaming load → chunk → embed → insert pipeline with bounded memory.
+
+    Documents are consumed lazily and grouped into batches of `batch_size` chunks.
+    Each batch is embedded and inserted on a thread pool; at most `max_pending_batches`
+    batches are in flight, so a slow embedding service applies backpressure on loading
+    instead of letting chunks pile up in memory.
+    Args:
+        vector_db: Vector store, `add_embeddings` is used when available, otherwise `add_documents`.
+        embedding: Embedding model used with `add_embeddings`.
+        chunker: Callable turning a stream of documents into a stream of chunks, None inserts documents as-is.
+                 It receives the whole stream, so records can be packed across documents.
+        batch_size: Number of chunks per embedding/insert batch.
+        max_workers: Number of batches processed concurrently.
+        max_pending_batches: Maximum number of submitted but unfinished batches.
+        progress_callback: Called with the `IngestionStats` after every finished batch.
+        progress_interval: Log progress every N finished batches.
+        on_batch_inserted: Called with (ids, documents) after each batch is inserted,
+                           used to keep secondary indexes in sync.
+    """
+
+    def __init__(
+        self,
+        vector_db,
+        embedding: Optional[Embeddings] = None,
+        chunker: Optional[Callable[[Iterable[Document]], Iterable[Document]]] = None,
+        batch_size: int = 64,
+        max_workers: int = 4,
+        max_pending_batches: Optional[int] = None,
+        progress_callback: Optional[Callable[[IngestionStats], None]] = None,
+        progress_interval: int = 10,
+        on_batch_inserted: Optional[Callable[[List[str], List[Document]], None]] = None,
+    ):
+        self.vector_db = vector_db
+        self.embedding = embedding
+        self.chunker = chunker
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_pending_batches = max_pending_batches or self.max_workers * 2
+        self.progress_callback = progress_callback
+        self.progress_interval = max(1, progress_interval)
+        self.on_batch_inserted = on_batch_inserted
+
+    def _iter_chunks(self, documents: Iterable[Document], stats: IngestionStats) -> Iterator[Document]:
+        def counted() -> Iterator[Document]:
+            for document in documents:
+                stats.add(documents_loaded=1)
+                yield document
+
+        if self.chunker is None:
+            yield from counted()
+        else:
+            yield from self.chunker(counted())
+
+    def _iter_new_chunks(
+        self,
+        chunks: Iterator[Document],
+        id_prefix: str,
+        existing_ids: Collection[str],
+        stats: IngestionStats,
+    ) -> Iterator[Tuple[Document, str]]:
+        """Assign content ids to the chunks and skip those already stored"""
+        occurrences: Dict[str, int] = {}
+        for chunk in chunks:
+            base_id = chunk_id(id_prefix, chunk)
+            # 同一文档中完全相同的分块按出现次序区分
+            count = occurrences.get(base_id, 0)
+            occurrences[base_id] = count + 1
+            unique_id = base_id if count == 0 else f"{base_id}-{count}"
+            stats.chunk_ids.append(unique_id)
+            if unique_id in existing_ids:
+                stats.add(chunks_unchanged=1)
+                continue
+            yield chunk, unique_id
+
+    def _iter_batches(self, chunks: Iterator[Tuple[Document, str]]) -> Iterator[Tuple[List[Document], List[str]]]:
+        while True:
+            batch = list(islice(chunks, self.batch_size))
+            if not batch:
+                return
+            yield [chunk for chunk, _ in batch], [unique_id for _, unique_id in batch]
+
+    def _process_batch(self, documents: List[Document], ids: List[str], stats: IngestionStats) -> None:
+        if self.embedding is not None and hasattr(self.vector_db, "add_embeddings"):
+            texts = [doc.page_content for doc in documents]
+            vectors = self.embedding.embed_documents(texts)
+            stats.add(chunks_embedded=len(documents))
+            self.vector_db.add_embeddings(
+                texts=texts,
+                embeddings=vectors,
+                metadatas=[doc.metadata for doc in documents],
+                ids=ids,
+            )
+        else:
+            # 向量库内部完成 embedding 和写入
+            self.vector_db.add_documents(documents=documents, ids=ids)
+            stats.add(chunks_embedded=len(documents))
+        stats.add(chunks_inserted=len(documents))
+        if self.on_batch_inserted:
+            self.on_batch_inserted(ids, documents)
+
+    def _on_batch_done(self, future: Future, stats: IngestionStats, batches_done: int) -> bool:
+        """Collect a finished batch, returns False if it failed"""
+        try:
+            future.result()
+        except Exception as e:
+            stats.add_error(str(e))
+            logging.error(f"Ingestion batch failed: {str(e)}")
+            return False
+        if self.progress_callback:
+            self.progress_callback(stats)
+        if batches_done % self.progress_interval == 0:
+            logging.info(
+                f"Ingestion progress: {stats.chunks_inserted} chunks inserted, "
+                f"{stats.throughput:.1f} chunks/s"
+            )
+        return True
+
+    def run(
+        self,
+        documents: Iterable[Document],
+        id_prefix: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        existing_ids: Optional[Collection[str]] = None,
+    ) -> IngestionStats:
+        """
+        Ingest documents, chunk ids are `{id_prefix}-{content hash}` (see `chunk_id`).
+        Args:
+            documents: Iterable of documents, consumed lazily.
+            id_prefix: Prefix of the generated chunk ids, usually the doc_id.
+            metadata: Extra metadata set on every chunk, e.g. knowledge_base.
+            existing_ids: Chunk ids already stored, those chunks are neither embedded nor inserted again.
+        Returns:
+            The final `IngestionStats`, a failed run stops early and lists its errors.
+        """
+        stats = IngestionStats()
+        chunks = self._iter_chunks(documents, stats)
+        if metadata:
+            chunks = (self._with_metadata(chunk, metadata) for chunk in chunks)
+        batches = self._iter_batches(self._iter_new_chunks(chunks, id_prefix, existing_ids or (), stats))
+        batches_done = 0
+        pending: "deque[Future]" = deque()
+
+        try:
+            # 第一批同步处理，保证向量库的集合在并发写入前已经创建
+            first = next(batches, None)
+            if first is not None:
+                try:
+                    self._process_batch(first[0], first[1], stats)
+                    batches_done += 1
+                    if self.progress_callback:
+                        self.progress_callback(stats)
+                except Exception as e:
+                    stats.add_error(str(e))
+                    logging.error(f"Ingestion batch failed: {str(e)}")
+                    return stats
+
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest") as executor:
+                failed = False
+                for batch, ids in batches:
+                    # 背压：在途批次过多时等待最早的批次完成
+                    while len(pending) >= self.max_pending_batches:
+                        batches_done += 1
+                        if not self._on_batch_done(pending.popleft(), stats, batches_done):
+                            failed = True
+                            break
+                    if failed:
+                        break
+                    pending.append(executor.submit(self._process_batch, batch, ids, stats))
+                while pending:
+                    batches_done += 1
+                    self._on_batch_done(pending.popleft(), stats, batches_done)
+        except Exception as e:
+            # 加载或分块阶段出错
+            stats.add_error(str(e))
+            logging.error(f"Ingestion failed: {str(e)}")
+        finally:
+            stats.finished_at = time.monotonic()
+
+        logging.info(
+            f"Ingestion finished: {stats.documents_loaded} documents, {stats.chunks_inserted} chunks inserted, "
+            f"{stats.chunks_unchanged} unchanged in {stats.elapsed:.1f}s ({stats.throughput:.1f} chunks/s)"
+        )
+        return stats
+
+    @staticmethod
+    def _with_metadata(document: Document, metadata: Dict[str, Any]) -> Document:
+        document.metadata.update(metadata)
+        return document
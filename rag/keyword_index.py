@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+# 英文单词/技能名（保留 c++、c#、node.js 这类写法）和连续的中日韩字符
+_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#._\-]*|[\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased ASCII words plus character bigrams of CJK runs"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group().rstrip("._-")
+        if not token:
+            continue
+        if token[0].isascii():
+            tokens.append(token)
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+def is_keyword_query(query: str, max_tokens: int = 6) -> bool:
+    """Short queries made only of exact terms (skills, MBTI, names) that BM25 answers well on its own"""
+    if re.search(r"[\u3400-\u9fff]", query):
+        return False
+    tokens = tokenize(query)
+    return 0 < len(tokens) <= max_tokens
+
+
+class BM25Index:
+    """
+    Local inverted index with BM25 scoring, kept next to the vector store.
+
+    Chunks are stored in a SQLite file with an FTS5 table over their `tokenize` output, every write
+    is committed right away and nothing but the connection is kept in memory. Ranking uses the FTS5
+    `bm25()` function (k1=1.2, b=0.75). All worker processes on a host can open the same file: WAL mode
+    lets them read while one of them writes, and a chunk indexed by one worker is searchable in the others.
+    Args:
+        path: Path of the SQLite database file, None keeps the index in memory.
+        timeout: Seconds to wait for another process's write lock.
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 30.0):
+        self.path = path
+        self._lock = threading.RLock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path or ":memory:", timeout=timeout, check_same_thread=False)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "rowid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, knowledge_base TEXT, "
+            "content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        # 存入的是 tokenize 之后以空格分隔的词，FTS5 只按空格切分，保留 c++、node.js 这类写法
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+            "tokens, tokenize = \"unicode61 remove_diacritics 0 tokenchars '+#._-'\")"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _remove(self, ids: Sequence[str]) -> None:
+        """Delete chunks by id, the caller holds the lock and commits"""
+        for start in range(0, len(ids), 500):
+            batch = list(ids[start:start + 500])
+            placeholders = ",".join("?" * len(batch))
+            rowids = [(rowid,) for rowid, in self._conn.execute(
+                f"SELECT rowid FROM chunks WHERE id IN ({placeholders})", batch
+            )]
+            self._conn.executemany("DELETE FROM chunks_fts WHERE rowid = ?", rowids)
+            self._conn.executemany("DELETE FROM chunks WHERE rowid = ?", rowids)
+
+    def add(self, ids: Sequence[str], documents: Sequence[Document]) -> None:
+        """Index documents, an existing id is replaced"""
+        ids = list(ids)
+        with self._lock:
+            try:
+                self._remove(ids)
+                for doc_id, document in zip(ids, documents):
+                    metadata = dict(document.metadata)
+                    cursor = self._conn.execute(
+                        "INSERT INTO chunks (id, knowledge_base, content, metadata) VALUES (?, ?, ?, ?)",
+                        (doc_id, metadata.get("knowledge_base"), document.page_content,
+                         json.dumps(metadata, ensure_ascii=False, default=str)),
+                    )
+                    self._conn.execute(
+                        "INSERT INTO chunks_fts (rowid, tokens) VALUES (?, ?)",
+                        (cursor.lastrowid, " ".join(tokenize(document.page_content))),
+                    )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            try:
+                self._remove(list(ids))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks_fts")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def search(
+        self,
+        query: str,
+        k: int = 4,
+        knowledge_bases: Optional[List[str]] = None,
+        filters: Optional[Dict[str, List[Any]]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the top-k (Document, BM25 score) pairs, the chunk id is in metadata['pk'].
+        Args:
+            filters: {dotted metadata key: allowed values}, e.g. {"fields.城市": ["北京"]}.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # 每个词作为一个带引号的短语，任意一个命中即可
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        sql = (
+            "SELECT c.id, c.content, c.metadata, bm25(chunks_fts) AS score "
+            "FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid "
+            "WHERE chunks_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if knowledge_bases:
+            sql += f" AND c.knowledge_base IN ({','.join('?' * len(knowledge_bases))})"
+            params.extend(knowledge_bases)
+        for key, values in (filters or {}).items():
+            # 点号分隔的键对应 JSON 路径，如 fields.城市 -> $."fields"."城市"
+            sql += f" AND json_extract(c.metadata, ?) IN ({','.join('?' * len(values))})"
+            params.append("$" + "".join(f'."{part}"' for part in key.split(".")))
+            params.extend(values)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        # bm25() 越小越相关，取反后与原来的分数方向一致
+        return [
+            (Document(page_content=content, metadata={**json.loads(metadata), "pk": doc_id}), -score)
+            for doc_id, content, metadata, score in rows
+        ]
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[Sequence[Tuple[Document, float]]], k: int = 60) -> List[Tuple[Document, float]]:
+    """
+    Fuse ranked result lists with reciprocal rank fusion, score = sum(1 / (k + rank)).
+    Documents are matched by metadata['pk'] and fall back to their content.
+    """
+    fused: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, (document, _) in enumerate(results, start=1):
+            key = str(document.metadata.get("pk") or document.page_content)
+            fused[key] += 1.0 / (k + rank)
+            documents.setdefault(key, document)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [(documents[key], score) for key, score in ranked]
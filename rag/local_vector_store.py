@@ -0,0 +1,487 @@
+import logging
+import os
+import pickle
+import re
+import threading
+import uuid
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+try:
+    import hnswlib
+except ImportError:  # hnswlib 是可选依赖，缺失时退回精确搜索
+    hnswlib = None
+
+_VECTORS_FILE = "vectors.f32"
+# 压缩后的矩阵写入新的代号文件 vectors.<n>.f32，由元数据引用
+_VECTORS_PATTERN = re.compile(r"vectors(\.\d+)?\.f32(\.tmp)?")
+_META_FILE = "meta.pkl"
+_HNSW_FILE = "hnsw.bin"
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store over a memory-mapped float32 matrix, persisted to a directory.
+
+    Rows are written into the memory-mapped `vectors.f32` as they are inserted, so the corpus lives
+    in the page cache instead of the Python heap. The file and the per-row arrays grow geometrically,
+    an insert only remaps the file when the capacity doubles. Deletes are tombstones
+    that are compacted away on `persist` once they exceed `compact_ratio` of the rows. Compaction
+    writes a new generation of the matrix (`vectors.<n>.f32`) that `meta.pkl` refers to, so replacing
+    the metadata commits both and a crash in between leaves the previous generation intact.
+    Scores are squared L2 distances (lower is closer), the same as the Milvus default metric.
+    Args:
+        embedding_function: Embedding model used for `add_texts` and query embedding.
+        path: Directory holding the matrix, the metadata and the optional HNSW graph.
+        index_type: "flat" for exact search, "hnsw" for an approximate graph (requires hnswlib).
+        hnsw_m: HNSW graph degree.
+        hnsw_ef_construction: HNSW build-time candidate list size.
+        hnsw_ef_search: HNSW query-time candidate list size.
+        compact_ratio: Fraction of deleted rows that triggers compaction on `persist`.
+    """
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        path: str,
+        index_type: str = "flat",
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 64,
+        compact_ratio: float = 0.3,
+    ):
+        if index_type not in ("flat", "hnsw"):
+            raise ValueError(f"Unsupported local index type: {index_type}")
+        if index_type == "hnsw" and hnswlib is None:
+            logging.warning("hnswlib is not installed, falling back to flat search")
+            index_type = "flat"
+        self.embedding_function = embedding_function
+        self.path = path
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._reset()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding_function
+
+    def _reset(self) -> None:
+        self.dim: Optional[int] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._row_by_id: Dict[str, int] = {}
+        # *_buf 按容量分配，_alive / _sq_norms / _vectors 是前 len(self._ids) 行的视图
+        self._capacity = 0
+        self._generation = 0
+        self._alive_buf = self._alive = np.zeros(0, dtype=bool)
+        self._sq_norms_buf = self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._vectors_buf = self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._hnsw = None
+        # 过滤条件 -> 行掩码，数据变更时清空
+        self._filter_masks: Dict[Tuple, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _vectors_name(generation: int) -> str:
+        # 第 0 代沿用原来的文件名，旧目录无需迁移
+        return _VECTORS_FILE if generation == 0 else f"vectors.{generation}.f32"
+
+    def _vectors_path(self) -> str:
+        return self._file(self._vectors_name(self._generation))
+
+    def _remove_stale_vectors(self, keep: Optional[str] = None) -> None:
+        """Remove matrix files other than `keep`: superseded generations and interrupted compactions"""
+        for name in os.listdir(self.path):
+            if name != keep and _VECTORS_PATTERN.fullmatch(name):
+                try:
+                    os.remove(self._file(name))
+                except OSError as e:
+                    logging.warning(f"Failed to remove stale vector file {name}: {str(e)}")
+
+    # ---- persistence -------------------------------------------------
+
+    def _release_vectors(self) -> None:
+        # 释放映射后才能改变文件大小或替换文件（Windows）
+        self._vectors_buf = self._vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+
+    def _map_vectors(self, rows: int, capacity: Optional[int] = None) -> None:
+        """Map the matrix file with room for `capacity` rows (at least `rows`), `_vectors` views the first `rows`"""
+        capacity = max(rows, capacity or 0)
+        self._release_vectors()
+        if capacity == 0 or not self.dim:
+            self._capacity = 0
+            return
+        path = self._vectors_path()
+        size = capacity * self.dim * 4
+        if not os.path.exists(path) or os.path.getsize(path) < size:
+            # 预留的尾部是稀疏的，不实际占用磁盘
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.truncate(size)
+        self._vectors_buf = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._vectors = self._vectors_buf[:rows]
+        self._capacity = capacity
+
+    def _set_row_arrays(self, alive: np.ndarray, sq_norms: np.ndarray) -> None:
+        self._alive_buf = self._alive = alive
+        self._sq_norms_buf = self._sq_norms = sq_norms
+
+    def _grow(self, rows: int) -> None:
+        """Make room for `rows` rows, doubling the capacity"""
+        capacity = max(rows, self._capacity * 2, 1024)
+        used = len(self._ids)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:used] = self._alive_buf[:used]
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        sq_norms[:used] = self._sq_norms_buf[:used]
+        self._alive_buf, self._sq_norms_buf = alive, sq_norms
+        self._map_vectors(used, capacity)
+
+    def _view_rows(self, rows: int) -> None:
+        self._alive = self._alive_buf[:rows]
+        self._sq_norms = self._sq_norms_buf[:rows]
+        self._vectors = self._vectors_buf[:rows]
+
+    def _load(self) -> None:
+        meta_path = self._file(_META_FILE)
+        if not os.path.exists(meta_path):
+            # 没有元数据的向量文件无法使用，丢弃
+            self._remove_stale_vectors()
+            return
+        with open(meta_path, "rb") as f:
+            meta = pickle.load(f)
+        self._generation = meta.get("generation", 0)
+        # 元数据未引用的代号文件来自被替换的旧代或中断的压缩
+        self._remove_stale_vectors(keep=self._vectors_name(self._generation))
+        self.dim = meta["dim"]
+        self._ids = meta["ids"]
+        self._texts = meta["texts"]
+        self._metadatas = meta["metadatas"]
+        alive = meta["alive"]
+        rows = len(self._ids)
+        vectors_path = self._vectors_path()
+        expected_size = rows * (self.dim or 0) * 4
+        if os.path.exists(vectors_path) and os.path.getsize(vectors_path) > expected_size:
+            # 截掉预留的容量，以及上次写入向量后未保存元数据就退出时多出的行
+            with open(vectors_path, "r+b") as f:
+                f.truncate(expected_size)
+        self._map_vectors(rows)
+        self._set_row_arrays(
+            np.array(alive, dtype=bool),
+            np.einsum("ij,ij->i", self._vectors, self._vectors) if rows else np.zeros(0, dtype=np.float32),
+        )
+        self._row_by_id = {self._ids[row]: int(row) for row in np.flatnonzero(self._alive)}
+        if self.index_type == "hnsw" and rows:
+            self._load_hnsw(rows)
+        logging.info(f"Loaded local vector store with {len(self)} vectors from {self.path}")
+
+    def _new_hnsw(self, capacity: int):
+        index = hnswlib.Index(space="l2", dim=self.dim)
+        index.init_index(max_elements=max(capacity, 1024), ef_construction=self.hnsw_ef_construction, M=self.hnsw_m, allow_replace_deleted=False)
+        index.set_ef(self.hnsw_ef_search)
+        return index
+
+    def _load_hnsw(self, rows: int) -> None:
+        hnsw_path = self._file(_HNSW_FILE)
+        if os.path.exists(hnsw_path):
+            try:
+                index = hnswlib.Index(space="l2", dim=self.dim)
+                index.load_index(hnsw_path, max_elements=max(rows, 1024))
+                if index.get_current_count() == rows:
+                    index.set_ef(self.hnsw_ef_search)
+                    self._hnsw = index
+                    return
+            except Exception as e:
+                logging.warning(f"Failed to load HNSW index, rebuilding: {str(e)}")
+        self._rebuild_hnsw()
+
+    def _rebuild_hnsw(self) -> None:
+        rows = len(self._ids)
+        self._hnsw = self._new_hnsw(rows)
+        if rows:
+            self._hnsw.add_items(np.asarray(self._vectors), np.arange(rows))
+            for row in np.flatnonzero(~self._alive):
+                self._hnsw.mark_deleted(int(row))
+
+    def persist(self) -> None:
+        """Write the metadata (and HNSW graph) to disk, compacting tombstones first if needed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = len(self._ids)
+            compacted = False
+            if rows and (rows - len(self)) > rows * self.compact_ratio:
+                self._compact()
+                compacted = True
+            if isinstance(self._vectors_buf, np.memmap):
+                # 先落盘向量，再写引用这些行的元数据
+                self._vectors_buf.flush()
+            meta = {
+                "generation": self._generation,
+                "dim": self.dim,
+                "ids": self._ids,
+                "texts": self._texts,
+                "metadatas": self._metadatas,
+                "alive": np.array(self._alive),
+            }
+            tmp_path = f"{self._file(_META_FILE)}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # 元数据的替换同时提交新一代向量文件
+            os.replace(tmp_path, self._file(_META_FILE))
+            if compacted:
+                self._remove_stale_vectors(keep=self._vectors_name(self._generation))
+            if self._hnsw is not None:
+                self._hnsw.save_index(self._file(_HNSW_FILE))
+            self._dirty = False
+
+    def _compact(self) -> None:
+        """Write the matrix without deleted rows as a new generation, committed by the next metadata write"""
+        keep = np.flatnonzero(self._alive)
+        vectors = np.asarray(self._vectors[keep])
+        generation = self._generation + 1
+        path = self._file(self._vectors_name(generation))
+        # 旧一代文件保持不变，直到引用新一代的元数据替换完成
+        vectors.tofile(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        sq_norms = self._sq_norms[keep]
+        self._release_vectors()
+        self._generation = generation
+        self._ids = [self._ids[row] for row in keep]
+        self._texts = [self._texts[row] for row in keep]
+        self._metadatas = [self._metadatas[row] for row in keep]
+        self._set_row_arrays(np.ones(len(keep), dtype=bool), sq_norms)
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._map_vectors(len(keep))
+        self._filter_masks.clear()
+        if self.index_type == "hnsw":
+            self._rebuild_hnsw()
+        logging.info(f"Compacted local vector store to {len(keep)} vectors")
+
+    # ---- writes ------------------------------------------------------
+
+    def add_embeddings(
+        self,
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+        ids: Optional[Sequence[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Insert pre-computed vectors, an existing id is replaced"""
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store dimension {self.dim}")
+            self._delete_rows([self._row_by_id[doc_id] for doc_id in ids if doc_id in self._row_by_id])
+            start = len(self._ids)
+            end = start + len(ids)
+            if end > self._capacity:
+                self._grow(end)
+            self._vectors_buf[start:end] = vectors
+            self._alive_buf[start:end] = True
+            self._sq_norms_buf[start:end] = np.einsum("ij,ij->i", vectors, vectors)
+            self._ids.extend(ids)
+            self._texts.extend(texts)
+            self._metadatas.extend(dict(metadata) for metadata in metadatas)
+            self._row_by_id.update({doc_id: start + i for i, doc_id in enumerate(ids)})
+            self._view_rows(end)
+            if self.index_type == "hnsw":
+                if self._hnsw is None:
+                    self._hnsw = self._new_hnsw(len(self._ids))
+                elif self._hnsw.get_max_elements() < len(self._ids):
+                    self._hnsw.resize_index(max(len(self._ids), self._hnsw.get_max_elements() * 2))
+                self._hnsw.add_items(vectors, np.arange(start, len(self._ids)))
+            self._filter_masks.clear()
+            self._dirty = True
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas=metadatas, ids=ids)
+
+    def _delete_rows(self, rows: List[int]) -> None:
+        for row in rows:
+            if not self._alive[row]:
+                continue
+            self._alive[row] = False
+            self._row_by_id.pop(self._ids[row], None)
+            if self._hnsw is not None:
+                self._hnsw.mark_deleted(int(row))
+        if rows:
+            self._filter_masks.clear()
+            self._dirty = True
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete by chunk ids and/or by a metadata filter, e.g. {"knowledge_base": "default"}"""
+        with self._lock:
+            rows = [self._row_by_id[doc_id] for doc_id in ids or [] if doc_id in self._row_by_id]
+            if filter:
+                rows.extend(int(row) for row in np.flatnonzero(self._filter_mask(filter)))
+            self._delete_rows(rows)
+        return True
+
+    def clear(self) -> None:
+        """Drop every vector and remove the files on disk"""
+        with self._lock:
+            self._release_vectors()
+            for name in (_META_FILE, _HNSW_FILE):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._remove_stale_vectors()
+            self._reset()
+            self._dirty = False
+
+    # ---- reads -------------------------------------------------------
+
+    @staticmethod
+    def _metadata_value(metadata: Dict[str, Any], field: str) -> Any:
+        """Value of a metadata key, dotted keys such as "fields.城市" look into nested dicts"""
+        if field in metadata or "." not in field:
+            return metadata.get(field)
+        value: Any = metadata
+        for part in field.split("."):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        """
+        Rows whose metadata matches every key of the filter, list values mean "in".
+        Dotted keys match nested values, e.g. {"fields.城市": "北京"} for structured records.
+        """
+        key = tuple(sorted(
+            (field, tuple(value) if isinstance(value, (list, tuple, set)) else (value,))
+            for field, value in filter.items()
+        ))
+        mask = self._filter_masks.get(key)
+        if mask is None:
+            mask = self._alive.copy()
+            for field, allowed in key:
+                allowed = set(allowed)
+                mask &= np.fromiter(
+                    (self._metadata_value(metadata, field) in allowed for metadata in self._metadatas),
+                    dtype=bool,
+                    count=len(self._metadatas),
+                )
+            self._filter_masks[key] = mask
+        return mask
+
+    def count(self, filter: Optional[Dict[str, Any]] = None) -> int:
+        with self._lock:
+            if not filter:
+                return len(self)
+            return int(self._filter_mask(filter).sum())
+
+    def _make_document(self, row: int) -> Document:
+        return Document(page_content=self._texts[row], metadata={**self._metadatas[row], "pk": self._ids[row]})
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if not len(self):
+                return []
+            mask = self._filter_mask(filter) if filter else self._alive
+            candidates = int(mask.sum())
+            k = min(k, candidates)
+            if k <= 0:
+                return []
+            if self._hnsw is not None:
+                rows, distances = self._hnsw_search(query, k, mask if filter else None)
+            else:
+                # ||x - q||^2 = ||x||^2 - 2 x·q + ||q||^2
+                distances = self._sq_norms - 2 * (self._vectors @ query) + float(query @ query)
+                distances = np.where(mask, distances, np.inf)
+                rows = np.argpartition(distances, k - 1)[:k]
+                rows = rows[np.argsort(distances[rows])]
+                distances = distances[rows]
+            return [(self._make_document(int(row)), float(distance)) for row, distance in zip(rows, distances)]
+
+    def _hnsw_search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray]):
+        self._hnsw.set_ef(max(self.hnsw_ef_search, k))
+        filter_fn: Optional[Callable[[int], bool]] = (lambda label: bool(mask[label])) if mask is not None else None
+        labels, distances = self._hnsw.knn_query(query, k=k, filter=filter_fn)
+        return labels[0], distances[0]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k, filter=filter)
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        # 只有 embedding 需要远程调用，本地搜索本身足够快，直接在事件循环里完成
+        embedding = await self.embedding_function.aembed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def ids(self) -> List[str]:
+        """Ids of every stored chunk"""
+        with self._lock:
+            return list(self._row_by_id)
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Document]]]:
+        """Yield (ids, documents) batches of every stored chunk, used to rebuild secondary indexes"""
+        with self._lock:
+            rows = [int(row) for row in np.flatnonzero(self._alive)]
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            yield (
+                [self._ids[row] for row in batch],
+                [Document(page_content=self._texts[row], metadata=dict(self._metadatas[row])) for row in batch],
+            )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        path: str = "cache/vector_store",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding, path, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.persist()
+        return store
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只有进程内的锁
+    fcntl = None
+
+
+class DocumentManifest:
+    """
+    Local record of the chunk ids stored for every doc_id, kept in a SQLite file next to the other caches.
+    Chunk ids are derived from the chunk content (see `rag.ingestion.chunk_id`), so comparing the ids of
+    a re-ingested document with the manifest tells which chunks are new, unchanged or removed.
+    `lock(doc_id)` serializes the ingestion and deletion of one document across threads and, through a lock
+    file next to the database, across the worker processes sharing the manifest.
+    Args:
+        path: Path of the SQLite database file, created if missing.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.lock_dir = path + ".locks"
+        self._document_locks: Dict[str, threading.Lock] = {}
+        self._document_locks_guard = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "doc_id TEXT NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (doc_id, chunk_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @contextmanager
+    def lock(self, doc_id: str) -> Iterator[None]:
+        """Exclusive lock of one document, held across threads of this process and other worker processes"""
+        with self._document_locks_guard:
+            thread_lock = self._document_locks.setdefault(doc_id, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            # 锁文件按 doc_id 的哈希命名，doc_id 可以包含任意字符
+            os.makedirs(self.lock_dir, exist_ok=True)
+            lock_path = os.path.join(self.lock_dir, hashlib.sha1(doc_id.encode("utf-8")).hexdigest() + ".lock")
+            with open(lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def get(self, doc_id: str) -> Set[str]:
+        """Chunk ids recorded for the document, empty if unknown"""
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+        return {chunk_id for chunk_id, in rows}
+
+    def replace(self, doc_id: str, chunk_ids: Iterable[str]) -> None:
+        """Record the full set of chunk ids of the document"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks (doc_id, chunk_id) VALUES (?, ?)",
+                [(doc_id, chunk_id) for chunk_id in chunk_ids],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, updated_at) VALUES (?, ?)",
+                (doc_id, time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        doc_ids = [(doc_id,) for doc_id in doc_ids]
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE doc_id = ?", doc_ids)
+            self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", doc_ids)
+            self._conn.commit()
+
+    def doc_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id FROM documents ORDER BY doc_id").fetchall()
+        return [doc_id for doc_id, in rows]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
@@ -1,33 +1,83 @@
+import asyncio
+import functools
+import hashlib
+import json
 import logging
-import pandas as pd
-from typing import Dict, Any, List, Optional
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 import os
 from pathlib import Path
-from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType, utility
-from langchain_community.embeddings import DashScopeEmbeddings
-from langchain_community.vectorstores import Milvus
 from utils.document_loader import DocumentProcessor
+from utils.native_loaders import XlsxRowLoader
+from utils.structured_chunker import format_value, record_document
+from utils.parse_executor import ParseExecutor
+from rag.embedding_cache import CachedEmbeddings, SQLiteEmbeddingStore
+from rag.ingestion import CHUNK_HASH_LENGTH, IngestionPipeline, IngestionStats
+from rag.keyword_index import BM25Index, is_keyword_query, reciprocal_rank_fusion
+from rag.local_vector_store import LocalVectorStore
+from rag.manifest import DocumentManifest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from utils.decorators import singleton
+from utils.lru_cache import LRUCache
+from utils.metrics import bind_context, run_in_executor, span, traced
+from utils.shared_state import get_shared_state
 from config.config_manager import ConfigManager
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 
+# 知识库版本号在共享状态中的键，多 worker 部署时其他进程据此发现知识库已变更
+KNOWLEDGE_VERSION_KEY = "rag:knowledge_version"
+
+# 元数据过滤键的第一段是 Milvus 的字段名，后面的部分是 JSON 字段中的路径
+_FILTER_FIELD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
 @singleton
 class RAGManager:
-    def __init__(self):
+    def __init__(self, embedding: Optional[Embeddings] = None, vector_db: Optional[VectorStore] = None):
+        """
+        Args:
+            embedding: Embedding model to use instead of the configured one, e.g. an offline stand-in.
+            vector_db: Vector store to use instead of the configured backend.
+        """
         self.config_manager = ConfigManager()
         self.config = self.config_manager.get_rag_config()
         self.vector_db = None
+        self.vector_db_type = self.config['vector_db'].get('type', 'milvus')
         self.embedding = None
+        # 知识库内容变更（入库、删除、清空）时通知的回调，如回答缓存失效
+        self._change_listeners: List[Callable[[], None]] = []
         self.document_processor = DocumentProcessor(
             chunk_size=self.config['chunk_size'],
-            chunk_overlap=self.config['chunk_overlap']
+            chunk_overlap=self.config['chunk_overlap'],
+            native_loaders=(self.config.get('parsing') or {}).get('native_loaders', True),
+            structured=self.config.get('structured_chunking'),
         )
-        self._initialize_embedding()
-        self._initialize_vector_db()
+        if embedding is not None:
+            # 注入的 embedding 使用独立的缓存命名空间，不会与真实模型的缓存向量混用
+            self.embedding = self._wrap_embedding_cache(embedding, namespace=f"injected:{type(embedding).__name__}")
+        else:
+            self._initialize_embedding()
+        if vector_db is not None:
+            self.vector_db = vector_db
+            self.vector_db_type = 'local' if isinstance(vector_db, LocalVectorStore) else 'milvus'
+        else:
+            self._initialize_vector_db()
+        self._initialize_keyword_index()
+        self._initialize_manifest()
+        self._initialize_parse_executor()
 
         self.self_rag_flag = self.config['self_rag']
+        self.verification_config = self.config.get('self_rag_verification') or {}
         self.llm = None
+        self._verify_executor = None
+        # (query, chunk) -> 相关性判断结果，避免重复调用大模型
+        self.verdict_cache: LRUCache[bool] = LRUCache(
+            max_size=self.verification_config.get('cache_size', 2048),
+            ttl=self.verification_config.get('cache_ttl'),
+        )
         if self.self_rag_flag:
             self._initialize_llm()
             # 定义优化搜索结果的提示模板
@@ -36,22 +86,45 @@ class RAGManager:
     def _initialize_embedding(self):
         """Initialize the embedding model"""
         try:
-            self.embedding = DashScopeEmbeddings(
+            # 供应商 SDK 在创建时才导入，加快服务启动
+            from langchain_community.embeddings import DashScopeEmbeddings
+
+            embedding = DashScopeEmbeddings(
                 model=self.config['embeddings']['model'],
                 dashscope_api_key=self.config['embeddings']['api_key'],
             )
+            self.embedding = self._wrap_embedding_cache(embedding)
         except Exception as e:
             print(f"Error initializing embeddings: {str(e)}")
             raise
     
+    def _wrap_embedding_cache(self, embedding, namespace: Optional[str] = None):
+        """Put the content-hash embedding cache in front of the embedding model if enabled"""
+        cache_config = self.config['embeddings'].get('cache') or {}
+        if not cache_config.get('enabled', False):
+            return embedding
+        disk_store = None
+        if cache_config.get('disk_path'):
+            disk_path = cache_config['disk_path']
+            if not os.path.isabs(disk_path):
+                disk_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), disk_path)
+            disk_store = SQLiteEmbeddingStore(disk_path, max_entries=cache_config.get('max_disk_entries'))
+        return CachedEmbeddings(
+            embedding,
+            namespace=namespace or f"{self.config['embeddings']['type']}:{self.config['embeddings']['model']}",
+            max_entries=cache_config.get('max_entries', 10000),
+            disk_store=disk_store,
+        )
+
     def _initialize_llm(self):
         """Initialize the embedding model"""
         try:
-            self.llm = ChatOpenAI(
-                api_key=self.config['feedback']['api_key'],
-                model=self.config['feedback']['model_name'],
-                temperature=self.config['feedback']['temperature'],
-                base_url=self.config['feedback']["api_base"],
+            from chat.provider_clients import ProviderClientFactory
+
+            # 与对话模型共享 HTTP 连接池
+            self.llm = ProviderClientFactory().create_chat_model(
+                self.config['feedback'],
+                streaming=False,
                 max_tokens=self.config['feedback']["max_tokens"],
             )
         except Exception as e:
@@ -59,8 +132,41 @@ class RAGManager:
             raise
     
     def _initialize_vector_db(self):
-        """Initialize the vector database"""
+        """Initialize the vector database backend selected by `vector_db.type`"""
+        if self.vector_db_type == 'milvus':
+            self._initialize_milvus()
+        elif self.vector_db_type == 'local':
+            self._initialize_local_vector_db()
+        else:
+            raise ValueError(f"Unsupported vector database type: {self.vector_db_type}")
+
+    def _initialize_local_vector_db(self):
+        """Initialize the in-process vector store, persisted under `vector_db.local.path`"""
         try:
+            local_config = self.config['vector_db'].get('local') or {}
+            path = local_config.get('path', 'cache/vector_store')
+            if not os.path.isabs(path):
+                path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
+            self.vector_db = LocalVectorStore(
+                embedding_function=self.embedding,
+                path=os.path.join(path, self.config['vector_db']['collection_name']),
+                index_type=local_config.get('index', 'flat'),
+                hnsw_m=local_config.get('hnsw_m', 16),
+                hnsw_ef_construction=local_config.get('hnsw_ef_construction', 200),
+                hnsw_ef_search=local_config.get('hnsw_ef_search', 64),
+                compact_ratio=local_config.get('compact_ratio', 0.3),
+            )
+        except Exception as e:
+            print(f"Error initializing vector database: {str(e)}")
+            raise
+
+    def _initialize_milvus(self):
+        """Connect to the remote Milvus collection"""
+        try:
+            # pymilvus 及其依赖的 pandas 较重，只在使用 Milvus 后端时导入
+            from pymilvus import connections
+            from langchain_community.vectorstores import Milvus
+
             # 连接到Zilliz Cloud Milvus
             connections.connect(
                 alias="default",
@@ -81,82 +187,497 @@ class RAGManager:
                     "db_name": self.config['vector_db']['database']
                 }
             )
+            self._ensure_knowledge_base_index()
         except Exception as e:
             print(f"Error initializing vector database: {str(e)}")
             raise
 
+    def _initialize_keyword_index(self):
+        """Initialize the local BM25 index used for hybrid retrieval"""
+        self.hybrid_config = self.config.get('hybrid_search') or {}
+        self.keyword_index = None
+        if not self.hybrid_config.get('enabled', False):
+            return
+        index_path = self.hybrid_config.get('index_path')
+        if index_path and not os.path.isabs(index_path):
+            index_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), index_path)
+        self.keyword_index = BM25Index(path=index_path)
+
+    def _initialize_manifest(self):
+        """Initialize the per-document chunk manifest used for incremental re-ingestion"""
+        path = (self.config.get('manifest') or {}).get('path', 'cache/document_manifest.sqlite')
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
+        # 同一文档的入库和删除通过 manifest.lock 串行执行（包括多个 worker 进程之间），避免两次上传交错导致清单与向量库不一致
+        self.manifest = DocumentManifest(path)
+
+    def _initialize_parse_executor(self):
+        """Initialize the process pool parsing uploaded documents, the processes start on first use"""
+        self.parsing_config = self.config.get('parsing') or {}
+        self.parse_executor = None
+        if self.parsing_config.get('enabled', False):
+            self.parse_executor = ParseExecutor(
+                max_workers=self.parsing_config.get('max_workers'),
+                timeout=self.parsing_config.get('timeout', 300),
+                memory_limit_mb=self.parsing_config.get('memory_limit_mb', 2048),
+                pdf_pages_per_task=self.parsing_config.get('pdf_pages_per_task', 16),
+                native_loaders=self.document_processor.native_loaders,
+            )
+        # 这些格式的内置加载器很轻，在本进程中流式读取，不必把全部行传回父进程
+        self.in_process_extensions = set(self.parsing_config.get('in_process_extensions', ['.txt', '.csv', '.md']))
+
+    def _create_pipeline(self, chunk: bool = True, progress_callback=None, on_batch_inserted=None) -> IngestionPipeline:
+        """Build an ingestion pipeline configured from the `ingestion` section of rag.yaml"""
+        ingestion_config = self.config.get('ingestion') or {}
+        return IngestionPipeline(
+            vector_db=self.vector_db,
+            embedding=self.embedding,
+            chunker=self.document_processor.iter_chunks if chunk else None,
+            batch_size=ingestion_config.get('batch_size', 64),
+            max_workers=ingestion_config.get('max_workers', 4),
+            max_pending_batches=ingestion_config.get('max_pending_batches'),
+            progress_callback=progress_callback,
+            progress_interval=ingestion_config.get('progress_interval', 10),
+            on_batch_inserted=on_batch_inserted,
+        )
+
+    def _run_pipeline(self, documents, doc_id: str, chunk: bool = True, metadata: Optional[Dict[str, Any]] = None, progress_callback=None, finalize: bool = True) -> IngestionStats:
+        """
+        Incrementally (re-)ingest a document: chunks are identified by a hash of their content, only chunks
+        missing from the manifest of `doc_id` are embedded and inserted, chunks no longer produced are deleted.
+        """
+        inserted: List[str] = []
+
+        def on_batch_inserted(ids: List[str], documents: List[Document]) -> None:
+            inserted.extend(ids)
+            if self.keyword_index is not None:
+                self.keyword_index.add(ids, documents)
+
+        try:
+            with self.manifest.lock(doc_id):
+                # 清单中没有的文档可能是按旧的顺序编号写入的，或者清单丢失了，按ID格式从向量库中找回这些分块，
+                # 内容没变的分块照常跳过，不会重复写入
+                if doc_id in self.manifest:
+                    existing_ids = self.manifest.get(doc_id)
+                else:
+                    existing_ids = set(self._stored_chunk_ids(doc_id))
+                stats = self._create_pipeline(chunk=chunk, progress_callback=progress_callback, on_batch_inserted=on_batch_inserted).run(
+                    documents,
+                    id_prefix=doc_id,
+                    metadata=metadata,
+                    existing_ids=existing_ids,
+                )
+                if stats.errors:
+                    # 入库失败时保留旧分块，记下已写入的新分块，下次重新入库时再清理
+                    self.manifest.replace(doc_id, existing_ids | set(inserted))
+                    return stats
+                stale_ids = existing_ids - set(stats.chunk_ids)
+                if stale_ids:
+                    self._delete_chunks(list(stale_ids))
+                    stats.add(chunks_deleted=len(stale_ids))
+                self.manifest.replace(doc_id, stats.chunk_ids)
+                return stats
+        finally:
+            if finalize:
+                self._finalize_ingestion()
+
+    def _finalize_ingestion(self) -> None:
+        """Persist the local vector store and announce the change once documents were ingested"""
+        self._persist_vector_db()
+        self._ensure_knowledge_base_index()
+        self._notify_change()
+
+    def add_change_listener(self, callback: Callable[[], None]) -> None:
+        """
+        Register a callback invoked after documents are ingested, deleted or cleared in this process.
+        Other worker processes see the change through `KNOWLEDGE_VERSION_KEY` in the shared state.
+        """
+        self._change_listeners.append(callback)
+
+    def _notify_change(self) -> None:
+        try:
+            get_shared_state().set(KNOWLEDGE_VERSION_KEY, uuid.uuid4().hex)
+        except Exception as e:
+            print(f"Error publishing knowledge base version: {str(e)}")
+        for callback in self._change_listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error notifying knowledge base change: {str(e)}")
+
+    def _persist_vector_db(self) -> None:
+        """Flush the local vector store to disk, Milvus persists on its own"""
+        if not isinstance(self.vector_db, LocalVectorStore):
+            return
+        try:
+            self.vector_db.persist()
+        except Exception as e:
+            print(f"Error saving local vector store: {str(e)}")
+
+    def ingest_document(self, file_path: str, doc_id: str, knowledge_base: str = "default", progress_callback=None, finalize: bool = True) -> IngestionStats:
+        """Load, chunk, embed and insert a document, returning the ingestion stats"""
+        # Check if file type is supported
+        if not self.document_processor.is_supported_file_type(file_path, self.config['supported_file_types']):
+            raise ValueError(f"Unsupported file type: {Path(file_path).suffix.lower()}")
+
+        if self.parse_executor is not None and Path(file_path).suffix.lower() not in self.in_process_extensions:
+            # 在子进程中解析，不占用 API 进程的 GIL
+            documents = self.parse_executor.iter_documents(file_path)
+        else:
+            documents = self.document_processor.lazy_load_document(file_path)
+        return self._run_pipeline(
+            documents,
+            doc_id,
+            metadata={"knowledge_base": knowledge_base},
+            progress_callback=progress_callback,
+            finalize=finalize,
+        )
+
+    def add_directory(self, directory: str, knowledge_base: str = "default", doc_id_prefix: Optional[str] = None, recursive: bool = True) -> Dict[str, IngestionStats]:
+        """
+        Ingest every supported file of a directory, several files are parsed and embedded concurrently.
+        Args:
+            directory: Directory to import.
+            knowledge_base: Knowledge base of every file.
+            doc_id_prefix: The doc_id of a file is `{doc_id_prefix}/{relative path}`, defaults to the directory name.
+            recursive: Include subdirectories.
+        Returns:
+            The ingestion stats of every file by relative path.
+        """
+        root = Path(directory)
+        if not root.is_dir():
+            raise ValueError(f"Not a directory: {directory}")
+        doc_id_prefix = doc_id_prefix or root.resolve().name
+        pattern = "**/*" if recursive else "*"
+        files = sorted(
+            path for path in root.glob(pattern)
+            if path.is_file() and self.document_processor.is_supported_file_type(str(path), self.config['supported_file_types'])
+        )
+        results: Dict[str, IngestionStats] = {}
+        if not files:
+            return results
+
+        def ingest(path: Path) -> IngestionStats:
+            relative = path.relative_to(root).as_posix()
+            # 索引的保存和变更通知在全部文件完成后统一进行一次
+            return self.ingest_document(str(path), f"{doc_id_prefix}/{relative}", knowledge_base, finalize=False)
+
+        max_files = self.parsing_config.get('max_files_in_flight', 4)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, max_files), thread_name_prefix="ingest-dir") as executor:
+                futures = {executor.submit(ingest, path): path.relative_to(root).as_posix() for path in files}
+                for future in as_completed(futures):
+                    relative = futures[future]
+                    try:
+                        results[relative] = future.result()
+                    except Exception as e:
+                        results[relative] = IngestionStats(errors=[str(e)])
+                    stats = results[relative]
+                    if stats.errors:
+                        print(f"Error adding {relative}: {stats.errors[0]}")
+                    else:
+                        logging.info(f"Added {relative}: {stats.chunks_inserted} chunks inserted, {stats.chunks_unchanged} unchanged")
+        finally:
+            self._finalize_ingestion()
+        return results
+
     # TODO
-    def add_document(self, file_path: str, doc_id: str, knowledge_base: str = "default") -> bool:
-        """Process and add a document to the vector database with knowledge base metadata"""
-        try:    
-            # Check if file type is supported
-            if not self.document_processor.is_supported_file_type(file_path, self.config['supported_file_types']):
-                raise ValueError(f"Unsupported file type: {Path(file_path).suffix.lower()}")
-            
-            # Load document using the utility function
-            documents = self.document_processor.load_document(file_path)
-            
-            # Chunk documents using the utility function
-            chunked_documents = self.document_processor.chunk_documents(documents)
-            
-            # Add knowledge base info to metadata of each document
-            for doc in chunked_documents:
-                doc.metadata["knowledge_base"] = knowledge_base
-            
-            # Add to vector store
-            doc_ids = [f"{doc_id}-{idx}" for idx in range(len(chunked_documents))]
-            self.vector_db.add_documents(documents=chunked_documents, ids=doc_ids)
+    def add_document(self, file_path: str, doc_id: str, knowledge_base: str = "default", progress_callback=None) -> bool:
+        """Process and add a document to the vector database with knowledge base metadata, a directory adds every file in it"""
+        try:
+            if os.path.isdir(file_path):
+                results = self.add_directory(file_path, knowledge_base, doc_id_prefix=doc_id)
+                return all(not stats.errors for stats in results.values())
+            stats = self.ingest_document(file_path, doc_id, knowledge_base, progress_callback)
+            if stats.errors:
+                raise RuntimeError(stats.errors[0])
             
             return True
         except Exception as e:
             print(f"Error adding document: {str(e)}")
             return False
     
+    def _stored_chunk_ids(self, doc_id: str) -> List[str]:
+        """
+        Ids of the chunks of a document missing from the manifest, found in the vector database: `{doc_id}-{idx}`
+        of chunks written before the manifest existed, and `{doc_id}-{hash}[-n]` when the manifest was lost.
+        """
+        pattern = re.compile(rf"{re.escape(doc_id)}-(\d+|[0-9a-f]{{{CHUNK_HASH_LENGTH}}}(-\d+)?)")
+        try:
+            if isinstance(self.vector_db, LocalVectorStore):
+                candidates = self.vector_db.ids()
+            else:
+                from pymilvus import Collection, utility
+
+                collection_name = self.config['vector_db']['collection_name']
+                if not utility.has_collection(collection_name):
+                    return []
+                primary_field = self.vector_db._primary_field
+                # like 只做初筛，doc_id 中的通配符由下面的正则排除
+                rows = Collection(collection_name).query(
+                    expr=f"{primary_field} like {json.dumps(doc_id + '-%', ensure_ascii=False)}",
+                    output_fields=[primary_field],
+                )
+                candidates = [str(row[primary_field]) for row in rows]
+            return [chunk_id for chunk_id in candidates if pattern.fullmatch(chunk_id)]
+        except Exception as e:
+            print(f"Error listing stored chunks of {doc_id}: {str(e)}")
+            return []
+
+    def _delete_chunks(self, chunk_ids: List[str], batch_size: int = 1000) -> None:
+        """Delete chunks from the vector database and the keyword index"""
+        # Milvus 按 ID 删除会拼成一条 in 表达式，分批避免表达式过长
+        for start in range(0, len(chunk_ids), batch_size):
+            self.vector_db.delete(ids=chunk_ids[start:start + batch_size])
+        if self.keyword_index is not None:
+            self.keyword_index.delete(chunk_ids)
+
     def delete_document(self, doc_ids: list[str]) -> bool:
-        """Delete a document from the vector database by its ID"""
+        """Delete documents and all of their chunks, ids missing from the manifest are deleted as chunk ids"""
         try:
-            self.vector_db.delete(ids=doc_ids)
+            for doc_id in doc_ids:
+                # 删除分块和清单记录都在文档锁内完成，避免与同一文档的并发导入交错
+                with self.manifest.lock(doc_id):
+                    if doc_id in self.manifest:
+                        chunk_ids = list(self.manifest.get(doc_id))
+                    else:
+                        chunk_ids = [doc_id, *self._stored_chunk_ids(doc_id)]
+                    self._delete_chunks(chunk_ids)
+                    self.manifest.delete([doc_id])
+            self._persist_vector_db()
+            self._notify_change()
             return True
         except Exception as e:
             print(f"Error deleting document: {str(e)}")
             return False
     
-    def base_search(self, query: str, k: int = 3, knowledge_bases: Optional[List[str]] = "default") -> List[Dict[str, Any]]:
-        """Search for relevant documents based on a query with optional knowledge base filtering"""
+    def _normalize_knowledge_bases(self, knowledge_bases) -> Optional[List[str]]:
+        """Accept a single name or a list of names, None/empty means all knowledge bases"""
+        if not knowledge_bases:
+            return None
+        if isinstance(knowledge_bases, str):
+            return [knowledge_bases]
+        return list(knowledge_bases)
+
+    def _normalize_filters(self, filters: Optional[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """
+        Metadata filters as {dotted key: allowed values}. A key such as "fields.城市" reaches into the
+        `fields` of structured records (record mode), a list value matches any of its items.
+        """
+        normalized = {}
+        for key, value in (filters or {}).items():
+            parts = key.split(".")
+            if not _FILTER_FIELD.fullmatch(parts[0]) or not all(parts[1:]) or any('"' in part for part in parts):
+                raise ValueError(f"Invalid metadata filter key: {key}")
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            if not values:
+                raise ValueError(f"Metadata filter {key} has no values")
+            normalized[key] = values
+        return normalized
+
+    def _build_filter_expr(self, knowledge_bases, filters: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Build the Milvus filter expression for the given knowledge bases and metadata filters"""
+        knowledge_bases = self._normalize_knowledge_bases(knowledge_bases)
+        clauses = []
+        # json.dumps 负责转义知识库名、列名和值中的引号
+        if knowledge_bases:
+            clauses.append(f"knowledge_base in [{', '.join(json.dumps(kb, ensure_ascii=False) for kb in knowledge_bases)}]")
+        for key, values in self._normalize_filters(filters).items():
+            field, *path = key.split(".")
+            field += "".join(f"[{json.dumps(part, ensure_ascii=False)}]" for part in path)
+            clauses.append(f"{field} in [{', '.join(json.dumps(value, ensure_ascii=False) for value in values)}]")
+        return " and ".join(clauses) or None
+
+    def _search_filter_kwargs(self, knowledge_bases, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Knowledge base and metadata filters in the form the configured vector store expects"""
+        if self.vector_db_type == 'local':
+            local_filter = self._normalize_filters(filters)
+            knowledge_bases = self._normalize_knowledge_bases(knowledge_bases)
+            if knowledge_bases:
+                local_filter["knowledge_base"] = knowledge_bases
+            return {"filter": local_filter} if local_filter else {}
+        return {"expr": self._build_filter_expr(knowledge_bases, filters)}
+
+    def _ensure_knowledge_base_index(self) -> None:
+        """Create a scalar index on knowledge_base so the filter is resolved server-side without scanning"""
+        collection = getattr(self.vector_db, 'col', None)
+        if collection is None:
+            # 集合在第一次写入时才会创建
+            return
         try:
-            # 对于Milvus，我们需要构建过滤表达式
-            filter_expr = None
-            if knowledge_bases and knowledge_bases != "default":
-                if isinstance(knowledge_bases, list) and len(knowledge_bases) > 0:
-                    # 构建OR表达式
-                    expr_parts = [f'knowledge_base == "{kb}"' for kb in knowledge_bases]
-                    filter_expr = " || ".join(expr_parts)
-            
-            results = self.vector_db.similarity_search_with_score(
-                query=query,
-                k=k,
-                # filter=filter_expr
+            if any(index.field_name == 'knowledge_base' for index in collection.indexes):
+                return
+            if 'knowledge_base' not in [field.name for field in collection.schema.fields]:
+                return
+            collection.create_index(
+                field_name='knowledge_base',
+                index_params={"index_type": "INVERTED"},
+                index_name='knowledge_base_idx',
             )
+            logging.info("Created scalar index on knowledge_base")
+        except Exception as e:
+            logging.warning(f"Failed to create knowledge_base index: {str(e)}")
+
+    def _format_results(self, results) -> List[Dict[str, Any]]:
+        """Convert (Document, score) pairs into plain result dicts"""
+        formatted_results = []
+        for doc, score in results:
+            logging.debug(f"Document: {doc.page_content}, Score: {score}")
+            formatted_results.append({
+                'content': doc.page_content,
+                'metadata': doc.metadata,
+                'score': score
+            })
+        return formatted_results
+
+    @traced("rag.keyword_search")
+    def _keyword_search(self, query: str, k: int, knowledge_bases, filters: Optional[Dict[str, Any]] = None) -> List:
+        """BM25 search on the local keyword index, no remote call involved"""
+        if self.keyword_index is None:
+            return []
+        return self.keyword_index.search(
+            query,
+            k=k,
+            knowledge_bases=self._normalize_knowledge_bases(knowledge_bases),
+            filters=self._normalize_filters(filters),
+        )
+
+    def _resolve_search_mode(self, search_mode: Optional[str]) -> str:
+        if self.keyword_index is None:
+            return "vector"
+        return search_mode or self.hybrid_config.get('mode', 'hybrid')
+
+    def _keyword_only(self, query: str, search_mode: str, keyword_results: List, k: int) -> bool:
+        """纯关键词查询（如 React、INTJ）命中足够多时直接返回，省去远程 embedding 调用"""
+        if search_mode == "keyword":
+            return True
+        return (
+            self.hybrid_config.get('keyword_shortcut', True)
+            and is_keyword_query(query)
+            and len(keyword_results) >= k
+        )
+
+    @traced("rag.base_search")
+    def base_search(self, query: str, k: int = 3, knowledge_bases: Optional[List[str]] = None, search_mode: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents based on a query with optional knowledge base filtering
+        
+        Args:
+            search_mode: "vector", "keyword" or "hybrid" (vector + BM25 fused with reciprocal rank fusion),
+                         defaults to hybrid_search.mode in rag.yaml
+            filters: Metadata equality filters applied to both retrievers, e.g. {"fields.城市": "北京"},
+                     see `_normalize_filters`. An invalid key raises ValueError.
+        """
+        self._normalize_filters(filters)
+        try:
+            search_mode = self._resolve_search_mode(search_mode)
+            fetch_k = k * self.hybrid_config.get('fetch_multiplier', 2) if search_mode == "hybrid" else k
+            keyword_results = []
+            if search_mode in ("hybrid", "keyword"):
+                keyword_results = self._keyword_search(query, fetch_k, knowledge_bases, filters)
+                if self._keyword_only(query, search_mode, keyword_results, k):
+                    return self._format_results(keyword_results[:k])
+
+            # 分开计时 embedding 和向量检索，便于定位慢请求
+            with span("rag.embed_query"):
+                embedding = self.embedding.embed_query(query)
+            # 按知识库过滤：Milvus 在服务端用表达式过滤，本地向量库用元数据掩码
+            with span("rag.vector_search"):
+                results = self.vector_db.similarity_search_with_score_by_vector(
+                    embedding,
+                    k=fetch_k,
+                    **self._search_filter_kwargs(knowledge_bases, filters)
+                )
             
-            # Format results
-            formatted_results = []
-            for doc, score in results:
-                logging.debug(f"Document: {doc.page_content}, Score: {score}")
-                formatted_results.append({
-                    'content': doc.page_content,
-                    'metadata': doc.metadata,
-                    'score': score
-                })
+            if search_mode == "hybrid":
+                results = reciprocal_rank_fusion([results, keyword_results], k=self.hybrid_config.get('rrf_k', 60))
+            return self._format_results(results[:k])
+        except Exception as e:
+            print(f"Error searching: {str(e)}")
+            return []
+
+    @traced("rag.base_search")
+    async def abase_search(self, query: str, k: int = 3, knowledge_bases: Optional[List[str]] = None, search_mode: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Async version of `base_search`, the embedding and vector database calls run off the event loop"""
+        self._normalize_filters(filters)
+        try:
+            search_mode = self._resolve_search_mode(search_mode)
+            fetch_k = k * self.hybrid_config.get('fetch_multiplier', 2) if search_mode == "hybrid" else k
+            keyword_results = []
+            if search_mode in ("hybrid", "keyword"):
+                # FTS5 查询是同步的 SQLite 调用，与向量检索一样放到线程池执行
+                keyword_results = await run_in_executor(
+                    None,
+                    functools.partial(self._keyword_search, query, fetch_k, knowledge_bases, filters),
+                )
+                if self._keyword_only(query, search_mode, keyword_results, k):
+                    return self._format_results(keyword_results[:k])
+
+            with span("rag.embed_query"):
+                embedding = await self.embedding.aembed_query(query)
+            with span("rag.vector_search"):
+                results = await run_in_executor(
+                    None,
+                    functools.partial(
+                        self.vector_db.similarity_search_with_score_by_vector,
+                        embedding,
+                        k=fetch_k,
+                        **self._search_filter_kwargs(knowledge_bases, filters)
+                    ),
+                )
             
-            return formatted_results
+            if search_mode == "hybrid":
+                results = reciprocal_rank_fusion([results, keyword_results], k=self.hybrid_config.get('rrf_k', 60))
+            return self._format_results(results[:k])
         except Exception as e:
             print(f"Error searching: {str(e)}")
             return []
-    
-    def get_relevant_context(self, query: str, k: int = 6, knowledge_bases: Optional[List[str]] = None) -> str:
-        """Get relevant context as a concatenated string for use in prompts"""
-        results = self.search(query, k, knowledge_bases)
-        
+
+    def rebuild_keyword_index(self, batch_size: int = 1000) -> int:
+        """Rebuild the keyword index from the chunks already stored in the vector database, returns the number indexed"""
+        if self.keyword_index is None:
+            return 0
+        if isinstance(self.vector_db, LocalVectorStore):
+            self.keyword_index.clear()
+            total = 0
+            for ids, documents in self.vector_db.iter_documents(batch_size):
+                self.keyword_index.add(ids, documents)
+                total += len(ids)
+            return total
+        from pymilvus import Collection, utility
+
+        collection_name = self.config['vector_db']['collection_name']
+        if not utility.has_collection(collection_name):
+            return 0
+        collection = Collection(collection_name)
+        collection.load()
+        text_field = self.vector_db._text_field
+        primary_field = self.vector_db._primary_field
+        vector_field = self.vector_db._vector_field
+        output_fields = [field.name for field in collection.schema.fields if field.name != vector_field]
+        self.keyword_index.clear()
+        iterator = collection.query_iterator(batch_size=batch_size, expr="", output_fields=output_fields)
+        total = 0
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                ids = [str(row[primary_field]) for row in rows]
+                documents = [
+                    Document(
+                        page_content=row[text_field],
+                        metadata={key: value for key, value in row.items() if key not in (text_field, primary_field)},
+                    )
+                    for row in rows
+                ]
+                self.keyword_index.add(ids, documents)
+                total += len(rows)
+        finally:
+            iterator.close()
+        return total
+
+    def _format_context(self, results: List[Dict[str, Any]]) -> str:
+        """Concatenate search results into a context string for prompts"""
         if not results:
             return "No relevant information found."
         
@@ -166,14 +687,48 @@ class RAGManager:
             context_pieces.append(f"[Document {i+1}] (Source: {source})\n{result['content']}\n")
         
         return "\n\n".join(context_pieces)
+    
+    def _chunk_ids(self, results: List[Dict[str, Any]]) -> List[str]:
+        """Ids of the retrieved chunks, falling back to a content hash when the store returns none"""
+        return [
+            str(result['metadata'].get('pk') or hashlib.sha256(result['content'].encode('utf-8')).hexdigest())
+            for result in results
+        ]
+
+    def get_relevant_context(self, query: str, k: int = 6, knowledge_bases: Optional[List[str]] = None) -> str:
+        """Get relevant context as a concatenated string for use in prompts"""
+        return self.retrieve_context(query, k, knowledge_bases)[0]
+
+    async def aget_relevant_context(self, query: str, k: int = 6, knowledge_bases: Optional[List[str]] = None) -> str:
+        """Async version of `get_relevant_context`"""
+        return (await self.aretrieve_context(query, k, knowledge_bases))[0]
+
+    def retrieve_context(self, query: str, k: int = 6, knowledge_bases: Optional[List[str]] = None) -> Tuple[str, List[str]]:
+        """Get the prompt context together with the ids of the chunks it was built from"""
+        results = self.search(query, k, knowledge_bases)
+        return self._format_context(results), self._chunk_ids(results)
+
+    async def aretrieve_context(self, query: str, k: int = 6, knowledge_bases: Optional[List[str]] = None) -> Tuple[str, List[str]]:
+        """Async version of `retrieve_context`"""
+        results = await self.asearch(query, k, knowledge_bases)
+        return self._format_context(results), self._chunk_ids(results)
 
     def clear_database(self) -> bool:
         """Clear all documents from the vector database"""
         try:
-            collection_name = self.config['vector_db']['collection_name']
-            if utility.has_collection(collection_name):
-                utility.drop_collection(collection_name)
-            self._initialize_vector_db()
+            if isinstance(self.vector_db, LocalVectorStore):
+                self.vector_db.clear()
+            else:
+                from pymilvus import utility
+
+                collection_name = self.config['vector_db']['collection_name']
+                if utility.has_collection(collection_name):
+                    utility.drop_collection(collection_name)
+                self._initialize_vector_db()
+            if self.keyword_index is not None:
+                self.keyword_index.clear()
+            self.manifest.clear()
+            self._notify_change()
             return True
         except Exception as e:
             print(f"Error clearing database: {str(e)}")
@@ -182,14 +737,20 @@ class RAGManager:
     def get_chunk_count(self, knowledge_base: Optional[str] = None) -> int:
         """Get the total number of documents, optionally filtered by knowledge base"""
         try:
+            if isinstance(self.vector_db, LocalVectorStore):
+                return self.vector_db.count({"knowledge_base": knowledge_base} if knowledge_base else None)
+            from pymilvus import Collection, utility
+
             collection_name = self.config['vector_db']['collection_name']
             if utility.has_collection(collection_name):
                 collection = Collection(collection_name)
-                collection.load()
                 if knowledge_base:
-                    # 对于Milvus，我们需要使用表达式来过滤
-                    expr = f'knowledge_base == "{knowledge_base}"'
-                    return collection.num_entities
+                    # 按知识库计数走 count(*) 查询，由服务端利用标量索引完成
+                    result = collection.query(
+                        expr=self._build_filter_expr(knowledge_base),
+                        output_fields=["count(*)"],
+                    )
+                    return result[0]["count(*)"] if result else 0
                 else:
                     return collection.num_entities
             return 0
@@ -211,33 +772,112 @@ class RAGManager:
             文档内容：{document_content}
             回答（Y/N）："""
         )
+        # 批量验证提示，一次调用判断所有候选文档
+        self.batch_verification_prompt = PromptTemplate(
+            input_variables=["query", "documents"],
+            template="""请逐一判断以下每个文档内容是否与问题相关且信息准确。
+            问题：{query}
+            {documents}
+            请按“编号:Y”或“编号:N”的格式逐行回答，每个文档一行，不要输出其他内容："""
+        )
 
-    def search(self, query: str, k: int = 3, knowledge_bases: Optional[List[str]] = None) -> List[Dict[str, Any]]:
-        """搜索并优化结果（如果启用Self-RAG）"""
+    def search(self, query: str, k: int = 3, knowledge_bases: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """搜索并优化结果（如果启用Self-RAG），filters 为元数据过滤条件，见 base_search"""
         # 获取原始搜索结果
-        raw_results = self.base_search(query, k, knowledge_bases)  # 获取双倍结果用于后续过滤
+        raw_results = self.base_search(query, k, knowledge_bases, filters=filters)  # 获取双倍结果用于后续过滤
         
         # 如果启用Self-RAG优化
         if self.self_rag_flag:
             return self._optimize_results(query, raw_results, k)
         return raw_results[:k]
 
+    async def asearch(self, query: str, k: int = 3, knowledge_bases: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """异步搜索并优化结果（如果启用Self-RAG），不阻塞事件循环"""
+        raw_results = await self.abase_search(query, k, knowledge_bases, filters=filters)
+        
+        if self.self_rag_flag:
+            return await self._aoptimize_results(query, raw_results, k)
+        return raw_results[:k]
+
+
+    def _get_verify_executor(self) -> ThreadPoolExecutor:
+        """Thread pool shared by all requests, caps the number of concurrent verification calls"""
+        if self._verify_executor is None:
+            self._verify_executor = ThreadPoolExecutor(
+                max_workers=self.verification_config.get('max_concurrency', 4),
+                thread_name_prefix="self-rag",
+            )
+        return self._verify_executor
+
+    def _log_verdict(self, content: str, verdict: bool) -> None:
+        if verdict:
+            print(f"验证通过: {content}")
+        else:
+            print(f"验证不通过: {content}")
 
     def _optimize_results(self, query: str, raw_results: List[Dict], final_k: int) -> List[Dict]:
         """使用Self-RAG机制优化搜索结果"""
+        mode = self.verification_config.get('mode', 'serial')
         verified_results = []
         
-        # 验证每个结果的相关性
-        for result in raw_results:
-            if self._verify_relevance(query, result['content']):
-                print(f"验证通过: {result['content']}")
-                verified_results.append(result)
+        if mode == 'serial':
+            # 逐个验证每个结果的相关性
+            for result in raw_results:
+                verdict = self._verify_relevance(query, result['content'])
+                self._log_verdict(result['content'], verdict)
+                if verdict:
+                    verified_results.append(result)
+                # 如果已收集足够结果则提前停止
+                if len(verified_results) >= final_k:
+                    break
+        else:
+            contents = [result['content'] for result in raw_results]
+            if mode == 'batch':
+                verdicts = self._verify_batch(query, contents)
             else:
-                print(f"验证不通过: {result['content']}")
-            # 如果已收集足够结果则提前停止
-            if len(verified_results) >= final_k:
-                break
+                # 并发验证，并发数由共享线程池限制
+                verdicts = list(self._get_verify_executor().map(
+                    bind_context(lambda content: self._verify_relevance(query, content)), contents
+                ))
+            for result, verdict in zip(raw_results, verdicts):
+                self._log_verdict(result['content'], verdict)
+            verified_results = [r for r, verdict in zip(raw_results, verdicts) if verdict][:final_k]
         
+        return self._rank_verified_results(raw_results, verified_results, final_k)
+
+    async def _aoptimize_results(self, query: str, raw_results: List[Dict], final_k: int) -> List[Dict]:
+        """异步版本的 `_optimize_results`"""
+        mode = self.verification_config.get('mode', 'serial')
+        verified_results = []
+        
+        if mode == 'serial':
+            for result in raw_results:
+                verdict = await self._averify_relevance(query, result['content'])
+                self._log_verdict(result['content'], verdict)
+                if verdict:
+                    verified_results.append(result)
+                if len(verified_results) >= final_k:
+                    break
+        else:
+            contents = [result['content'] for result in raw_results]
+            if mode == 'batch':
+                verdicts = await self._averify_batch(query, contents)
+            else:
+                semaphore = asyncio.Semaphore(self.verification_config.get('max_concurrency', 4))
+
+                async def verify(content: str) -> bool:
+                    async with semaphore:
+                        return await self._averify_relevance(query, content)
+
+                verdicts = await asyncio.gather(*(verify(content) for content in contents))
+            for result, verdict in zip(raw_results, verdicts):
+                self._log_verdict(result['content'], verdict)
+            verified_results = [r for r, verdict in zip(raw_results, verdicts) if verdict][:final_k]
+        
+        return self._rank_verified_results(raw_results, verified_results, final_k)
+
+    def _rank_verified_results(self, raw_results: List[Dict], verified_results: List[Dict], final_k: int) -> List[Dict]:
+        """补充未验证结果并重新排序"""
         # 如果通过率不足，补充未验证结果
         if len(verified_results) < final_k:
             verified_results += [r for r in raw_results if r not in verified_results][:final_k-len(verified_results)]
@@ -249,95 +889,161 @@ class RAGManager:
             reverse=True
         )
 
+    def _verdict_key(self, query: str, content: str) -> str:
+        return hashlib.sha256(f"{query}\0{content}".encode("utf-8")).hexdigest()
+
+    @traced("rag.verify_relevance")
     def _verify_relevance(self, query: str, content: str) -> bool:
+        key = self._verdict_key(query, content)
+        cached = self.verdict_cache.get(key)
+        if cached is not None:
+            return cached
         chain = self.relevance_verification_prompt | self.llm
         try:
             response = chain.invoke({
                 "query": query,
                 "document_content": content
             }).content.strip().upper()
-            return "Y" in response
+            verdict = "Y" in response
+            self.verdict_cache.set(key, verdict)
+            return verdict
         except Exception as e:
             print(f"验证失败: {str(e)}")
             return False  # 默认返回不相关
 
-    def add_excel(self, file_path: str, doc_id: str, knowledge_base: str = "default") -> bool:
+    @traced("rag.verify_relevance")
+    async def _averify_relevance(self, query: str, content: str) -> bool:
+        key = self._verdict_key(query, content)
+        cached = self.verdict_cache.get(key)
+        if cached is not None:
+            return cached
+        chain = self.relevance_verification_prompt | self.llm
+        try:
+            response = (await chain.ainvoke({
+                "query": query,
+                "document_content": content
+            })).content.strip().upper()
+            verdict = "Y" in response
+            self.verdict_cache.set(key, verdict)
+            return verdict
+        except Exception as e:
+            print(f"验证失败: {str(e)}")
+            return False  # 默认返回不相关
+
+    def _split_cached_verdicts(self, query: str, contents: List[str]):
+        """Return cached verdicts (None where missing) and the indexes that still need judging"""
+        verdicts = [self.verdict_cache.get(self._verdict_key(query, content)) for content in contents]
+        pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        return verdicts, pending
+
+    def _parse_batch_verdicts(self, query: str, contents: List[str], verdicts: List[Optional[bool]], pending: List[int], response: str) -> bool:
+        """Fill in verdicts from a batch answer, returns False if some candidates were not answered"""
+        answers = {int(idx): flag == "Y" for idx, flag in re.findall(r'(\d+)\s*[:：]\s*([YN])', response.upper())}
+        complete = True
+        for number, i in enumerate(pending, start=1):
+            if number in answers:
+                verdicts[i] = answers[number]
+                self.verdict_cache.set(self._verdict_key(query, contents[i]), answers[number])
+            else:
+                complete = False
+        return complete
+
+    def _format_batch_documents(self, contents: List[str], pending: List[int]) -> str:
+        return "\n".join(f"文档{number}：{contents[i]}" for number, i in enumerate(pending, start=1))
+
+    @traced("rag.verify_batch")
+    def _verify_batch(self, query: str, contents: List[str]) -> List[bool]:
+        """一次调用大模型判断所有候选文档，未能解析的候选逐个补充验证"""
+        verdicts, pending = self._split_cached_verdicts(query, contents)
+        if pending:
+            chain = self.batch_verification_prompt | self.llm
+            try:
+                response = chain.invoke({
+                    "query": query,
+                    "documents": self._format_batch_documents(contents, pending)
+                }).content
+                self._parse_batch_verdicts(query, contents, verdicts, pending, response)
+            except Exception as e:
+                print(f"批量验证失败: {str(e)}")
+            for i, verdict in enumerate(verdicts):
+                if verdict is None:
+                    verdicts[i] = self._verify_relevance(query, contents[i])
+        return verdicts
+
+    @traced("rag.verify_batch")
+    async def _averify_batch(self, query: str, contents: List[str]) -> List[bool]:
+        """异步版本的 `_verify_batch`"""
+        verdicts, pending = self._split_cached_verdicts(query, contents)
+        if pending:
+            chain = self.batch_verification_prompt | self.llm
+            try:
+                response = (await chain.ainvoke({
+                    "query": query,
+                    "documents": self._format_batch_documents(contents, pending)
+                })).content
+                self._parse_batch_verdicts(query, contents, verdicts, pending, response)
+            except Exception as e:
+                print(f"批量验证失败: {str(e)}")
+            missing = [i for i, verdict in enumerate(verdicts) if verdict is None]
+            for i, verdict in zip(missing, await asyncio.gather(*(self._averify_relevance(query, contents[i]) for i in missing))):
+                verdicts[i] = verdict
+        return verdicts
+
+    def add_excel(self, file_path: str, doc_id: str, knowledge_base: str = "default", progress_callback=None) -> bool:
         """
-        Efficiently parse a large Excel file by reading one sheet at a time and processing in row batches.
-        This avoids using unstructured and works with openpyxl.
+        Efficiently parse a large Excel file by streaming its rows through the ingestion pipeline.
+        This avoids using unstructured and keeps memory constant regardless of the sheet size.
         """
-        import pandas as pd
-        from langchain_core.documents import Document
         try:
-            xls = pd.ExcelFile(file_path)
-            chunk_size = 1000  # 可根据内存调整
-            all_documents = []
-            for sheet_name in xls.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl', dtype=str)
-                df = df.fillna('')
-                n_rows = len(df)
-                for start in range(0, n_rows, chunk_size):
-                    end = min(start + chunk_size, n_rows)
-                    chunk = df.iloc[start:end]
-                    for idx, row in chunk.iterrows():
-                        page_content = '\t'.join(map(str, row.values))
-                        row_number = idx + 2  # header + 0-based
-                        doc = Document(
-                            page_content=page_content,
-                            metadata={
-                                'source': f"{Path(file_path).name}:{sheet_name}",
-                                'sheet_name': sheet_name,
-                                'row_number': row_number,
-                                'knowledge_base': knowledge_base
-                            }
-                        )
-                        all_documents.append(doc)
-            if not all_documents:
+            stats = self._run_pipeline(
+                XlsxRowLoader(file_path).lazy_load(),
+                doc_id,
+                metadata={"knowledge_base": knowledge_base},
+                progress_callback=progress_callback,
+            )
+            if stats.errors:
+                raise RuntimeError(stats.errors[0])
+            if not stats.documents_loaded:
                 print("No documents found in the Excel file.")
                 return True
-            chunked_documents = self.document_processor.chunk_documents(all_documents)
-            for doc in chunked_documents:
-                if "knowledge_base" not in doc.metadata:
-                    doc.metadata["knowledge_base"] = knowledge_base
-            doc_ids = [f"{doc_id}-{idx}" for idx in range(len(chunked_documents))]
-            self.vector_db.add_documents(documents=chunked_documents, ids=doc_ids)
-            print(f"Successfully added {len(chunked_documents)} chunks from {file_path} to knowledge base '{knowledge_base}'.")
+            print(f"Successfully added {stats.chunks_inserted} chunks from {file_path} to knowledge base '{knowledge_base}'.")
             return True
         except Exception as e:
             print(f"Error adding Excel document: {str(e)}")
             return False
-    
-    def add_json(self, file_path: str, doc_id: str, knowledge_base: str = "default") -> bool:
-        import json
-        from langchain_core.documents import Document
+
+    def _iter_json_items(self, file_path: str, knowledge_base: str) -> Iterator[Document]:
+        """One structured record per JSON object, every key rendered as a `key: value` line"""
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for item in data:
+            name = item.get("name", "Unknown")
+            # 嵌套的对象和数组序列化为 JSON 字符串，列值统一为字符串便于过滤
+            fields = {str(key): format_value(value) for key, value in item.items()}
+            yield record_document(
+                fields,
+                {
+                    "source": f"{Path(file_path).name}:{name}",
+                    "name": name,
+                    "knowledge_base": knowledge_base
+                }
+            )
+
+    def add_json(self, file_path: str, doc_id: str, knowledge_base: str = "default", progress_callback=None) -> bool:
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            all_documents = []
-            for idx, item in enumerate(data):
-                # 你可以根据实际 JSON 结构自定义 page_content 和 metadata
-                page_content = item.get("msg", "")
-                name = item.get("name", "Unknown")
-                page_content = f"{name}: {page_content}"
-                doc = Document(
-                    page_content=page_content,
-                    metadata={
-                        "source": f"{Path(file_path).name}:{name}",
-                        "name": name,
-                        "knowledge_base": knowledge_base
-                    }
-                )
-                all_documents.append(doc)
-            if not all_documents:
+            # 每条记录作为一个整体写入，由结构化分块器处理；未启用时与以前一样不分块
+            stats = self._run_pipeline(
+                self._iter_json_items(file_path, knowledge_base),
+                doc_id,
+                chunk=self.document_processor.structured_chunker is not None,
+                progress_callback=progress_callback,
+            )
+            if stats.errors:
+                raise RuntimeError(stats.errors[0])
+            if not stats.documents_loaded:
                 print("No documents found in the JSON file.")
                 return True
-            chunked_documents = self.document_processor.chunk_documents(all_documents)
-            for doc in chunked_documents:
-                if "knowledge_base" not in doc.metadata:
-                    doc.metadata["knowledge_base"] = knowledge_base
-            doc_ids = [f"{doc_id}-{idx}" for idx in range(len(all_documents))]
-            self.vector_db.add_documents(documents=all_documents, ids=doc_ids)
-            print(f"Successfully added {len(chunked_documents)} chunks from {file_path} to knowledge base '{knowledge_base}'.")
+            print(f"Successfully added {stats.chunks_inserted} chunks from {file_path} to knowledge base '{knowledge_base}'.")
             return True
         except Exception as e:
             print(f"Error adding JSON document: {str(e)}")
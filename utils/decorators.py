@@ -1,3 +1,4 @@
+import threading
 from typing import TypeVar, Type
 from functools import wraps
 
@@ -5,19 +6,28 @@ T = TypeVar('T')
 
 def singleton(cls: Type[T]) -> Type[T]:
     """
-    A decorator that makes a class a singleton.
+    A decorator that makes a class a thread-safe, lazily created singleton.
+    The instance is built on first use, concurrent first calls wait for the same instance
+    instead of constructing duplicates. Instances are per process, under multiple workers
+    every worker has its own.
     Usage:
         @singleton
         class MyClass:
             def __init__(self):
                 pass
     """
-    instances = {}
-    
+    instance = None
+    # 每个类一把锁，构造时可以安全地依赖其他单例（如 RAGManager 依赖 ConfigManager）
+    lock = threading.RLock()
+
     @wraps(cls)
     def get_instance(*args, **kwargs) -> T:
-        if cls not in instances:
-            instances[cls] = cls(*args, **kwargs)
-        return instances[cls]
-    
-    return get_instance 
\ No newline at end of file
+        nonlocal instance
+        # 双重检查：已创建时不加锁
+        if instance is None:
+            with lock:
+                if instance is None:
+                    instance = cls(*args, **kwargs)
+        return instance
+
+    return get_instance
@@ -1,61 +1,139 @@
 import logging
 
-from typing import List
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 from pathlib import Path
-from langchain_community.document_loaders import (
-    TextLoader, 
-    PyPDFLoader, 
-    UnstructuredMarkdownLoader,
-    UnstructuredExcelLoader,
-    UnstructuredWordDocumentLoader,
-    UnstructuredCSVLoader
-)
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
+from utils.metrics import traced
+from utils.structured_chunker import StructuredChunker, is_record
+
+# 不依赖 unstructured 的流式加载器（utils.native_loaders），按行/按章节产出文档
+NATIVE_LOADERS = {
+    '.txt': 'TextFileLoader',
+    '.csv': 'CSVRowLoader',
+    '.xlsx': 'XlsxRowLoader',
+    '.md': 'MarkdownSectionLoader',
+}
+
+
+def get_loader_for_file(file_path: str, native: bool = True):
+    """
+    Get the appropriate document loader based on file extension.
+    Args:
+        native: Use the built-in streaming loaders for txt/csv/xlsx/md instead of unstructured.
+    """
+    file_extension = Path(file_path).suffix.lower()
+    # TODO: 效果优化和支持更多类型
+    # 加载器按扩展名在用到时才导入，unstructured 等依赖很重，不拖慢服务启动
+    if native and file_extension in NATIVE_LOADERS:
+        from utils import native_loaders
+        return getattr(native_loaders, NATIVE_LOADERS[file_extension])(file_path)
+    if file_extension == '.txt':
+        from langchain_community.document_loaders import TextLoader
+        return TextLoader(file_path, encoding = 'UTF-8')
+    elif file_extension == '.pdf':
+        # 与解析进程池按页解析使用同一个加载器，切换 parsing.enabled 不会改变分块
+        from utils.native_loaders import PDFPageLoader
+        return PDFPageLoader(file_path)
+    elif file_extension == '.docx':
+        from langchain_community.document_loaders import UnstructuredWordDocumentLoader
+        return UnstructuredWordDocumentLoader(file_path)
+    elif file_extension == '.md':
+        from langchain_community.document_loaders import UnstructuredMarkdownLoader
+        return UnstructuredMarkdownLoader(file_path)
+    elif file_extension == '.xlsx':
+        from langchain_community.document_loaders import UnstructuredExcelLoader
+        return UnstructuredExcelLoader(file_path)
+    elif file_extension == '.csv':
+        from langchain_community.document_loaders import UnstructuredCSVLoader
+        return UnstructuredCSVLoader(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+
+def load_document(file_path: str, native: bool = True) -> List[Document]:
+    """Load a whole document, `source` is set to the file name"""
+    loader = get_loader_for_file(file_path, native)
+    logging.debug(f"Loading document from {file_path} using {loader.__class__.__name__} loader")
+    documents = loader.load()
+
+    # Extract metadata from file
+    file_name = Path(file_path).name
+    for doc in documents:
+        doc.metadata['source'] = file_name
+    return documents
+
+
+def count_pdf_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(file_path).pages)
+
+
+def load_pdf_pages(file_path: str, start: int, stop: int) -> List[Document]:
+    """Load pages [start, stop) of a PDF, one document per page like the in-process loader"""
+    from utils.native_loaders import PDFPageLoader
+
+    return PDFPageLoader(file_path, start, stop).load()
+
 
 class DocumentProcessor:
-    def __init__(self, chunk_size: int, chunk_overlap: int):
+    """
+    Args:
+        structured: `structured_chunking` section of rag.yaml, records (table rows, JSON objects) are chunked
+                    by `StructuredChunker` instead of the text splitter. None or `enabled: false` splits them as text.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, native_loaders: bool = True, structured: Optional[Dict[str, Any]] = None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.native_loaders = native_loaders
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+        self.structured_chunker = None
+        if structured and structured.get('enabled', True):
+            self.structured_chunker = StructuredChunker(
+                mode=structured.get('mode', 'record'),
+                pack_max_tokens=structured.get('pack_max_tokens', 256),
+                max_record_tokens=structured.get('max_record_tokens', 2048),
+                fallback=self.text_splitter.split_documents,
+            )
 
     def get_loader_for_file(self, file_path: str):
         """Get the appropriate document loader based on file extension"""
-        file_extension = Path(file_path).suffix.lower()
-        # TODO: 效果优化和支持更多类型
-        if file_extension == '.txt':
-            return TextLoader(file_path, encoding = 'UTF-8')
-        elif file_extension == '.pdf':
-            return PyPDFLoader(file_path)
-        elif file_extension == '.docx':
-            return UnstructuredWordDocumentLoader(file_path)
-        elif file_extension == '.md':
-            return UnstructuredMarkdownLoader(file_path)
-        elif file_extension == '.xlsx':
-            return UnstructuredExcelLoader(file_path)
-        elif file_extension == '.csv':
-            return UnstructuredCSVLoader(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+        return get_loader_for_file(file_path, self.native_loaders)
 
+    @traced("document.load")
     def load_document(self, file_path: str) -> List[Document]:
         """Load a document using the appropriate loader"""
+        return load_document(file_path, self.native_loaders)
+
+    def lazy_load_document(self, file_path: str) -> Iterator[Document]:
+        """Lazily load a document, yielding pages/rows as the loader produces them"""
         loader = self.get_loader_for_file(file_path)
-        logging.debug(f"Loading document from {file_path} using {loader.__class__.__name__} loader")
-        documents = loader.load()
-        
-        # Extract metadata from file
+        logging.debug(f"Lazily loading document from {file_path} using {loader.__class__.__name__} loader")
         file_name = Path(file_path).name
-        for doc in documents:
+        for doc in loader.lazy_load():
             doc.metadata['source'] = file_name
-        return documents
+            yield doc
+
+    def iter_chunks(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Lazily split a stream of documents, consecutive records go through the structured chunker"""
+        use_records = self.structured_chunker is not None
+        for records, group in groupby(documents, key=lambda doc: use_records and is_record(doc)):
+            if records:
+                yield from self.structured_chunker.split(group)
+            else:
+                for document in group:
+                    yield from self.text_splitter.split_documents([document])
 
+    @traced("document.chunk")
     def chunk_documents(self, documents: List[Document]) -> List[Document]:
         """Split documents into chunks for better embedding and retrieval"""
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap
-        )
-        return text_splitter.split_documents(documents)
+        return list(self.iter_chunks(documents))
 
     def is_supported_file_type(self, file_path: str, supported_extensions: List[str]) -> bool:
         """Check if the file type is supported"""
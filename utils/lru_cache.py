@@ -0,0 +1,97 @@
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar('V')
+
+
+class LRUCache(Generic[V]):
+    """
+    A thread-safe LRU cache with an optional time-to-live.
+    Usage:
+        cache = LRUCache(max_size=1000, ttl=3600)
+        cache.set("key", value)
+        cache.get("key")
+    Args:
+        max_size: Maximum number of entries, the least recently used entry is evicted first.
+                  None means unbounded.
+        ttl: Seconds an entry stays valid, None means entries never expire.
+        refresh_ttl_on_get: Restart the ttl of an entry every time it is read (idle timeout).
+        on_evict: Optional callback(key, value) invoked when an entry is evicted or expires.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = 1024,
+        ttl: Optional[float] = None,
+        refresh_ttl_on_get: bool = False,
+        on_evict: Optional[Callable[[Hashable, V], None]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh_ttl_on_get = refresh_ttl_on_get
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple[V, Optional[float]]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expires_at(self) -> Optional[float]:
+        return time.monotonic() + self.ttl if self.ttl else None
+
+    def _evict(self, key: Hashable) -> None:
+        value, _ = self._data.pop(key)
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def _get_entry(self, key: Hashable):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self._evict(key)
+            return None
+        self._data.move_to_end(key)
+        if self.refresh_ttl_on_get:
+            self._data[key] = (value, self._expires_at())
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        with self._lock:
+            entry = self._get_entry(key)
+            return entry[0] if entry is not None else default
+
+    def set(self, key: Hashable, value: V) -> None:
+        with self._lock:
+            self._data[key] = (value, self._expires_at())
+            self._data.move_to_end(key)
+            while self.max_size is not None and len(self._data) > self.max_size:
+                self._evict(next(iter(self._data)))
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], V]) -> V:
+        """Return the cached value, creating and storing it atomically if missing"""
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is not None:
+                return entry[0]
+            value = factory()
+            self.set(key, value)
+            return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[0] if entry is not None else default
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._get_entry(key) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,313 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+# 默认桶覆盖从毫秒级的本地检索到几十秒的大模型生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Exposition lines of every label set"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative bucket histogram per label set"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label 值 -> (每个桶的计数（不累计）, 总和, 总数)
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metric registry rendered in the Prometheus text exposition format.
+    Usage:
+        requests = REGISTRY.counter("http_requests_total", "Requests served", ["route"])
+        requests.inc(route="/chat-assistant")
+        REGISTRY.render()
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_cls(name, *args, **kwargs)
+            elif not isinstance(metric, metric_cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_DURATION = REGISTRY.histogram(
+    "span_duration_seconds",
+    "Duration of instrumented operations (retrieval, verification, loading, database writes)",
+    ["span"],
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response headers are sent",
+    ["method", "route", "status"],
+)
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending the prompt to the first streamed chunk",
+    ["model"],
+)
+LLM_GENERATION_DURATION = REGISTRY.histogram(
+    "llm_generation_duration_seconds",
+    "Total time of a model response, from prompt to last chunk",
+    ["model"],
+)
+LLM_OUTPUT_TOKENS = REGISTRY.counter(
+    "llm_output_tokens_total",
+    "Generated tokens per model, divide its rate by llm_generation_duration_seconds_sum for throughput",
+    ["model"],
+)
+
+# 当前请求内记录的 (span 名, 耗时)，用于慢请求日志
+_current_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def start_trace() -> Iterator[List[Tuple[str, float]]]:
+    """Collect the spans of the current request (or task) into a list"""
+    spans: List[Tuple[str, float]] = []
+    token = _current_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+
+
+def _record_span(name: str, duration: float) -> None:
+    SPAN_DURATION.observe(duration, span=name)
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append((name, duration))
+    logging.debug(f"span {name} took {duration * 1000:.1f}ms")
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block and record it as a span"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_span(name, time.perf_counter() - started)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator recording every call of a sync or async function as a span"""
+    def decorator(func: F) -> F:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Bind `func` to the current context, for work handed to a thread pool.
+    Pool threads do not inherit contextvars, without this the spans recorded by `func` miss the request trace.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # 每次调用使用一份副本，同一个 Context 不能在多个线程中同时进入；span 列表仍是同一个对象
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def run_in_executor(executor: Optional[Executor], func: Callable[..., Any], *args: Any) -> "asyncio.Future":
+    """`loop.run_in_executor` that keeps the current trace"""
+    return asyncio.get_running_loop().run_in_executor(executor, bind_context(func), *args)
+
+
+def format_trace(spans: Sequence[Tuple[str, float]]) -> str:
+    return ", ".join(f"{name}={duration * 1000:.1f}ms" for name, duration in spans)
+
+
+class _StreamTimer:
+    """Shared bookkeeping of `instrument_stream` / `ainstrument_stream`"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.chunks = 0
+        self.usage_tokens: Optional[int] = None
+
+    def on_chunk(self, chunk: Any) -> None:
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+            LLM_TIME_TO_FIRST_TOKEN.observe(self.first_chunk_at - self.started, model=self.model)
+            _record_span("llm.time_to_first_token", self.first_chunk_at - self.started)
+        if getattr(chunk, "content", None):
+            self.chunks += 1
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage and usage.get("output_tokens"):
+            self.usage_tokens = usage["output_tokens"]
+
+    def finish(self) -> None:
+        duration = time.perf_counter() - self.started
+        LLM_GENERATION_DURATION.observe(duration, model=self.model)
+        _record_span("llm.generation", duration)
+        # 供应商返回了用量时以用量为准，否则按流式片段数近似（一个片段约一个 token）
+        LLM_OUTPUT_TOKENS.inc(self.usage_tokens if self.usage_tokens is not None else self.chunks, model=self.model)
+
+
+def instrument_stream(stream, model: str):
+    """Wrap a model response stream, recording time-to-first-token, total time and output tokens"""
+    timer = _StreamTimer(model)
+    try:
+        for chunk in stream:
+            timer.on_chunk(chunk)
+            yield chunk
+    finally:
+        timer.finish()
+
+
+async def ainstrument_stream(stream, model: str):
+    """Async version of `instrument_stream`"""
+    timer = _StreamTimer(model)
+    try:
+        async for chunk in stream:
+            timer.on_chunk(chunk)
+            yield chunk
+    finally:
+        timer.finish()
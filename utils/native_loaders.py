@@ -0,0 +1,215 @@
+import codecs
+import csv
+import re
+
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+from utils.structured_chunker import column_names, format_value, record_document
+
+# 依次尝试的文本编码，国内导出的 csv 常为 GBK
+DEFAULT_ENCODINGS = ("utf-8-sig", "gb18030")
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+
+def detect_encoding(file_path: str, encodings: Sequence[str] = DEFAULT_ENCODINGS, probe_size: int = 1024 * 1024) -> str:
+    """First encoding of `encodings` that decodes the beginning of the file"""
+    with open(file_path, "rb") as f:
+        head = f.read(probe_size)
+    for encoding in encodings:
+        try:
+            # 增量解码，探测块末尾被截断的多字节字符不算错误
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"Cannot decode {Path(file_path).name} with any of {', '.join(encodings)}")
+
+
+class TextFileLoader(BaseLoader):
+    """Whole text file as one document"""
+
+    def __init__(self, file_path: str, encodings: Sequence[str] = DEFAULT_ENCODINGS):
+        self.file_path = file_path
+        self.encodings = encodings
+
+    def lazy_load(self) -> Iterator[Document]:
+        with open(self.file_path, "r", encoding=detect_encoding(self.file_path, self.encodings)) as f:
+            yield Document(page_content=f.read(), metadata={"source": Path(self.file_path).name})
+
+
+class CSVRowLoader(BaseLoader):
+    """
+    One document per data row of a csv file, read with the csv module without loading the file.
+    The first row is the header, empty rows are skipped. Every row is a structured record: the content is
+    rendered as `header: value` lines and the values are kept in `metadata["fields"]`.
+    `row_number` is the 1-based line of the row.
+    """
+
+    def __init__(self, file_path: str, encodings: Sequence[str] = DEFAULT_ENCODINGS, delimiter: Optional[str] = None):
+        self.file_path = file_path
+        self.encodings = encodings
+        self.delimiter = delimiter
+
+    def _dialect(self, f) -> dict:
+        if self.delimiter:
+            return {"delimiter": self.delimiter}
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            return {"dialect": csv.Sniffer().sniff(sample, delimiters=",\t;|")}
+        except csv.Error:
+            return {}
+
+    def lazy_load(self) -> Iterator[Document]:
+        file_name = Path(self.file_path).name
+        with open(self.file_path, "r", encoding=detect_encoding(self.file_path, self.encodings), newline="") as f:
+            reader = csv.reader(f, **self._dialect(f))
+            header = next(reader, None)
+            if header is None:
+                return
+            names = column_names(header, len(header))
+            for row in reader:
+                values = [value.strip() for value in row]
+                if not any(values):
+                    continue
+                if len(values) > len(names):
+                    # 数据行比表头长时补齐列名
+                    names = column_names(header, len(values))
+                yield record_document(
+                    dict(zip(names, values + [""] * (len(names) - len(values)))),
+                    {"source": file_name, "row_number": reader.line_num},
+                )
+
+
+class XlsxRowLoader(BaseLoader):
+    """
+    One document per data row of every sheet, streamed by openpyxl in read-only mode.
+    The first row of a sheet is the header, empty rows are skipped. Rows are structured records like
+    those of `CSVRowLoader`. `row_number` is the 1-based sheet row.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        from openpyxl import load_workbook
+
+        file_name = Path(self.file_path).name
+        workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                rows = sheet.iter_rows(values_only=True)
+                # 第一行为表头
+                header = next(rows, None)
+                if header is None:
+                    continue
+                names = column_names(header, len(header))
+                for row_number, row in enumerate(rows, start=2):
+                    values = [format_value(value) for value in row]
+                    if not any(values):
+                        continue
+                    if len(values) > len(names):
+                        names = column_names(header, len(values))
+                    yield record_document(
+                        dict(zip(names, values + [""] * (len(names) - len(values)))),
+                        {"source": file_name, "sheet_name": sheet.title, "row_number": row_number},
+                    )
+        finally:
+            workbook.close()
+
+
+class PDFPageLoader(BaseLoader):
+    """
+    One document per page of a PDF in [start, stop), read with pypdf. Used both in process and by the parse
+    workers (one task per page range), so a file gets the same documents whichever path parses it.
+    Metadata: `source`, `total_pages`, 0-based `page` and `page_label`.
+    """
+
+    def __init__(self, file_path: str, start: int = 0, stop: Optional[int] = None):
+        self.file_path = file_path
+        self.start = start
+        self.stop = stop
+
+    def lazy_load(self) -> Iterator[Document]:
+        from pypdf import PdfReader
+
+        reader = PdfReader(self.file_path)
+        file_name = Path(self.file_path).name
+        total_pages = len(reader.pages)
+        stop = total_pages if self.stop is None else min(self.stop, total_pages)
+        for page_number in range(self.start, stop):
+            yield Document(
+                page_content=reader.pages[page_number].extract_text().strip(),
+                metadata={
+                    "source": file_name,
+                    "total_pages": total_pages,
+                    "page": page_number,
+                    "page_label": reader.page_labels[page_number],
+                },
+            )
+
+
+class MarkdownSectionLoader(BaseLoader):
+    """
+    One document per heading section of a markdown file, read line by line.
+    A section runs from an ATX heading (`#` to `######`) to the next heading, headings inside fenced
+    code blocks are ignored. Metadata carries the section title, the heading path ("A > B"),
+    the heading level (0 for text before the first heading) and the 1-based line of the heading.
+    """
+
+    def __init__(self, file_path: str, encodings: Sequence[str] = DEFAULT_ENCODINGS):
+        self.file_path = file_path
+        self.encodings = encodings
+
+    def lazy_load(self) -> Iterator[Document]:
+        file_name = Path(self.file_path).name
+        # 当前各级标题，headings[i] 为第 i+1 级
+        headings: List[Optional[str]] = [None] * 6
+        lines: List[str] = []
+        level, line_number = 0, 1
+        in_fence = None
+
+        def section() -> Optional[Document]:
+            content = "".join(lines).strip()
+            if not content:
+                return None
+            path = [title for title in headings[:level] if title] if level else []
+            return Document(
+                page_content=content,
+                metadata={
+                    "source": file_name,
+                    "section": path[-1] if path else "",
+                    "headers": " > ".join(path),
+                    "level": level,
+                    "line_number": line_number,
+                },
+            )
+
+        with open(self.file_path, "r", encoding=detect_encoding(self.file_path, self.encodings)) as f:
+            for number, line in enumerate(f, start=1):
+                fence = _FENCE.match(line)
+                if fence:
+                    if in_fence is None:
+                        in_fence = fence.group(1)
+                    elif fence.group(1) == in_fence:
+                        in_fence = None
+                heading = _HEADING.match(line) if in_fence is None else None
+                if heading:
+                    document = section()
+                    if document is not None:
+                        yield document
+                    level = len(heading.group(1))
+                    headings[level - 1] = heading.group(2)
+                    for deeper in range(level, 6):
+                        headings[deeper] = None
+                    lines, line_number = [], number
+                lines.append(line)
+        document = section()
+        if document is not None:
+            yield document
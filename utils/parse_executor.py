@@ -0,0 +1,277 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，无法限制子进程内存
+    resource = None
+
+# 父进程在任务超时之外多等待的秒数（从子进程开始执行任务算起），超过后认为子进程卡死并强制结束
+_HARD_TIMEOUT_GRACE = 10
+
+# 父进程等待结果时检查任务是否超时的间隔（秒）
+_POLL_INTERVAL = 1.0
+
+# 子进程中管道的写端，开始执行任务时报告 (task_id, 开始时间)
+_started_conn = None
+
+
+def _init_worker(memory_limit_mb: Optional[int], started_conn=None) -> None:
+    global _started_conn
+    _started_conn = started_conn
+    # 子进程不处理 Ctrl+C，由父进程负责关闭进程池
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        # 超出地址空间上限时解析抛出 MemoryError，不会拖垮整台机器
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("document parsing timed out")
+
+
+@contextmanager
+def _deadline(seconds: Optional[float]):
+    """Interrupt the task after `seconds` inside the worker, only where SIGALRM exists"""
+    if not seconds or not hasattr(signal, "setitimer"):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _run_task(task_id: int, func: Callable, timeout: Optional[float], *args):
+    if _started_conn is not None:
+        _started_conn.send((task_id, time.time()))
+    with _deadline(timeout):
+        return func(*args)
+
+
+def _load_document(file_path: str, native: bool) -> List[Document]:
+    from utils.document_loader import load_document
+
+    return load_document(file_path, native)
+
+
+def _count_pdf_pages(file_path: str) -> int:
+    from utils.document_loader import count_pdf_pages
+
+    return count_pdf_pages(file_path)
+
+
+def _load_pdf_pages(file_path: str, start: int, stop: int) -> List[Document]:
+    from utils.document_loader import load_pdf_pages
+
+    return load_pdf_pages(file_path, start, stop)
+
+
+class ParseExecutor:
+    """
+    Parses documents in a pool of worker processes, so CPU-bound loaders (unstructured, pypdf) neither
+    hold the GIL of the API process nor block its threads. Configured by the `parsing` section of rag.yaml.
+
+    Every task runs under a deadline of `timeout` seconds and in a process whose address space is capped
+    at `memory_limit_mb`. Workers report when they start a task, a task still running `timeout` plus a
+    grace period after its start (time spent queued does not count) ignored its deadline. Such a worker,
+    or one that dies (e.g. killed for memory), is replaced by recycling the whole pool, the tasks in flight
+    at that moment fail. PDFs are split into tasks of `pdf_pages_per_task` pages parsed in parallel, their
+    pages are yielded in order. The pool is started on first use with the `spawn` method, workers do not
+    inherit the threads and connections of the parent.
+    Args:
+        max_workers: Number of worker processes, None or 0 uses the CPU count.
+        timeout: Seconds allowed for one task (a whole file, or a group of PDF pages), None disables it.
+        memory_limit_mb: Address space limit of each worker, None or 0 disables it (always off on Windows).
+        pdf_pages_per_task: Pages of a PDF parsed by one task.
+        native_loaders: Use the built-in streaming loaders for txt/csv/xlsx/md instead of unstructured.
+    Usage:
+        executor = ParseExecutor(max_workers=4, timeout=300)
+        for document in executor.iter_documents("report.pdf"):
+            ...
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout: Optional[float] = 300,
+        memory_limit_mb: Optional[int] = 2048,
+        pdf_pages_per_task: int = 16,
+        native_loaders: bool = True,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.pdf_pages_per_task = max(1, pdf_pages_per_task)
+        self.native_loaders = native_loaders
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._task_ids = itertools.count()
+        # 已提交、还没取结果的任务，task_id -> 子进程开始执行的时间（尚在排队时为 None）
+        self._started_at: Dict[int, Optional[float]] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context("spawn")
+                # 每个进程池一条管道，被强制结束的子进程可能写了一半；报告很短，多个子进程的写入不会交错
+                reader, writer = context.Pipe(duplex=False)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb, writer),
+                )
+                # 子进程按需启动，写端要保留到进程池关闭
+                self._pool.started_pipe = (reader, writer)
+            return self._pool
+
+    def _recycle_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Kill the workers of a stuck or broken pool, the next task starts a new one"""
+        with self._lock:
+            if self._pool is not pool:
+                # 其他线程已经换过进程池
+                return
+            self._pool = None
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._close_pipe(pool)
+        logging.warning("Document parser pool recycled")
+
+    def _submit(self, func: Callable, *args) -> Future:
+        task_id = next(self._task_ids)
+        # 先登记再提交，子进程报告的开始时间不会因为登记晚了被丢弃
+        with self._lock:
+            self._started_at[task_id] = None
+        pool = self._get_pool()
+        try:
+            try:
+                future = pool.submit(_run_task, task_id, func, self.timeout, *args)
+            except BrokenProcessPool:
+                self._recycle_pool(pool)
+                pool = self._get_pool()
+                future = pool.submit(_run_task, task_id, func, self.timeout, *args)
+        except BaseException:
+            with self._lock:
+                self._started_at.pop(task_id, None)
+            raise
+        future.pool = pool
+        future.task_id = task_id
+        return future
+
+    @staticmethod
+    def _close_pipe(pool: ProcessPoolExecutor) -> None:
+        for conn in pool.started_pipe:
+            conn.close()
+
+    def _drain_started(self, pool: ProcessPoolExecutor) -> None:
+        """Read the start reports of the workers, must hold `_lock`"""
+        reader, _ = pool.started_pipe
+        try:
+            while reader.poll():
+                task_id, started_at = reader.recv()
+                # 已经取走结果的任务不再记录
+                if task_id in self._started_at:
+                    self._started_at[task_id] = started_at
+        except (EOFError, OSError):
+            # 进程池已回收时管道已关闭
+            pass
+
+    def _task_started_at(self, future: Future) -> Optional[float]:
+        """Time the worker started the task, None while it is still queued"""
+        with self._lock:
+            self._drain_started(future.pool)
+            return self._started_at.get(future.task_id)
+
+    def _forget(self, future: Future) -> None:
+        with self._lock:
+            # 每取一次结果都读空管道，很快完成的任务的报告不会堆积
+            self._drain_started(future.pool)
+            self._started_at.pop(future.task_id, None)
+
+    def _wait(self, future: Future, file_path: str):
+        """Result of the task, the hard timeout counts from the moment a worker started it"""
+        if not self.timeout:
+            return future.result()
+        hard_timeout = self.timeout + _HARD_TIMEOUT_GRACE
+        while True:
+            try:
+                return future.result(timeout=_POLL_INTERVAL)
+            except FutureTimeoutError:
+                started_at = self._task_started_at(future)
+                if started_at is not None and time.time() - started_at > hard_timeout:
+                    self._recycle_pool(future.pool)
+                    raise TimeoutError(f"Parsing {Path(file_path).name} did not finish within {hard_timeout}s")
+
+    def _result(self, future: Future, file_path: str):
+        try:
+            return self._wait(future, file_path)
+        except BrokenProcessPool:
+            self._recycle_pool(future.pool)
+            raise RuntimeError(f"Parser process died while parsing {Path(file_path).name}, e.g. out of memory")
+        except MemoryError:
+            raise MemoryError(f"Parsing {Path(file_path).name} exceeded the {self.memory_limit_mb}MB memory limit")
+        finally:
+            self._forget(future)
+
+    def load_document(self, file_path: str) -> List[Document]:
+        """Parse a whole document in a worker process"""
+        return list(self.iter_documents(file_path))
+
+    def iter_documents(self, file_path: str) -> Iterator[Document]:
+        """
+        Parse a document in worker processes, PDFs page-parallel. At most `max_workers * 2` PDF tasks
+        are in flight, so a slow consumer applies backpressure instead of buffering every page.
+        """
+        if Path(file_path).suffix.lower() != ".pdf":
+            yield from self._result(self._submit(_load_document, file_path, self.native_loaders), file_path)
+            return
+
+        total_pages = self._result(self._submit(_count_pdf_pages, file_path), file_path)
+        ranges = deque(
+            (start, min(start + self.pdf_pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pdf_pages_per_task)
+        )
+        pending: "deque[Future]" = deque()
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < self.max_workers * 2:
+                    start, stop = ranges.popleft()
+                    pending.append(self._submit(_load_pdf_pages, file_path, start, stop))
+                yield from self._result(pending.popleft(), file_path)
+        finally:
+            # 调用方中途停止或出错时取消尚未开始的任务
+            for future in pending:
+                future.cancel()
+                self._forget(future)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._started_at.clear()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._close_pipe(pool)
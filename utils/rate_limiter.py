@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter usable from sync and async code.
+    Usage:
+        bucket = TokenBucket(rate=5, capacity=10)
+        bucket.acquire()          # 阻塞直到拿到令牌
+        await bucket.aacquire()   # 异步等待
+        bucket.try_acquire()      # 不等待，拿不到返回 False
+    Args:
+        rate: Tokens added per second.
+        capacity: Maximum burst size, defaults to `rate` (at least 1).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Take the tokens, returns how many seconds the caller has to wait before using them.
+        When that would exceed `max_wait` nothing is taken and None is returned.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            wait = (tokens - self._tokens) / self.rate if self._tokens < tokens else 0.0
+            if max_wait is not None and wait > max_wait:
+                return None
+            # 令牌不足时记为负数，调用方等待补足的时间，保证先到先得
+            self._tokens -= tokens
+            return wait
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: float = 1) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,149 @@
+import json
+import logging
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from utils.lru_cache import LRUCache
+from utils.time_utils import utcnow
+
+
+class BaseSharedState(ABC):
+    """
+    Pluggable key-value store for state that every worker process must see,
+    values are JSON-serializable.
+    """
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Any:
+        """Value of the key, `default` when missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, `ttl` seconds after which it expires (None never expires)"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the key if present"""
+
+
+class InMemorySharedState(BaseSharedState):
+    """
+    Process-local shared state, only correct with a single worker process.
+    Args:
+        max_entries: Maximum number of keys kept, the least recently used key is evicted first.
+    """
+
+    def __init__(self, max_entries: Optional[int] = 10000):
+        self._entries: LRUCache[tuple] = LRUCache(max_size=max_entries)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self._entries.pop(key)
+            return default
+        # 与 SQL 后端一致，返回反序列化后的副本
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries.set(key, (json.dumps(value, ensure_ascii=False), expires_at))
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key)
+
+
+class SQLSharedState(BaseSharedState):
+    """
+    Shared state stored in the `shared_state` table of the application database, visible to all workers.
+    Args:
+        cleanup_interval: Minimum seconds between two purges of expired keys.
+        session_factory: SQLAlchemy session factory, defaults to `config.database.SessionLocal`.
+    """
+
+    def __init__(self, cleanup_interval: float = 300, session_factory: Optional[Callable] = None):
+        if session_factory is None:
+            from config.database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = time.monotonic()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        from models.shared_state import SharedStateEntry
+
+        with self.session_factory() as db:
+            entry = db.get(SharedStateEntry, key)
+            if entry is None or (entry.expires_at is not None and entry.expires_at < utcnow()):
+                return default
+            return json.loads(entry.value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        from models.shared_state import SharedStateEntry
+
+        self._maybe_evict_expired()
+        expires_at = utcnow() + timedelta(seconds=ttl) if ttl else None
+        with self.session_factory() as db:
+            # merge 按主键插入或更新
+            db.merge(SharedStateEntry(key=key, value=json.dumps(value, ensure_ascii=False), expires_at=expires_at))
+            db.commit()
+
+    def delete(self, key: str) -> None:
+        from models.shared_state import SharedStateEntry
+
+        with self.session_factory() as db:
+            db.query(SharedStateEntry).filter(SharedStateEntry.key == key).delete(synchronize_session=False)
+            db.commit()
+
+    def evict_expired(self) -> int:
+        """Delete every expired key, returns the number removed"""
+        from models.shared_state import SharedStateEntry
+
+        with self.session_factory() as db:
+            removed = db.query(SharedStateEntry).filter(SharedStateEntry.expires_at < utcnow()).delete(synchronize_session=False)
+            db.commit()
+        return removed
+
+    def _maybe_evict_expired(self) -> None:
+        now = time.monotonic()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        try:
+            removed = self.evict_expired()
+            if removed:
+                logging.info(f"Evicted {removed} expired shared state keys")
+        except Exception as e:
+            print(f"Error evicting expired shared state: {str(e)}")
+
+
+def create_shared_state(config: Optional[Dict[str, Any]] = None) -> BaseSharedState:
+    """Build the shared state selected by the `shared_state` section of app.yaml"""
+    config = config or {}
+    backend = config.get("backend", "memory")
+    if backend == "memory":
+        return InMemorySharedState(max_entries=config.get("max_entries", 10000))
+    if backend == "sql":
+        return SQLSharedState(cleanup_interval=config.get("cleanup_interval", 300))
+    raise ValueError(f"Unsupported shared state backend: {backend}")
+
+
+_shared_state: Optional[BaseSharedState] = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state() -> BaseSharedState:
+    """Process-wide shared state instance, created on first use"""
+    global _shared_state
+    if _shared_state is None:
+        with _shared_state_lock:
+            if _shared_state is None:
+                from config.config_manager import ConfigManager
+                _shared_state = create_shared_state(ConfigManager().get_app_config('shared_state'))
+    return _shared_state
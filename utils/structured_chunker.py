@@ -0,0 +1,131 @@
+import json
+import math
+import re
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+# 结构化记录（表格行、JSON 对象）的列值保存在该元数据键下，{列名: 值}
+FIELDS_KEY = "fields"
+
+_CJK = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: one per CJK character, one per four other characters"""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def column_names(header: Sequence[Any], width: int) -> List[str]:
+    """Column names of a header row, blank headers become "列N" and duplicates get a suffix"""
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for i in range(width):
+        name = str(header[i]).strip() if i < len(header) and header[i] is not None else ""
+        name = name or f"列{i + 1}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 1
+        names.append(name)
+    return names
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        # Excel 中的整数读出来是浮点数
+        return str(int(value))
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value).strip()
+
+
+def render_record(fields: Dict[str, str]) -> str:
+    """`header: value` lines of the non-empty columns"""
+    return "\n".join(f"{name}: {value}" for name, value in fields.items() if value != "")
+
+
+def record_document(fields: Dict[str, str], metadata: Dict[str, Any]) -> Document:
+    """Document of one structured record, the column values are kept as metadata under `fields`"""
+    return Document(page_content=render_record(fields), metadata={**metadata, FIELDS_KEY: fields})
+
+
+def is_record(document: Document) -> bool:
+    return isinstance(document.metadata.get(FIELDS_KEY), dict)
+
+
+class StructuredChunker:
+    """
+    Chunks structured records (rows of csv/xlsx, JSON objects) without cutting them apart.
+
+    In "record" mode every record is one chunk, so retrieval returns whole people instead of fragments.
+    In "pack" mode consecutive records of the same source and sheet are packed into one chunk while the
+    estimated tokens stay within `pack_max_tokens`, for tables of short rows where one vector per row
+    is wasteful. Every chunk of pack mode, a pack of a single record or a piece of an oversized one
+    included, has the same metadata keys: the row range `row_start`/`row_end` (0 for records without row
+    numbers) and the number of `records` instead of the per-record `fields` and `row_number`. Milvus
+    derives the collection columns from the first chunk, so the keys must not vary from chunk to chunk.
+    A record longer than `max_record_tokens` is handed to `fallback` (the regular text splitter).
+    Args:
+        mode: "record" or "pack".
+        pack_max_tokens: Token budget of a packed chunk.
+        max_record_tokens: Records above this size are split by `fallback`.
+        fallback: Splits a list of documents, used for oversized records.
+    """
+
+    def __init__(
+        self,
+        mode: str = "record",
+        pack_max_tokens: int = 256,
+        max_record_tokens: int = 2048,
+        fallback: Optional[Callable[[List[Document]], List[Document]]] = None,
+    ):
+        if mode not in ("record", "pack"):
+            raise ValueError(f"Unsupported structured chunking mode: {mode}")
+        self.mode = mode
+        self.pack_max_tokens = pack_max_tokens
+        self.max_record_tokens = max_record_tokens
+        self.fallback = fallback
+
+    @staticmethod
+    def _group(document: Document) -> tuple:
+        return document.metadata.get("source"), document.metadata.get("sheet_name")
+
+    @staticmethod
+    def _pack(records: List[Document]) -> Document:
+        metadata = {key: value for key, value in records[0].metadata.items() if key not in (FIELDS_KEY, "row_number")}
+        rows = [record.metadata["row_number"] for record in records if "row_number" in record.metadata]
+        metadata["row_start"] = min(rows) if rows else 0
+        metadata["row_end"] = max(rows) if rows else 0
+        metadata["records"] = len(records)
+        return Document(page_content="\n\n".join(record.page_content for record in records), metadata=metadata)
+
+    def split(self, records: Iterable[Document]) -> Iterator[Document]:
+        """Chunks of a stream of record documents"""
+        pending: List[Document] = []
+        pending_tokens = 0
+        for record in records:
+            tokens = estimate_tokens(record.page_content)
+            if tokens > self.max_record_tokens and self.fallback is not None:
+                if pending:
+                    yield self._pack(pending)
+                    pending, pending_tokens = [], 0
+                # 打包模式下超长记录的片段也使用打包的元数据键
+                yield from self.fallback([record if self.mode == "record" else self._pack([record])])
+                continue
+            if self.mode == "record":
+                yield record
+                continue
+            # 记录之间的空行也计入预算
+            if pending and (pending_tokens + tokens + 1 > self.pack_max_tokens or self._group(pending[0]) != self._group(record)):
+                yield self._pack(pending)
+                pending, pending_tokens = [], 0
+            pending.append(record)
+            pending_tokens += tokens + (1 if len(pending) > 1 else 0)
+        if pending:
+            yield self._pack(pending)
@@ -0,0 +1,14 @@
+from datetime import datetime, timezone
+
+
+def utcnow() -> datetime:
+    """Current UTC time without tzinfo, the form all datetimes are stored in the database"""
+    # 数据库中统一存储不带时区的UTC时间，避免 MySQL/SQLite 时区处理不一致
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def as_naive_utc(value: datetime) -> datetime:
+    """Convert an aware datetime to naive UTC before comparing it with stored values, naive input is returned as is"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
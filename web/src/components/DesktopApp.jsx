@@ -218,10 +218,20 @@ function DesktopApp() {
       };
       setMessages(prev => [...prev, aiMessage]);
 
-      // 调用askChatAssistant API获取人员数据
-      const result = await apiService.askChatAssistant(
-        [currentInput], 
-        sessionId
+      // 调用流式API获取人员数据，每解析出一个人员就追加到卡片区域，不必等待完整回复
+      const result = await apiService.askChatAssistantStream(
+        [currentInput],
+        sessionId,
+        {
+          onPerson: (person) => {
+            setMessages(prev => prev.map(msg =>
+              msg.id === aiMessageId
+                ? { ...msg, peopleData: [...(msg.peopleData || []), person] }
+                : msg
+            ));
+            setShowPersonCards(true);
+          }
+        }
       );
 
       console.log('API返回结果:', result);
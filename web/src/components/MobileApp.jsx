@@ -64,12 +64,13 @@ const MobileApp = () => {
   }, [messages]);
 
   // 调用真实API
-  const callRealAPI = useCallback(async (userMessage) => {
+  const callRealAPI = useCallback(async (userMessage, onPerson = null) => {
     try {
-      // 调用真实的后端API
-      const response = await apiService.askChatAssistant(
-        [userMessage], 
-        sessionId
+      // 调用流式后端API，每解析出一个人员就回调 onPerson
+      const response = await apiService.askChatAssistantStream(
+        [userMessage],
+        sessionId,
+        { onPerson }
       );
       
       console.log('API返回结果:', response);
@@ -142,7 +143,15 @@ const MobileApp = () => {
       };
       setMessages(prev => [...prev, aiMessage]);
       
-      const response = await callRealAPI(currentInput);
+      const response = await callRealAPI(currentInput, (person) => {
+        // 人员卡片随解析结果逐个出现
+        setMessages(prev => prev.map(msg =>
+          msg.id === aiMessageId
+            ? { ...msg, peopleData: [...(msg.peopleData || []), person] }
+            : msg
+        ));
+        setShowPersonCards(true);
+      });
       
       if (response.peopleData && response.peopleData.length > 0) {
         // 更新消息显示结果
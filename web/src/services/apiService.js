@@ -164,5 +164,75 @@ export const apiService = {
       console.error('聊天助手API调用失败:', error);
       throw error;
     }
+  },
+
+  // 调用聊天助手流式API，每解析出一个人员对象就回调 onPerson
+  askChatAssistantStream: async (message, sessionId = null, { onToken = null, onPerson = null } = {}) => {
+    try {
+      const uuid = sessionId || crypto.randomUUID();
+      const messages = Array.isArray(message) ? message : [message];
+
+      const response = await fetch(`${API_BASE_URL}${CHAT_ENDPOINT}/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+          session_id: uuid,
+          messages: messages
+        })
+      });
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        console.error('API响应错误:', response.status, errorText);
+        throw new Error(`HTTP error! status: ${response.status}, details: ${errorText}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let result = { data: [] };
+
+      try {
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+
+          buffer += decoder.decode(value, { stream: true });
+          // SSE 事件之间以空行分隔
+          const events = buffer.split('\n\n');
+          buffer = events.pop();
+
+          for (const rawEvent of events) {
+            let event = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+              if (line.startsWith('event: ')) event = line.slice(7).trim();
+              else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (!data) continue;
+
+            const payload = JSON.parse(data);
+            if (event === 'token' && onToken) {
+              onToken(payload.content);
+            } else if (event === 'person' && onPerson) {
+              onPerson(payload);
+            } else if (event === 'done') {
+              result = payload;
+            } else if (event === 'error') {
+              throw new Error(payload.detail);
+            }
+          }
+        }
+      } finally {
+        reader.releaseLock();
+      }
+
+      return result;
+    } catch (error) {
+      console.error('聊天助手流式API调用失败:', error);
+      throw error;
+    }
   }
 };
\ No newline at end of file